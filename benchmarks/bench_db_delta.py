@@ -0,0 +1,86 @@
+"""
+Rows stored, database size and write time of storing every parameter
+of each export against storing only the parameters that changed.
+
+Each run writes the same series of exports to a fresh database file,
+as a console session would: one Database held open for all writes.
+Between exports a small fraction of the parameters change, and the
+rest are repeated with noise below DB_MIN_DIFF.
+
+Usage: python benchmarks/bench_db_delta.py [num_parameters] [num_exports]
+"""
+
+import datetime
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from bench_json_reader import ROOT
+
+os.chdir(ROOT)  # xl_populate_named_ranges logs to xl_pnr.log here
+sys.path.append(os.path.join(ROOT, "datum"))
+
+import xl_populate_named_ranges as xlpnr  # noqa: E402
+
+CHANGED_FRACTION = 0.02  # fraction of parameters changed by each export
+
+
+def exports(num_parameters: int, num_exports: int) -> list:
+    """(parameters, metadata) of each export of a part."""
+    random.seed(0)
+    values = [index * 1.5 + 1.0 for index in range(num_parameters)]
+    start = datetime.datetime(2022, 5, 1)
+    series = []
+    for export in range(num_exports):
+        for index in random.sample(
+            range(num_parameters), int(num_parameters * CHANGED_FRACTION)
+        ):
+            values[index] *= 1.01
+        noise = 1 + xlpnr.DB_MIN_DIFF / 10
+        parameters = {
+            f"MEASUREMENT_{index}.mass": value * random.uniform(1, noise)
+            for index, value in enumerate(values)
+        }
+        metadata = {
+            "part_name": "HOUSING",
+            "part_rev": str(export),
+            "retrieval_ts": str(start + datetime.timedelta(hours=export)),
+        }
+        series.append((parameters, metadata))
+    return series
+
+
+def main(num_parameters: int, num_exports: int) -> None:
+    logging.disable(logging.WARNING)
+    series = exports(num_parameters, num_exports)
+    print(f"{num_parameters} parameters, {num_exports} exports")
+    print(f"{'STORAGE':<16}{'ROWS':>10}{'KIB':>10}{'SECONDS':>10}")
+    for label, changes_only in [("every value", False), ("changes only", True)]:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with xlpnr.open_database(os.path.join(temp_dir, "datum.db")) as database:
+                start: float = time.perf_counter()
+                for parameters, metadata in series:
+                    xlpnr.write_database_parameters(
+                        parameters,
+                        metadata,
+                        database=database,
+                        changes_only=changes_only,
+                    )
+                seconds: float = time.perf_counter() - start
+                connection = database.connection
+                connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                (rows,) = connection.execute(
+                    "SELECT COUNT(*) FROM parameters"
+                ).fetchone()
+            kib: float = os.path.getsize(os.path.join(temp_dir, "datum.db")) / 1024
+            print(f"{label:<16}{rows:>10}{kib:>10.0f}{seconds:>10.3f}")
+
+
+if __name__ == "__main__":
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 50,
+    )
@@ -0,0 +1,135 @@
+"""
+Rows per second of writing measurement parameters to SQLite.
+
+Compares the previous write_database_parameters, which ran one
+execute per parameter with default journaling, against the current
+executemany in one transaction on a WAL connection, both for one
+large write and for the same parameters written by 100 updates. The
+shared session writer keeps one Database open for all updates
+rather than connecting for each, and the background writer queues
+them for its thread, as a console session does. WAIT is the time the
+caller spent in the writes, SECONDS the time until all were committed.
+Each run inserts into a fresh database file, and one in twenty
+parameters is a list to exercise the str() encoding of non-scalar
+values.
+
+Usage: python benchmarks/bench_db_insert.py [num_parameters]
+"""
+
+import datetime
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from bench_json_reader import ROOT
+
+os.chdir(ROOT)  # xl_populate_named_ranges logs to xl_pnr.log here
+sys.path.append(os.path.join(ROOT, "datum"))
+
+import xl_populate_named_ranges as xlpnr  # noqa: E402
+
+METADATA = {"retrieval_ts": "2022-05-08 09:27:57"}
+PARAMETER_TABLE = """--sql
+    CREATE TABLE IF NOT EXISTS parameters(
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        param_key TEXT,
+        param_value NUMERIC,
+        generation_time TIMESTAMP /* time measurement was made */
+    )
+"""
+
+
+def previous_write(parameter_dict: dict, metadata_dict: dict) -> None:
+    """write_database_parameters before the bulk insert path."""
+    db_connection = sqlite3.connect(
+        xlpnr.DATUM_DB, detect_types=sqlite3.PARSE_DECLTYPES
+    )
+    cur = db_connection.cursor()
+    cur.execute(PARAMETER_TABLE)
+    generation_time = datetime.datetime.fromisoformat(metadata_dict["retrieval_ts"])
+    for key, value in parameter_dict.items():
+        if not isinstance(value, (int, float, str, datetime.datetime)):
+            xlpnr.logger.warning(
+                f"Dict with type {type(value)} attempting to write to "
+                f"{xlpnr.DATUM_DB}. {value = }"
+            )
+            value = str(value)
+        insert_command = """--sql
+            INSERT INTO parameters (param_key, param_value, generation_time)
+            VALUES (?, ?, ?)
+            """
+        cur.execute(insert_command, [key, value, generation_time])
+    db_connection.commit()
+    db_connection.close()
+
+
+class SessionWriter:
+    """write_database_parameters to one Database held open between calls."""
+
+    def __init__(self) -> None:
+        self.database = xlpnr.open_database()
+
+    def __call__(self, parameter_dict: dict, metadata_dict: dict) -> None:
+        xlpnr.write_database_parameters(
+            parameter_dict, metadata_dict, database=self.database
+        )
+
+    def close(self) -> None:
+        self.database.close()
+
+
+class BackgroundWriter(SessionWriter):
+    """write_database_parameters queued on a DatabaseWriter."""
+
+    def __init__(self) -> None:
+        self.database = xlpnr.open_database_writer()
+
+
+def main(num_parameters: int) -> None:
+    logging.disable(logging.WARNING)  # time the database, not the log file
+    parameters = {
+        f"MEASUREMENT_{index}.mass": (
+            [index, index * 0.5, 1.0] if index % 20 == 0 else index * 1.5
+        )
+        for index in range(num_parameters)
+    }
+    keys = list(parameters)
+    updates = [
+        {key: parameters[key] for key in keys[first : first + num_parameters // 100]}
+        for first in range(0, num_parameters, num_parameters // 100)
+    ]
+    print(f"{num_parameters} parameters")
+    print(f"{'WRITER':<28}{'UPDATES':>8}{'WAIT':>10}{'SECONDS':>10}{'ROWS/S':>12}")
+    for label, make_writer in [
+        ("previous per-row execute", lambda: previous_write),
+        ("write_database_parameters", lambda: xlpnr.write_database_parameters),
+        ("shared session Database", SessionWriter),
+        ("background DatabaseWriter", BackgroundWriter),
+    ]:
+        for batches in [[parameters], updates]:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                xlpnr.DATUM_DB = os.path.join(temp_dir, "datum.db")
+                writer = make_writer()
+                start: float = time.perf_counter()
+                for batch in batches:
+                    writer(batch, METADATA)
+                wait: float = time.perf_counter() - start
+                if hasattr(writer, "close"):
+                    writer.close()
+                seconds: float = time.perf_counter() - start
+                with sqlite3.connect(xlpnr.DATUM_DB) as db_connection:
+                    (rows,) = db_connection.execute(
+                        "SELECT COUNT(*) FROM parameters"
+                    ).fetchone()
+                assert rows == num_parameters
+                print(
+                    f"{label:<28}{len(batches):>8}{wait:>10.3f}{seconds:>10.3f}"
+                    f"{num_parameters / seconds:>12.0f}"
+                )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,67 @@
+"""
+Time export_measurements of a part with num_features measurement
+features, in full and with a manifest naming two expressions of
+MANIFEST_FEATURES of them, as a workbook using a few measurements
+would, with the slow mock NXOpen of bench_nx_incremental.
+
+Usage: python benchmarks/bench_export_manifest.py [num_features]
+"""
+
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+from bench_json_reader import ROOT
+from bench_nx_incremental import CALL_SECONDS, measurement
+
+MANIFEST_FEATURES = 30
+
+
+def main(num_features: int) -> None:
+    NXOpen = type(sys)("NXOpen")
+    NXOpen.Session = namedtuple("Session", "MarkVisibility")(
+        namedtuple("MarkVisibility", "Visible")(None)
+    )
+    sys.modules["NXOpen"] = NXOpen
+    sys.path.append(ROOT)
+    os.getlogin = lambda: "bench"  # the journal runs in a Windows login session
+    import nx_journals.nx_get_measurements as nxgm
+
+    nxgm.nxprint = lambda *args: None
+    nxgm.spool_metadata = lambda _: None
+    nxgm.get_metadata = lambda _: {"METADATA": {}}
+    features = [
+        measurement(index, index, float(index)) for index in range(num_features)
+    ]
+    Work = namedtuple("Work", "Features WCS FullPath")
+    Origin = namedtuple("Origin", "X Y Z")(0.0, 0.0, 0.0)
+    work = Work(features, namedtuple("WCS", "Origin")(Origin), "PART/A")
+    session = namedtuple("Session", "Parts SetUndoMark UpdateManager")(
+        namedtuple("Parts", "Work")(work),
+        lambda *_: None,
+        namedtuple("UpdateManager", "DoInterpartUpdate")(lambda _: None),
+    )
+    step: int = max(1, num_features // MANIFEST_FEATURES)
+    manifest = {
+        f"MEASUREMENT_{index}": ["quantity_0", "quantity_2"]
+        for index in range(0, num_features, step)[:MANIFEST_FEATURES]
+    }
+    print(f"{num_features} features, {CALL_SECONDS * 1000:.2f} ms per NX read")
+    print(f"{'EXPORT':<28}{'SECONDS':>10}{'JSON KB':>10}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        export_file = os.path.join(temp_dir, "export.json")
+        for label, export_manifest in [
+            ("full", None),
+            (f"manifest, {len(manifest)} features", manifest),
+        ]:
+            start: float = time.perf_counter()
+            nxgm.export_measurements(export_file, session, manifest=export_manifest)
+            seconds: float = time.perf_counter() - start
+            size: float = os.path.getsize(export_file) / 1024
+            print(f"{label:<28}{seconds:>10.3f}{size:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,89 @@
+"""
+Time looking up every measurement of a part by name, by a linear scan
+of the part's features as find_feature_by_name did before, by a
+FeatureIndex getting every feature to check for changes on each
+lookup, and by the part's FeatureIndex, with mock features whose
+properties take CALL_SECONDS to read, and GetFeatures CALL_SECONDS
+per feature, standing in for the round trip into NX.
+
+Usage: python benchmarks/bench_feature_index.py [num_features]
+"""
+
+import os
+import sys
+import time
+from collections import namedtuple
+
+from bench_json_reader import ROOT
+
+sys.path.append(os.path.join(ROOT, "nx_journals"))
+
+from nxmods import FeatureIndex, feature_index  # noqa: E402
+
+CALL_SECONDS = 0.00005
+READS = 0
+GET_FEATURES = 0
+
+
+class Feature:
+    def __init__(self, index):
+        self._name = f"MEASUREMENT_{index}"
+        self.Tag = index
+        self.Timestamp = index
+        self.FeatureType = "MEASURE_BODY"
+
+    @property
+    def Name(self):
+        global READS
+        READS += 1
+        time.sleep(CALL_SECONDS)
+        return self._name
+
+
+class FeatureCollection(list):
+    def GetFeatures(self):
+        global GET_FEATURES
+        GET_FEATURES += 1
+        time.sleep(CALL_SECONDS * len(self))
+        return tuple(self)
+
+
+def find_checking_every_feature(index, feature_name):
+    index.rebuild()
+    return index.find(feature_name)
+
+
+def linear_scan(part, feature_name):
+    for feature in part.Features:
+        if feature.Name == feature_name:
+            return feature
+    return None
+
+
+def main(num_features: int) -> None:
+    global READS, GET_FEATURES
+    part = namedtuple("Part", "Tag Features")(
+        1, FeatureCollection(Feature(index) for index in range(num_features))
+    )
+    names = [f"MEASUREMENT_{index}" for index in range(num_features)]
+    print(f"{num_features} lookups, {CALL_SECONDS * 1000:.2f} ms per NX read")
+    print(f"{'LOOKUP':<20}{'NAME READS':>12}{'GETFEATURES':>12}{'SECONDS':>10}")
+    checked_index = FeatureIndex(part)
+    for label, find in [
+        ("linear scan", lambda name: linear_scan(part, name)),
+        (
+            "check every lookup",
+            lambda name: find_checking_every_feature(checked_index, name),
+        ),
+        ("FeatureIndex", lambda name: feature_index(part).find(name)),
+    ]:
+        READS = GET_FEATURES = 0
+        start: float = time.perf_counter()
+        for name in names:
+            assert find(name) is not None
+        seconds: float = time.perf_counter() - start
+        print(f"{label:<20}{READS:>12}{GET_FEATURES:>12}{seconds:>10.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
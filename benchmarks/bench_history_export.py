@@ -0,0 +1,88 @@
+"""
+Export a parameter history of num_rows rows to CSV and to the
+columnar format, timing the export and a full read of the columnar
+file and reporting the file sizes and peak Python memory, against
+fetchall of the same rows. Memory is traced, which slows every task.
+
+Usage: python benchmarks/bench_history_export.py [num_rows]
+"""
+
+import datetime
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+
+from bench_json_reader import ROOT
+
+sys.path.append(os.path.join(ROOT, "datum"))
+
+from database import migrate  # noqa: E402
+from history import parameter_history  # noqa: E402
+from history_export import export_history, iter_columnar  # noqa: E402
+
+NUM_KEYS = 200
+
+
+def populate(connection: sqlite3.Connection, num_rows: int) -> None:
+    migrate(connection)
+    start = datetime.datetime(2022, 1, 1)
+    with connection:
+        for export in range(num_rows // NUM_KEYS):
+            timestamp = (start + datetime.timedelta(hours=export)).isoformat(" ")
+            cursor = connection.execute(
+                "INSERT INTO source_history (part_name, part_rev, retrieval_ts) "
+                "VALUES ('HOUSING', ?, ?)",
+                [str(export // 100), timestamp],
+            )
+            connection.executemany(
+                "INSERT INTO parameters "
+                "(param_key, param_value, generation_time, source_id) "
+                "VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        f"HOUSING.key_{key}",
+                        export * 0.001 + key,
+                        timestamp,
+                        cursor.lastrowid,
+                    )
+                    for key in range(NUM_KEYS)
+                ],
+            )
+
+
+def measure(label: str, task: Callable[[], object], file: str = "") -> None:
+    tracemalloc.start()
+    start: float = time.perf_counter()
+    task()
+    seconds: float = time.perf_counter() - start
+    peak_kib: int = tracemalloc.get_traced_memory()[1] // 1024
+    tracemalloc.stop()
+    size_kib: str = f"{os.path.getsize(file) // 1024}" if file else "-"
+    print(f"{label:<20}{seconds:>10.2f}{size_kib:>12}{peak_kib:>12}")
+
+
+def main(num_rows: int) -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        connection = sqlite3.connect(os.path.join(temp_dir, "datum.db"))
+        populate(connection, num_rows)
+        csv_file = os.path.join(temp_dir, "history.csv")
+        columnar_file = os.path.join(temp_dir, "history.dhc")
+        print(f"{num_rows} rows")
+        print(f"{'TASK':<20}{'SECONDS':>10}{'FILE KIB':>12}{'PEAK KIB':>12}")
+        measure("fetchall", lambda: list(parameter_history(connection)))
+        measure("export csv", lambda: export_history(connection, csv_file), csv_file)
+        measure(
+            "export columnar",
+            lambda: export_history(connection, columnar_file),
+            columnar_file,
+        )
+        measure("read columnar", lambda: sum(1 for _ in iter_columnar(columnar_file)))
+        connection.close()
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
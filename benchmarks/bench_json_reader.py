@@ -0,0 +1,122 @@
+"""
+Peak memory of reading a large NX measurement export.
+
+Compares json.load of the whole file (the previous reader), the
+dict-returning get_json_key_value_pairs, and consuming the pairs
+from iter_json_key_value_pairs without keeping them. Each reader
+runs in a fresh process so its peak RSS is measured on its own.
+Where RSS isn't available (Windows), the peak of memory allocated
+by Python is reported instead, which slows the readers down.
+
+Usage: python benchmarks/bench_json_reader.py [num_measurements]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(os.path.join(ROOT, "datum"))
+
+READERS = ["json.load", "get_json_key_value_pairs", "iter_json_key_value_pairs"]
+
+
+def write_export(path: str, num_measurements: int) -> None:
+    """Write a synthetic export with the structure nx_get_measurements saves."""
+    with open(path, "w") as json_handle:
+        json_handle.write('{\n    "measurements": [\n')
+        for index in range(num_measurements):
+            measurement = {
+                "name": f"COMPONENT_{index}",
+                "expressions": [
+                    {"name": "mass", "type": "Number", "value": index * 1.5},
+                    {"name": "volume", "type": "Number", "value": index * 2.5},
+                    {
+                        "name": "center_of_mass",
+                        "type": "Point",
+                        "value": {"x": index + 0.1, "y": index + 0.2, "z": 0.3},
+                    },
+                    {
+                        "name": "moments_of_inertia",
+                        "type": "List",
+                        "value": [index * 10.0, index * 20.0, index * 30.0],
+                    },
+                ],
+            }
+            separator = ",\n" if index < num_measurements - 1 else "\n"
+            json_handle.write(json.dumps(measurement, indent=4) + separator)
+        json_handle.write('    ],\n    "METADATA": {"part_name": "BENCHMARK"}\n}\n')
+
+
+def peak_memory_mb() -> float:
+    """Peak memory of this process so far."""
+    if resource is None:
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == "darwin" else peak / 1024
+
+
+def run_reader(reader: str, path: str) -> None:
+    """Run one reader and print its timing and memory as JSON."""
+    import xl_populate_named_ranges as xlpnr
+
+    if resource is None:
+        tracemalloc.start()
+    baseline: float = peak_memory_mb()
+    start: float = time.perf_counter()
+    if reader == "json.load":
+        with open(path, "r") as json_handle:
+            data = json.load(json_handle)
+        count = len(
+            [
+                pair
+                for measurement in data["measurements"]
+                for pair in xlpnr.measurement_key_value_pairs(measurement)
+            ]
+        )
+    elif reader == "get_json_key_value_pairs":
+        count = len(xlpnr.get_json_key_value_pairs(path))
+    else:
+        count = sum(1 for _ in xlpnr.iter_json_key_value_pairs(path))
+    seconds: float = time.perf_counter() - start
+    peak_mb: float = peak_memory_mb() - baseline
+    print(json.dumps({"pairs": count, "seconds": seconds, "peak_mb": peak_mb}))
+
+
+def main(num_measurements: int) -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "export.json")
+        write_export(path, num_measurements)
+        size_mb: float = os.path.getsize(path) / 2**20
+        print(f"{num_measurements} measurements, {size_mb:.1f} MB of JSON")
+        print(f"{'READER':<28}{'PAIRS':>10}{'SECONDS':>10}{'PEAK MB':>10}")
+        for reader in READERS:
+            # run in ROOT, where xl_populate_named_ranges logs to xl_pnr.log
+            output = subprocess.run(
+                [sys.executable, __file__, "--reader", reader, path],
+                capture_output=True,
+                text=True,
+                check=True,
+                cwd=ROOT,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(
+                f"{reader:<28}{result['pairs']:>10}{result['seconds']:>10.2f}"
+                f"{result['peak_mb']:>10.1f}"
+            )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--reader":
+        run_reader(sys.argv[2], sys.argv[3])
+    else:
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
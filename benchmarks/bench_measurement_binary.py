@@ -0,0 +1,77 @@
+"""
+File size and load time of the binary measurement format against JSON.
+
+For each export size, the same synthetic export is saved as indented
+JSON (as nx_get_measurements writes it) and converted to the binary
+format. Load time is the best of three runs, both for decoding the
+document and for building the flattened key-value pairs with
+load_measurement_document.
+
+Usage: python benchmarks/bench_measurement_binary.py [num_features ...]
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import Callable
+
+from bench_json_reader import ROOT, write_export
+
+os.chdir(ROOT)  # xl_populate_named_ranges logs to xl_pnr.log here
+sys.path.append(os.path.join(ROOT, "datum"))
+
+import xl_populate_named_ranges as xlpnr  # noqa: E402
+from measurement_binary import (  # noqa: E402
+    convert_json_to_binary,
+    load_measurement_binary,
+)
+
+SIZES = [1000, 10000, 100000]
+REPEATS = 3
+
+
+def best_time(function: Callable, path: str) -> float:
+    """Best time of REPEATS calls, without the document cache."""
+    times = []
+    for _ in range(REPEATS):
+        xlpnr._parse_measurement_document.cache_clear()
+        start: float = time.perf_counter()
+        function(path)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def load_json(path: str) -> dict:
+    with open(path, "r") as json_handle:
+        return json.load(json_handle)
+
+
+def main(sizes: list) -> None:
+    print(f"{'FEATURES':>10}{'FORMAT':>8}{'MB':>8}{'DECODE S':>10}{'PAIRS S':>10}")
+    for num_features in sizes:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            json_file = os.path.join(temp_dir, "export.json")
+            write_export(json_file, num_features)
+            binary_file = convert_json_to_binary(json_file)
+            assert (
+                xlpnr.load_measurement_document(json_file).pairs
+                == xlpnr.load_measurement_document(binary_file).pairs
+            )
+
+            for label, path, decode in [
+                ("json", json_file, load_json),
+                ("binary", binary_file, load_measurement_binary),
+            ]:
+                size_mb: float = os.path.getsize(path) / 2**20
+                decode_seconds: float = best_time(decode, path)
+                pairs_seconds: float = best_time(xlpnr.load_measurement_document, path)
+                print(
+                    f"{num_features:>10}{label:>8}{size_mb:>8.2f}"
+                    f"{decode_seconds:>10.3f}{pairs_seconds:>10.3f}"
+                )
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,117 @@
+"""
+Harvest the measurements of an assembly of num_prototypes component
+prototypes, each used by two components, with a mock NXOpen in which
+loading a prototype takes LOAD_SECONDS and holds PROTOTYPE_BYTES until
+it is closed. Peak memory is measured with tracemalloc, with each
+prototype closed after it is read, as harvest_components does, and
+with every prototype left loaded.
+
+Usage: python benchmarks/bench_nx_harvest.py [num_prototypes]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+from bench_json_reader import ROOT
+from bench_nx_incremental import measurement
+
+LOAD_SECONDS = 0.002
+PROTOTYPE_BYTES = 4 * 1024 * 1024  # stand-in for the part's geometry
+FEATURES = 20  # measurement features of each prototype
+
+
+class Prototype:
+    def __init__(self, index):
+        self.Name = f"prototype_{index}"
+        self.Tag = index
+        self.Features = [
+            measurement(index * FEATURES + number, number, float(number))
+            for number in range(FEATURES)
+        ]
+        self.IsFullyLoaded = False
+        self.IsModified = False
+        self.data = None
+
+    def LoadThisPartFully(self):
+        time.sleep(LOAD_SECONDS)
+        self.data = bytearray(PROTOTYPE_BYTES)
+        self.IsFullyLoaded = True
+
+    def Close(self, *args):
+        self.data = None
+        self.IsFullyLoaded = False
+
+
+# a subassembly's prototype, loaded with the assembly, with no features
+Assembly = namedtuple("Assembly", "Name Tag Features IsFullyLoaded IsModified")
+
+
+class Component:
+    def __init__(self, name, prototype, children=()):
+        self.Name = name
+        self.Prototype = prototype
+        self.Tag = name
+        self.IsSuppressed = False
+        self.children = list(children)
+
+    def GetChildren(self):
+        return self.children
+
+
+def main(num_prototypes: int) -> None:
+    NXOpen = type(sys)("NXOpen")
+    NXOpen.BasePart = namedtuple("BasePart", "CloseWholeTree CloseModified")(
+        namedtuple("CloseWholeTree", "FalseValue")(False),
+        namedtuple("CloseModified", "DontCloseModified")(0),
+    )
+    sys.modules["NXOpen"] = NXOpen
+    sys.path.append(ROOT)
+    os.getlogin = lambda: "bench"  # the journal runs in a Windows login session
+    import nx_journals.nx_get_measurements as nxgm
+
+    nxgm.nxprint = lambda *args: None
+    close_prototype = nxgm.close_prototype
+    print(
+        f"{num_prototypes} prototypes, {2 * num_prototypes} components, "
+        f"{PROTOTYPE_BYTES // 1024 // 1024} MB and {LOAD_SECONDS * 1000:.0f} ms "
+        "to load each"
+    )
+    print(f"{'HARVEST':<28}{'SECONDS':>10}{'PEAK MB':>10}{'FEATURES':>10}")
+    for label, close in [
+        ("close each prototype", close_prototype),
+        ("leave prototypes loaded", lambda prototype: None),
+    ]:
+        prototypes = [Prototype(index) for index in range(num_prototypes)]
+        subassemblies = [
+            Component(
+                f"SUB_{index}",
+                Assembly(f"sub_{index}", f"sub_{index}", [], True, False),
+                [
+                    Component(f"{p.Name}_{n}", p)
+                    for p in prototypes[index::10]
+                    for n in [1, 2]
+                ],
+            )
+            for index in range(10)
+        ]
+        root = Component("ROOT", None, subassemblies)
+        work = namedtuple("Work", "ComponentAssembly")(
+            namedtuple("ComponentAssembly", "RootComponent")(root)
+        )
+        session = namedtuple("Session", "Parts")(namedtuple("Parts", "Work")(work))
+        nxgm.close_prototype = close
+        tracemalloc.start()
+        start: float = time.perf_counter()
+        harvested = nxgm.harvest_components(session)
+        seconds: float = time.perf_counter() - start
+        peak: float = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+        print(f"{label:<28}{seconds:>10.3f}{peak:>10.1f}{len(harvested):>10}")
+    nxgm.close_prototype = close_prototype
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
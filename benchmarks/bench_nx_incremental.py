@@ -0,0 +1,110 @@
+"""
+Time export_measurements of a part with num_features measurement
+features, in full and incrementally, with the saved part unchanged
+and after one feature was edited, with a mock NXOpen in which every
+property read or call on a feature or expression takes CALL_SECONDS,
+standing in for the round trip into NX.
+
+Usage: python benchmarks/bench_nx_incremental.py [num_features]
+"""
+
+import filecmp
+import os
+import sys
+import tempfile
+import time
+import types
+from collections import namedtuple
+
+from bench_json_reader import ROOT
+
+CALL_SECONDS = 0.00005
+EXPRESSIONS = 4  # expressions of each measurement feature
+
+
+class Slow:
+    """Attributes that take CALL_SECONDS to read."""
+
+    def __init__(self, **attributes):
+        self._attributes = attributes
+
+    def __getattr__(self, name):
+        time.sleep(CALL_SECONDS)
+        return self._attributes[name]
+
+
+def measurement(index, timestamp, value):
+    expressions = [
+        Slow(
+            Description=f"p{index}( Body Measure : quantity_{number} )",
+            Type="Number",
+            Value=value + number,
+            Units=Slow(Name="MilliMeter"),
+        )
+        for number in range(EXPRESSIONS)
+    ]
+    return Slow(
+        Name=f"MEASUREMENT_{index}",
+        JournalIdentifier=f"MEASURE_BODY({index})",
+        Timestamp=timestamp,
+        FeatureType="MEASUREMENT",
+        Suppressed=False,
+        GetExpressions=lambda: expressions,
+    )
+
+
+def main(num_features: int) -> None:
+    NXOpen = type(sys)("NXOpen")
+    NXOpen.Session = namedtuple("Session", "MarkVisibility")(
+        namedtuple("MarkVisibility", "Visible")(None)
+    )
+    sys.modules["NXOpen"] = NXOpen
+    sys.path.append(ROOT)
+    os.getlogin = lambda: "bench"  # the journal runs in a Windows login session
+    import nx_journals.nx_get_measurements as nxgm
+
+    nxgm.nxprint = lambda *args: None
+    nxgm.spool_metadata = lambda _: None
+    nxgm.get_metadata = lambda _: {"METADATA": {}}
+    features = [
+        measurement(index, index, float(index)) for index in range(num_features)
+    ]
+    Origin = namedtuple("Origin", "X Y Z")(0.0, 0.0, 0.0)
+    work = types.SimpleNamespace(
+        Features=features,
+        WCS=namedtuple("WCS", "Origin")(Origin),
+        FullPath=None,
+        IsModified=False,
+    )
+    session = namedtuple("Session", "Parts SetUndoMark UpdateManager")(
+        namedtuple("Parts", "Work")(work),
+        lambda *_: None,
+        namedtuple("UpdateManager", "DoInterpartUpdate")(lambda _: None),
+    )
+    print(f"{num_features} features, {CALL_SECONDS * 1000:.2f} ms per NX read")
+    print(f"{'EXPORT':<28}{'SECONDS':>10}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work.FullPath = os.path.join(temp_dir, "A.prt")
+        with open(work.FullPath, "wb") as part_file:
+            part_file.write(b"saved part")
+        full_file = os.path.join(temp_dir, "full.json")
+        incremental_file = os.path.join(temp_dir, "incremental.json")
+        for label, edit, export_file, incremental in [
+            ("full", False, full_file, False),
+            ("incremental, no cache", False, incremental_file, True),
+            ("incremental, part unchanged", False, incremental_file, True),
+            ("incremental, 1 edited", True, incremental_file, True),
+            ("full, 1 edited", False, full_file, False),
+        ]:
+            if edit:
+                features[0] = measurement(0, 0, -1.0)
+                work.IsModified = True
+            start: float = time.perf_counter()
+            nxgm.export_measurements(export_file, session, incremental)
+            print(f"{label:<28}{time.perf_counter() - start:>10.3f}")
+        same: bool = filecmp.cmp(full_file, incremental_file, shallow=False)
+        print(f"incremental JSON identical to full export: {same}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
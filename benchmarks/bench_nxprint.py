@@ -0,0 +1,81 @@
+"""
+Count the NXOpen calls made to print num_lines messages to the listing
+window, by the unbuffered nxprint as before and by ListingWriter, with
+a mock NXOpen in which every call takes CALL_SECONDS, standing in for
+the round trip into NX.
+
+Usage: python benchmarks/bench_nxprint.py [num_lines]
+"""
+
+import os
+import sys
+import time
+
+from bench_json_reader import ROOT
+
+sys.path.append(os.path.join(ROOT, "nx_journals"))
+
+from nxmods import ListingWriter  # noqa: E402
+
+CALL_SECONDS = 0.0005
+
+
+class MockNXOpen:
+    calls = 0
+
+    class Session:
+        @staticmethod
+        def GetSession():
+            MockNXOpen.call()
+            return MockNXOpen.Session
+
+        class ListingWindow:
+            @staticmethod
+            def Open():
+                MockNXOpen.call()
+
+            @staticmethod
+            def WriteLine(text):
+                MockNXOpen.call()
+
+            @staticmethod
+            def Close():
+                MockNXOpen.call()
+
+    @classmethod
+    def call(cls):
+        cls.calls += 1
+        time.sleep(CALL_SECONDS)
+
+
+def unbuffered_nxprint(message):
+    """nxprint before the listing window was kept open."""
+    import NXOpen
+
+    nxSession = NXOpen.Session.GetSession()
+    lw = nxSession.ListingWindow
+    lw.Open()
+    lw.WriteLine(str(message))
+    lw.Close()
+
+
+def main(num_lines: int) -> None:
+    sys.modules["NXOpen"] = MockNXOpen
+    print(f"{num_lines} lines, {CALL_SECONDS * 1000:.1f} ms per NXOpen call")
+    print(f"{'WRITER':<20}{'CALLS':>10}{'SECONDS':>10}")
+    writer = ListingWriter()
+    for label, write, close in [
+        ("unbuffered", unbuffered_nxprint, lambda: None),
+        ("ListingWriter", writer.write, writer.close),
+    ]:
+        MockNXOpen.calls = 0
+        start: float = time.perf_counter()
+        for line in range(num_lines):
+            write(f"Feature MEASUREMENT({line}) is suppressed.")
+        close()
+        seconds: float = time.perf_counter() - start
+        print(f"{label:<20}{MockNXOpen.calls:>10}{seconds:>10.3f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,119 @@
+"""
+Prune a year of exports by the retention policy, reporting the rows
+and bytes removed and the longest time another session waited to
+write while pruning ran, in chunks and in a single transaction.
+
+Usage: python benchmarks/bench_retention.py [exports per day]
+"""
+
+import datetime
+import logging
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from typing import List
+
+from bench_json_reader import ROOT
+
+sys.path.append(os.path.join(ROOT, "datum"))
+
+from database import open_connection  # noqa: E402
+from retention import prune_history  # noqa: E402
+
+NUM_KEYS = 500
+CHANGED = 0.3  # fraction of keys changed at each export
+NOW = datetime.datetime(2023, 1, 1)
+KEEP_DAYS = 90
+
+
+def populate(db_file: str, exports_per_day: int) -> None:
+    connection = open_connection(db_file)
+    random.seed(1)
+    values: List[float] = [0.0] * NUM_KEYS
+    start: datetime.datetime = NOW - datetime.timedelta(days=365)
+    with connection:
+        for export in range(365 * exports_per_day):
+            timestamp: str = (
+                start + datetime.timedelta(days=export / exports_per_day)
+            ).isoformat(" ")
+            source_id: int = connection.execute(
+                "INSERT INTO source_history (part_name, part_rev, retrieval_ts) "
+                "VALUES ('HOUSING', ?, ?)",
+                [str(export // 100), timestamp],
+            ).lastrowid
+            rows = []
+            for key in range(NUM_KEYS):
+                if export == 0 or random.random() < CHANGED:
+                    values[key] += 1
+                    rows.append(
+                        (f"HOUSING.key_{key}", values[key], timestamp, source_id)
+                    )
+            connection.executemany(
+                "INSERT INTO parameters "
+                "(param_key, param_value, generation_time, source_id) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+    connection.close()
+
+
+def other_writer(db_file: str, done: threading.Event, waits: List[float]) -> None:
+    """A session recording an export every 10 ms."""
+    connection = sqlite3.connect(db_file, timeout=60)
+    while not done.is_set():
+        start: float = time.perf_counter()
+        try:
+            with connection:
+                connection.execute("INSERT INTO spool_marks VALUES ('bench', 0, NULL)")
+                connection.execute("DELETE FROM spool_marks")
+        except sqlite3.OperationalError:  # timed out waiting for the lock
+            pass
+        waits.append(time.perf_counter() - start)
+        time.sleep(0.01)
+    connection.close()
+
+
+def main(exports_per_day: int) -> None:
+    logging.disable(logging.INFO)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        template: str = os.path.join(temp_dir, "template.db")
+        populate(template, exports_per_day)
+        print(
+            f"{365 * exports_per_day} exports, {os.path.getsize(template) // 1024} KiB"
+        )
+        print(
+            f"{'RUN':<16}{'EXPORTS':>10}{'DELETED':>10}{'RELINKED':>10}"
+            f"{'KIB':>10}{'SECONDS':>10}{'MAX WAIT':>10}"
+        )
+        for label, chunk_exports, dry_run in [
+            ("dry run", None, True),
+            ("chunked", None, False),
+            ("one transaction", 10**9, False),
+        ]:
+            db_file: str = os.path.join(temp_dir, f"{label}.db")
+            shutil.copy(template, db_file)
+            connection = open_connection(db_file)
+            done = threading.Event()
+            waits: List[float] = []
+            writer = threading.Thread(target=other_writer, args=(db_file, done, waits))
+            writer.start()
+            start: float = time.perf_counter()
+            report = prune_history(connection, KEEP_DAYS, dry_run, NOW, chunk_exports)
+            seconds: float = time.perf_counter() - start
+            done.set()
+            writer.join()
+            connection.close()
+            print(
+                f"{label:<16}{report.exports:>10}{report.deleted:>10}"
+                f"{report.relinked:>10}{report.bytes // 1024:>10}"
+                f"{seconds:>10.2f}{max(waits):>10.3f}"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4)
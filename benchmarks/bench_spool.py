@@ -0,0 +1,105 @@
+"""
+Time the NX journal spends recording an export, writing it to the
+database as before against appending it to the spool, both with the
+database idle and while another session holds its write lock; and
+the rate datum ingest loads spooled exports.
+
+Usage: python benchmarks/bench_spool.py [num_exports]
+"""
+
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+from bench_json_reader import ROOT
+
+sys.path.append(os.path.join(ROOT, "datum"))
+
+from database import migrate  # noqa: E402
+from spool import append_record, ingest_spool  # noqa: E402
+
+LOCK_SECONDS = 1.0  # how long the other session holds the write lock
+
+
+def database_write(db_file: str, metadata_dict: dict) -> None:
+    """write_metadata_db of the journal, with parameters bound."""
+    db_connection = sqlite3.connect(db_file, timeout=10)
+    migrate(db_connection)
+    columns = ", ".join(metadata_dict)
+    db_connection.execute(
+        f"INSERT INTO source_history ({columns}) "
+        f"VALUES ({', '.join('?' for _ in metadata_dict)})",
+        list(metadata_dict.values()),
+    )
+    db_connection.commit()
+    db_connection.close()
+
+
+def hold_lock(db_file: str, locked: threading.Event) -> None:
+    connection = sqlite3.connect(db_file)
+    connection.execute("BEGIN IMMEDIATE")
+    locked.set()
+    time.sleep(LOCK_SECONDS)
+    connection.rollback()
+    connection.close()
+
+
+def export(index: int) -> dict:
+    return {
+        "part_name": f"PART_{index % 50}",
+        "part_path": f"PART_{index % 50}/{index}",
+        "part_rev": str(index),
+        "source_type": "NX",
+        "retrieval_ts": f"2022-05-01 09:{index // 60 % 60:02}:{index % 60:02}",
+    }
+
+
+def main(num_exports: int) -> None:
+    logging.disable(logging.WARNING)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db_file = os.path.join(temp_dir, "datum.db")
+        spool_file = os.path.join(temp_dir, "datum_spool.jsonl")
+        print(f"{'JOURNAL WRITE':<20}{'DATABASE':>10}{'MS':>10}")
+        for label, write, path in [
+            ("database", database_write, db_file),
+            ("spool", append_record, spool_file),
+        ]:
+            for state in ["idle", "locked"]:
+                holder = None
+                if state == "locked":
+                    locked = threading.Event()
+                    holder = threading.Thread(target=hold_lock, args=(db_file, locked))
+                    holder.start()
+                    locked.wait()
+                start: float = time.perf_counter()
+                write(path, export(0))
+                seconds: float = time.perf_counter() - start
+                if holder is not None:
+                    holder.join()
+                print(f"{label:<20}{state:>10}{seconds * 1000:>10.2f}")
+
+        os.remove(spool_file)
+        start = time.perf_counter()
+        for index in range(num_exports):
+            append_record(spool_file, export(index))
+        spool_seconds: float = time.perf_counter() - start
+        connection = sqlite3.connect(db_file)
+        migrate(connection)
+        start = time.perf_counter()
+        with connection:
+            report = ingest_spool(connection, spool_file)
+        ingest_seconds: float = time.perf_counter() - start
+        connection.close()
+        print(
+            f"{num_exports} exports: spooled in {spool_seconds:.3f} s, "
+            f"ingested {report.added} in {ingest_seconds:.3f} s "
+            f"({report.added / ingest_seconds:.0f}/s)"
+        )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,51 @@
+"""
+Bytes stored and decode time of point and matrix parameters, stored
+as text by str() before packed storage, against packed float64 blobs.
+
+Text values are parsed back with json.loads, the cheapest way to get
+numbers out of them. Packed values are unpacked as lists.
+
+Usage: python benchmarks/bench_vector_storage.py [num_values]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+
+from bench_json_reader import ROOT
+
+sys.path.append(os.path.join(ROOT, "datum"))
+
+from database import pack_vector, unpack_vector  # noqa: E402
+
+
+def main(num_values: int) -> None:
+    random.seed(0)
+    values = {
+        "point": [[random.uniform(-500, 500) for _ in range(3)]] * num_values,
+        "matrix": [[[random.uniform(-1e6, 1e6) for _ in range(3)] for _ in range(3)]]
+        * num_values,
+    }
+    print(f"{num_values} values")
+    print(f"{'VALUE':<10}{'STORAGE':<10}{'BYTES':>8}{'DECODE US':>12}")
+    for name, vectors in values.items():
+        for storage, encode, decode in [
+            ("text", str, json.loads),
+            ("packed", pack_vector, lambda blob: unpack_vector(blob, arrays=False)),
+        ]:
+            stored = [encode(vector) for vector in vectors]
+            start: float = time.perf_counter()
+            for value in stored:
+                decode(value)
+            seconds: float = time.perf_counter() - start
+            size: float = sum(len(value) for value in stored) / num_values
+            print(
+                f"{name:<10}{storage:<10}{size:>8.0f}"
+                f"{seconds / num_values * 1e6:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -1 +1 @@
-python datum/datum_console.py
+python datum/datum_console.py %*
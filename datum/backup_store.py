@@ -0,0 +1,223 @@
+"""
+Content-addressed store for workbook backups.
+
+Backups are file-level copies of a saved workbook. Each copy is
+gzip compressed and stored under the SHA-256 hash of its contents,
+so identical workbook states are only stored once. An index.json
+file records when each workbook was backed up and which object
+holds it; entries beyond the retention policy are pruned along
+with any objects no longer referenced.
+"""
+
+import datetime
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Union
+
+try:
+    from xl_backends import replace_file
+except ModuleNotFoundError:
+    from datum.xl_backends import replace_file
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20  # bytes read at a time while hashing
+
+# Index updates from the background thread and the console are serialized
+_index_lock = threading.Lock()
+_executor: Optional[ThreadPoolExecutor] = None
+_pending: List[Future] = []
+
+
+class BackupEntry(NamedTuple):
+    """A backup of one workbook at one point in time."""
+
+    workbook: str  # workbook file name, e.g. "design.xlsx"
+    digest: str  # SHA-256 of the workbook file
+    created: str  # ISO format timestamp
+    source: str  # path the workbook was backed up from
+    size: int  # workbook size in bytes
+
+
+class BackupStore:
+    """Backups kept in a directory.
+
+    Keyword arguments:
+    root -- store directory, created if needed
+    keep_last -- number of backups kept for each workbook
+    max_age_days -- backups older than this are removed, None to keep all
+    """
+
+    def __init__(
+        self,
+        root: Union[str, Path],
+        keep_last: int = 10,
+        max_age_days: Optional[int] = None,
+    ) -> None:
+        self.root = Path(root)
+        self.keep_last = keep_last
+        self.max_age_days = max_age_days
+
+    @property
+    def index_path(self) -> Path:
+        return self.root / "index.json"
+
+    def object_path(self, digest: str) -> Path:
+        return self.root / "objects" / digest[:2] / f"{digest}.xlsx.gz"
+
+    def entries(self, workbook: Optional[str] = None) -> List[BackupEntry]:
+        """Backups in the store, oldest first, optionally for one workbook."""
+        if not self.index_path.is_file():
+            return []
+        with open(self.index_path, "r") as index_handle:
+            entries = [BackupEntry(**entry) for entry in json.load(index_handle)]
+        if workbook is not None:
+            entries = [entry for entry in entries if entry.workbook == workbook]
+        return entries
+
+    def _write_index(self, entries: List[BackupEntry]) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(suffix=".json", dir=self.root)
+        with os.fdopen(handle, "w") as index_handle:
+            json.dump([entry._asdict() for entry in entries], index_handle, indent=1)
+        replace_file(temp_path, self.index_path)
+
+    def add(
+        self, path: Union[str, Path], workbook: Optional[str] = None
+    ) -> BackupEntry:
+        """Back up a workbook file. The file is read once; its contents
+        are hashed and compressed in the same pass."""
+        path = Path(path)
+        workbook = workbook or path.name
+        self.root.mkdir(parents=True, exist_ok=True)
+        sha256 = hashlib.sha256()
+        size: int = 0
+        handle, temp_path = tempfile.mkstemp(suffix=".gz", dir=self.root)
+        try:
+            with open(path, "rb") as source, gzip.open(
+                os.fdopen(handle, "wb"), "wb"
+            ) as compressed:
+                for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                    sha256.update(chunk)
+                    compressed.write(chunk)
+                    size += len(chunk)
+            digest: str = sha256.hexdigest()
+            object_path: Path = self.object_path(digest)
+            if object_path.is_file():
+                logger.debug(f"Backup of {workbook} matches stored {digest[:12]}")
+                os.remove(temp_path)
+            else:
+                object_path.parent.mkdir(parents=True, exist_ok=True)
+                replace_file(temp_path, object_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with _index_lock:
+            entries: List[BackupEntry] = self.entries()
+            previous: List[BackupEntry] = [e for e in entries if e.workbook == workbook]
+            if previous and previous[-1].digest == digest:
+                # unchanged since the last backup
+                return previous[-1]
+            entry = BackupEntry(
+                workbook,
+                digest,
+                datetime.datetime.now().isoformat(timespec="seconds"),
+                str(path.resolve()),
+                size,
+            )
+            entries.append(entry)
+            self._write_index(self._apply_retention(entries))
+        logger.info(f"Backed up {workbook} to {self.root} ({digest[:12]})")
+        return entry
+
+    def add_in_background(
+        self, path: Union[str, Path], workbook: Optional[str] = None
+    ) -> Future:
+        """Back up a workbook file on the backup thread.
+        Returns a Future for the BackupEntry."""
+        global _executor
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="backup")
+        future: Future = _executor.submit(self._add_logged, path, workbook)
+        _pending.append(future)
+        return future
+
+    def _add_logged(
+        self, path: Union[str, Path], workbook: Optional[str] = None
+    ) -> BackupEntry:
+        # nothing may wait on a background backup, so report failures here
+        try:
+            return self.add(path, workbook)
+        except Exception as error:
+            logger.error(f"Backup failed: {error}")
+            raise
+
+    def restore(self, entry: BackupEntry, target: Union[str, Path]) -> Path:
+        """Decompress a backup to target, checking its hash."""
+        target = Path(target)
+        sha256 = hashlib.sha256()
+        handle, temp_path = tempfile.mkstemp(suffix=".xlsx", dir=target.parent)
+        try:
+            with gzip.open(self.object_path(entry.digest), "rb") as compressed, (
+                os.fdopen(handle, "wb")
+            ) as restored:
+                for chunk in iter(lambda: compressed.read(CHUNK_SIZE), b""):
+                    sha256.update(chunk)
+                    restored.write(chunk)
+            if sha256.hexdigest() != entry.digest:
+                raise ValueError(f"Backup {entry.digest[:12]} is corrupt.")
+            replace_file(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return target
+
+    def prune(self) -> List[BackupEntry]:
+        """Apply the retention policy. Returns the removed entries."""
+        with _index_lock:
+            entries: List[BackupEntry] = self.entries()
+            kept: List[BackupEntry] = self._apply_retention(entries)
+            if len(kept) != len(entries):
+                self._write_index(kept)
+        return [entry for entry in entries if entry not in kept]
+
+    def _apply_retention(self, entries: List[BackupEntry]) -> List[BackupEntry]:
+        """Drop entries outside the retention policy, and delete
+        objects that no remaining entry refers to."""
+        kept: List[BackupEntry] = []
+        per_workbook: dict = dict()
+        oldest: Optional[str] = None
+        if self.max_age_days is not None:
+            oldest = (
+                datetime.datetime.now() - datetime.timedelta(days=self.max_age_days)
+            ).isoformat(timespec="seconds")
+        # walk newest first so keep_last keeps the most recent backups
+        for entry in reversed(entries):
+            count: int = per_workbook.get(entry.workbook, 0)
+            if count >= self.keep_last or (oldest and entry.created < oldest):
+                continue
+            per_workbook[entry.workbook] = count + 1
+            kept.append(entry)
+        kept.reverse()
+
+        unreferenced = {e.digest for e in entries} - {e.digest for e in kept}
+        for digest in unreferenced:
+            if self.object_path(digest).is_file():
+                os.remove(self.object_path(digest))
+        return kept
+
+
+def wait_for_backups() -> None:
+    """Block until all background backups have finished."""
+    while _pending:
+        wait([_pending.pop(0)])
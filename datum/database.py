@@ -0,0 +1,494 @@
+"""
+Schema of the datum SQLite database, and its migrations.
+
+Each export from NX is a row of source_history, and every parameter
+written from it references that row, so values can be looked up by
+part and revision. The schema version is kept in PRAGMA user_version;
+migrate brings a database of any earlier version up to date in place.
+
+Database keeps one configured connection open for a whole session,
+so repeated writes don't reconnect or check the schema again.
+DatabaseWriter runs writes on a background thread with its own
+connection, so the console doesn't wait for SQLite to commit.
+
+Points, vectors and matrices are stored in param_value as packed
+float64 blobs:
+    header      PACKED_MAGIC, dtype "d" and the number of dimensions
+    shape       uint32[ndim]
+    values      float64[product of shape], little-endian, row-major
+
+Only the standard library is used, so the NX journals can share the
+schema. Packed values are read as NumPy arrays if NumPy is installed.
+"""
+
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import struct
+import sys
+import threading
+from array import array
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+SCHEMA_VERSION = 2
+CACHE_KIB = 16384  # default SQLite page cache size of a connection
+WRITE_QUEUE_JOBS = 16  # default number of writes queued before submit blocks
+MEMORY = ":memory:"
+PACKED_MAGIC = b"DV"
+PACKED_HEADER = struct.Struct("<2scB")  # magic, dtype, number of dimensions
+
+SOURCE_HISTORY_COLUMNS = [
+    "part_name",
+    "part_path",
+    "part_rev",
+    "part_units",
+    "user",
+    "computer",
+    "datum_version",
+    "source_type",
+    "source_version",
+    "retrieval_ts",
+]
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+def table_columns(connection: sqlite3.Connection, table: str) -> List[str]:
+    """Names of the columns of a table, empty if it doesn't exist."""
+    return [row[1] for row in connection.execute(f"PRAGMA table_info({table})")]
+
+
+def _migrate_to_1(connection: sqlite3.Connection) -> None:
+    """Link parameters to source_history and index both tables.
+
+    Databases before version 1 may have either table in its original
+    layout. Existing parameters are linked to the latest export with
+    the same timestamp, which is where their generation_time came from."""
+    connection.execute(
+        """--sql
+        CREATE TABLE IF NOT EXISTS source_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            part_name TEXT,
+            part_path TEXT,
+            part_rev TEXT,
+            part_units TEXT,
+            user TEXT,
+            computer TEXT,
+            datum_version TEXT,
+            source_type TEXT,
+            source_version TEXT,
+            retrieval_ts TIMESTAMP /* timestamp for source generation */
+        )
+        """
+    )
+    connection.execute(
+        """--sql
+        CREATE TABLE IF NOT EXISTS parameters(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            param_key TEXT,
+            param_value NUMERIC,
+            generation_time TIMESTAMP /* time measurement was made */
+        )
+        """
+    )
+    if "source_id" not in table_columns(connection, "parameters"):
+        connection.execute(
+            """--sql
+            ALTER TABLE parameters
+            ADD COLUMN source_id INTEGER REFERENCES source_history(id)
+            """
+        )
+    connection.execute(
+        """--sql
+        CREATE INDEX IF NOT EXISTS parameters_key_time
+        ON parameters(param_key, generation_time)
+        """
+    )
+    connection.execute(
+        "CREATE INDEX IF NOT EXISTS parameters_source ON parameters(source_id)"
+    )
+    connection.execute(
+        """--sql
+        CREATE INDEX IF NOT EXISTS source_history_part
+        ON source_history(part_name, part_rev)
+        """
+    )
+    connection.execute(
+        """--sql
+        CREATE INDEX IF NOT EXISTS source_history_time
+        ON source_history(retrieval_ts)
+        """
+    )
+    linked = connection.execute(
+        """--sql
+        UPDATE parameters SET source_id = (
+            SELECT MAX(id) FROM source_history
+            WHERE retrieval_ts = parameters.generation_time
+        )
+        WHERE source_id IS NULL
+        """
+    )
+    logger.info(f"Linked {linked.rowcount} parameters to their source.")
+
+
+def _migrate_to_2(connection: sqlite3.Connection) -> None:
+    """Add the high-water marks of spool files loaded by ingest_spool."""
+    connection.execute(
+        """--sql
+        CREATE TABLE IF NOT EXISTS spool_marks (
+            spool_path TEXT PRIMARY KEY,
+            position INTEGER NOT NULL, /* bytes of the spool file ingested */
+            ingested_ts TIMESTAMP
+        )
+        """
+    )
+
+
+# MIGRATIONS[n] upgrades a database from version n to n + 1
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migrate_to_1,
+    _migrate_to_2,
+]
+
+
+def migrate(connection: sqlite3.Connection) -> int:
+    """Upgrade the database to SCHEMA_VERSION, one transaction per
+    version. Returns the version the database was at.
+
+    Raises RuntimeError for a database written by a newer version."""
+    version: int = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {version} is newer than {SCHEMA_VERSION}."
+        )
+    for next_version in range(version + 1, SCHEMA_VERSION + 1):
+        logger.info(f"Upgrading database to schema version {next_version}.")
+        with connection:
+            connection.execute("BEGIN")
+            MIGRATIONS[next_version - 1](connection)
+            connection.execute(f"PRAGMA user_version = {next_version}")
+    return version
+
+
+def find_or_add_source(connection: sqlite3.Connection, metadata: dict) -> int:
+    """Id of the source_history row for an export's metadata.
+
+    The NX journal records each export as it is made; exports it
+    didn't record, e.g. in another database, are added here."""
+    existing: Optional[tuple] = connection.execute(
+        """--sql
+        SELECT MAX(id) FROM source_history
+        WHERE retrieval_ts = ? AND part_path IS ?
+        """,
+        [metadata.get("retrieval_ts"), metadata.get("part_path")],
+    ).fetchone()
+    if existing[0] is not None:
+        return existing[0]
+
+    columns: List[str] = [key for key in SOURCE_HISTORY_COLUMNS if key in metadata]
+    cursor = connection.execute(
+        f"INSERT INTO source_history ({', '.join(columns)}) "
+        f"VALUES ({', '.join('?' for _ in columns)})",
+        [metadata[key] for key in columns],
+    )
+    return cursor.lastrowid
+
+
+def _shape(value: Any) -> Optional[Tuple[int, ...]]:
+    """Shape of a nested list of numbers, () for a number, or None if
+    it isn't a regular array of numbers."""
+    if isinstance(value, (list, tuple)):
+        shapes = {_shape(item) for item in value}
+        if None in shapes or len(shapes) > 1:
+            return None
+        return (len(value),) + (shapes.pop() if shapes else ())
+    if isinstance(value, (int, float)):
+        return ()
+    return None
+
+
+def _flatten(value: Any) -> Iterator[Any]:
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _flatten(item)
+    else:
+        yield value
+
+
+def _size(shape: Tuple[int, ...]) -> int:
+    size: int = 1
+    for length in shape:
+        size *= length
+    return size
+
+
+def _nest(values: List[float], shape: Tuple[int, ...]) -> List[Any]:
+    """Nested lists of the given shape from row-major values."""
+    if len(shape) == 1:
+        return values
+    step: int = _size(shape[1:])
+    return [
+        _nest(values[index * step : (index + 1) * step], shape[1:])
+        for index in range(shape[0])
+    ]
+
+
+def pack_vector(value: Any) -> Optional[bytes]:
+    """Pack a point, vector, matrix or list of numbers as a float64
+    blob, or return None if it isn't a regular array of numbers."""
+    shape: Optional[Tuple[int, ...]] = _shape(value)
+    if not shape:
+        return None
+    values: array = array("d", _flatten(value))
+    if sys.byteorder == "big":  # pragma: no cover
+        values.byteswap()
+    return (
+        PACKED_HEADER.pack(PACKED_MAGIC, b"d", len(shape))
+        + struct.pack(f"<{len(shape)}I", *shape)
+        + values.tobytes()
+    )
+
+
+def is_packed(value: Any) -> bool:
+    return isinstance(value, bytes) and value[: len(PACKED_MAGIC)] == PACKED_MAGIC
+
+
+def unpack_components(blob: bytes) -> Tuple[Tuple[int, ...], List[float]]:
+    """Shape and values, in row-major order, of a packed blob.
+
+    Raises ValueError if it isn't a packed blob."""
+    try:
+        magic, dtype, ndim = PACKED_HEADER.unpack_from(blob)
+        if magic != PACKED_MAGIC or dtype != b"d":
+            raise ValueError(f"Not a packed vector: {blob[:4]!r}")
+        shape: Tuple[int, ...] = struct.unpack_from(
+            f"<{ndim}I", blob, PACKED_HEADER.size
+        )
+    except struct.error as error:
+        raise ValueError(f"Packed vector header is truncated: {error}")
+    values: array = array("d")
+    values.frombytes(blob[PACKED_HEADER.size + 4 * ndim :])
+    if sys.byteorder == "big":  # pragma: no cover
+        values.byteswap()
+    if len(values) != _size(shape):
+        raise ValueError(f"Packed vector of shape {shape} has {len(values)} values.")
+    return shape, values.tolist()
+
+
+def unpack_vector(blob: bytes, arrays: bool = True) -> Any:
+    """Unpack a packed blob as a NumPy array, if NumPy is installed and
+    arrays is set, or as nested lists of floats.
+
+    Raises ValueError if it isn't a packed blob."""
+    shape, values = unpack_components(blob)
+    if arrays and numpy is not None:
+        return numpy.array(values, dtype=numpy.float64).reshape(shape)
+    return _nest(values, shape)
+
+
+def decode_value(value: Any, arrays: bool = True) -> Any:
+    """A param_value as read from the database, with packed vectors
+    unpacked by unpack_vector."""
+    if is_packed(value):
+        return unpack_vector(value, arrays)
+    return value
+
+
+def open_connection(db_file: str, cache_kib: int = CACHE_KIB) -> sqlite3.Connection:
+    """Open a database, tuned for bulk writes and upgraded to the
+    current schema.
+
+    WAL journaling lets readers continue during a write and only
+    syncs the log at checkpoints (synchronous=NORMAL), which is still
+    safe against corruption if the application crashes. New databases
+    are created with auto_vacuum=INCREMENTAL, so pages freed by pruning
+    can be returned to the file system a few at a time."""
+    connection = sqlite3.connect(db_file, detect_types=sqlite3.PARSE_DECLTYPES)
+    connection.execute("PRAGMA auto_vacuum=INCREMENTAL")  # before any table
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.execute(f"PRAGMA cache_size=-{cache_kib}")
+    connection.execute("PRAGMA temp_store=MEMORY")
+    connection.execute("PRAGMA foreign_keys=ON")
+    migrate(connection)
+    return connection
+
+
+class Database:
+    """A connection to the datum database, kept open between writes.
+
+    The connection is opened by open_connection on first use. A
+    relative db_file is resolved against the working directory each
+    time, so after a change of directory the database there is used,
+    as it would be by a new connection for every write."""
+
+    def __init__(self, db_file: str, cache_kib: int = CACHE_KIB) -> None:
+        self.db_file = db_file
+        self.cache_kib = cache_kib
+        self._path: Optional[str] = None
+        self._connection: Optional[sqlite3.Connection] = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        path: str = self.db_file
+        if path != MEMORY:
+            path = os.path.abspath(path)
+        if self._connection is None or path != self._path:
+            self.close()
+            self._connection = open_connection(path, self.cache_kib)
+            self._path = path
+        return self._connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the block in one transaction, committed at the end or
+        rolled back on an error. Nested blocks join the outer one."""
+        connection: sqlite3.Connection = self.connection
+        if connection.in_transaction:
+            yield connection
+            return
+        with connection:
+            connection.execute("BEGIN")
+            yield connection
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+            self._path = None
+
+    def __enter__(self) -> "Database":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+# a job of DatabaseWriter, run in a transaction on the writer's connection
+Job = Callable[[sqlite3.Connection], Any]
+_STOP = object()  # queued by DatabaseWriter.close to stop the writer thread
+
+
+class DatabaseWriter:
+    """Runs writes to the datum database on a background thread.
+
+    Jobs are run in the order submitted. Consecutive jobs waiting in
+    the queue are run in one transaction, each under a savepoint, so a
+    failing job is rolled back on its own. At most max_jobs wait in
+    the queue; submit blocks while it is full rather than drop a write.
+    The queue is flushed when the writer is closed, and at exit."""
+
+    def __init__(
+        self,
+        db_file: str,
+        cache_kib: int = CACHE_KIB,
+        max_jobs: int = WRITE_QUEUE_JOBS,
+    ) -> None:
+        self.db_file = db_file
+        self.cache_kib = cache_kib
+        self._queue: queue.Queue = queue.Queue(max_jobs)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, job: Job) -> Future:
+        """Queue a job, waiting while the queue is full. Returns a
+        Future for its result. A relative db_file is resolved now, so
+        the job writes to the database of the current directory."""
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="database-writer", daemon=True
+                )
+                self._thread.start()
+                atexit.register(self.close)
+        path: str = self.db_file
+        if path != MEMORY:
+            path = os.path.abspath(path)
+        future: Future = Future()
+        item: Tuple[str, Job, Future] = (path, job, future)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            logger.info("Waiting for queued database writes to finish.")
+            self._queue.put(item)
+        return future
+
+    def flush(self) -> None:
+        """Block until every job submitted so far has been run."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self) -> None:
+        """Flush the queue and stop the writer thread."""
+        with self._start_lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+            atexit.unregister(self.close)
+
+    def _run(self) -> None:
+        database: Optional[Database] = None
+        pending: Any = None  # taken from the queue, for the next batch
+        while True:
+            item: Any = self._queue.get() if pending is None else pending
+            pending = None
+            if item is _STOP:
+                break
+            # run this job and the ones queued behind it for the same file
+            batch: List[Tuple[str, Job, Future]] = [item]
+            while pending is None:
+                try:
+                    next_item: Any = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if next_item is _STOP or next_item[0] != item[0]:
+                    pending = next_item
+                else:
+                    batch.append(next_item)
+            if database is None or database.db_file != item[0]:
+                if database is not None:
+                    database.close()
+                database = Database(item[0], self.cache_kib)
+            self._run_batch(database, batch)
+            for _ in batch:
+                self._queue.task_done()
+        if database is not None:
+            database.close()
+        self._queue.task_done()  # for _STOP
+
+    def _run_batch(
+        self, database: Database, batch: List[Tuple[str, Job, Future]]
+    ) -> None:
+        results: List[Tuple[Future, Any, Optional[BaseException]]] = []
+        try:
+            with database.transaction() as connection:
+                for _, job, future in batch:
+                    connection.execute("SAVEPOINT job")
+                    try:
+                        result: Any = job(connection)
+                    except Exception as error:
+                        connection.execute("ROLLBACK TO job")
+                        logger.error(f"Database write failed: {error}")
+                        results.append((future, None, error))
+                    else:
+                        results.append((future, result, None))
+                    connection.execute("RELEASE job")
+        except Exception as error:
+            # nothing was committed
+            logger.error(f"Database write of {len(batch)} jobs failed: {error}")
+            results = [(future, None, error) for _, _, future in batch]
+        for future, result, exception in results:
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
@@ -1,9 +1,27 @@
+import datetime
+import functools
+import glob
 import os
+import sys
 from collections import namedtuple
+from pathlib import Path
 from typing import List, NamedTuple, Optional, Union
 
 import xlwings as xw
-from xl_populate_named_ranges import (backup_workbook, dump, logger,
+from export_manifest import write_manifest
+from history import key_history
+from history_export import export_history
+from measurement_binary import BINARY_EXTENSION
+from retention import prune_history
+from spool import ingest_spool
+from xl_populate_named_ranges import (DATUM_MANIFEST, DATUM_SPOOL,
+                                      DB_KEEP_DAYS, PREVEIW_NA_STRING,
+                                      MeasurementDocument, backup_workbook,
+                                      build_name_index, dump, get_backup_store,
+                                      load_measurement_document, logger,
+                                      open_database, open_database_writer,
+                                      print_columns, report_difference,
+                                      update_many_workbooks,
                                       update_named_ranges)
 
 Command: NamedTuple = namedtuple("Command", "id function")
@@ -12,8 +30,13 @@ Command: NamedTuple = namedtuple("Command", "id function")
 class ConsoleSession:
     def __init__(self) -> None:
         self.json_file: Optional[str] = None
-        self.excel_workbook: Optional[str] = None
+        self.document: Optional[MeasurementDocument] = None
+        self.excel_workbook: Optional[Union[xw.main.Book, str]] = None
         self.undo_buffer: Optional[dict] = None
+        # held open for the session, so updates don't reconnect each time;
+        # updates are written on the writer's thread, hist reads here
+        self.database = open_database()
+        self.writer = open_database_writer()
 
     def _load_json_excel(self) -> None:
         """Load JSON and Excel files for functions that need both."""
@@ -22,6 +45,14 @@ class ConsoleSession:
         if not self.excel_workbook:
             self.load_workbook()
 
+    def _load_document(self) -> Optional[MeasurementDocument]:
+        """The parsed JSON file, kept between commands. It is only
+        parsed again if the file has changed since it was loaded."""
+        self.document = None
+        if self.json_file:
+            self.document = load_measurement_document(self.json_file)
+        return self.document
+
     def backup(self, *args) -> None:
         """Backup workbook. Will backup in current directory only."""
         if not self.excel_workbook:
@@ -43,21 +74,188 @@ class ConsoleSession:
     def dump_json(self, *args) -> None:
         """Dump All JSON data to Excel."""
         self._load_json_excel()
-        if self.excel_workbook and self.json_file:
-            dump(self.excel_workbook, self.json_file)
+        if self.excel_workbook and self._load_document():
+            dump(self.excel_workbook, self.document)
+
+    def export(self, *args) -> None:
+        """Export parameter history to CSV or .dhc: export <file> [filters]"""
+        if len(args) < 1:
+            print(
+                "Export parameter history: export <file.csv or file.dhc> "
+                "[key pattern] [part=<name>] [rev=<rev>] [since=<date>] [until=<date>]"
+            )
+            return
+        key_pattern: str = "*"
+        filters: dict = dict.fromkeys(["part", "rev", "since", "until"])
+        for arg in args[1:]:
+            name, is_filter, value = arg.partition("=")
+            if not is_filter:
+                key_pattern = arg
+            elif name in filters:
+                filters[name] = value
+            else:
+                print(f"Unknown filter {name}.")
+                return
+        try:
+            for name in ["since", "until"]:
+                if filters[name]:
+                    filters[name] = datetime.datetime.fromisoformat(filters[name])
+        except ValueError:
+            print("Dates must be YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS.")
+            return
+        self.writer.flush()  # include the latest updates
+        num_rows: int = export_history(
+            self.database.connection,
+            args[0],
+            key_pattern,
+            filters["part"],
+            filters["rev"],
+            filters["since"],
+            filters["until"],
+        )
+        print(f"Exported {num_rows} rows to {args[0]}.")
+
+    def history(self, *args) -> None:
+        """Show the stored values of a parameter: hist <key>"""
+        if len(args) < 1:
+            print("Parameter history: hist <key>")
+            return
+        column_widths = [20, 24, 17, 17]
+        num_records: int = 0
+        self.writer.flush()  # include the latest updates
+        # printed as they are read, so long histories start at once
+        for record in key_history(self.database.connection, args[0]):
+            if num_records == 0:
+                print_columns(column_widths, ["TIME", "SOURCE", "VALUE", "CHANGE"])
+            num_records += 1
+            source: Optional[str] = None
+            if record.part_name is not None:
+                part_rev: str = record.part_rev or PREVEIW_NA_STRING
+                source = f"{record.part_name}/{part_rev}"
+            value = record.param_value
+            if isinstance(value, int):
+                value = float(value)
+            elif not isinstance(value, (float, str, type(None))):
+                value = str(value)  # points and vectors
+            print_columns(
+                column_widths,
+                [
+                    str(record.generation_time),
+                    source,
+                    value,
+                    report_difference(record.previous_value, record.param_value),
+                ],
+            )
+        if num_records == 0:
+            print(f"No history for {args[0]}.")
+
+    def ingest(self, *args) -> None:
+        """Load exports spooled by the NX journal: ingest [spool file]"""
+        spool_file: str = args[0] if args else DATUM_SPOOL
+        if not os.path.isfile(spool_file):
+            print(f"No spool file {spool_file}.")
+            return
+        job = functools.partial(ingest_spool, spool_file=spool_file)
+        report = self.writer.submit(job).result()
+        print(f"Ingested {report.records} records, {report.added} new exports.")
 
     def load_measurement(self, *args) -> None:
         """Load measurement data from a JSON file"""
         self.json_file = user_select_json_file()
+        self._load_document()
 
     def load_workbook(self, *args) -> None:
-        """Select an open Excel workbook to write to"""
-        self.excel_workbook = user_select_open_workbook()
+        """Select an open Excel workbook to write to, or lw <path> for an .xlsx file"""
+        if len(args) < 1:
+            self.excel_workbook = user_select_open_workbook()
+            return
+        # paths may contain spaces, which split them into several args
+        workbook_path: str = " ".join(args)
+        if not workbook_path.lower().endswith(".xlsx"):
+            print("Only .xlsx files can be edited without Excel.")
+        elif not os.path.isfile(workbook_path):
+            print("File not found.")
+        else:
+            self.excel_workbook = os.path.abspath(workbook_path)
+
+    def manifest(self, *args) -> None:
+        """Write the measurements the workbook uses for NX: manifest [file]"""
+        if not self.excel_workbook:
+            self.load_workbook()
+        if not self.excel_workbook:
+            return
+        manifest_file: str = " ".join(args) if args else DATUM_MANIFEST
+        name_index = build_name_index(self.excel_workbook)
+        features = write_manifest(
+            manifest_file, [*name_index.addresses, *name_index.unparsed]
+        )
+        num_expressions: int = sum(len(names) for names in features.values())
+        print(
+            f"Wrote {len(features)} features, {num_expressions} expressions "
+            f"to {manifest_file}."
+        )
+
+    def prune(self, *args) -> None:
+        """Prune old exports from the database: prune [days to keep]"""
+        try:
+            keep_days: float = float(args[0]) if args else DB_KEEP_DAYS
+        except ValueError:
+            print("Prune old exports: prune [days to keep]")
+            return
+        self.writer.flush()  # prune the latest updates too
+        connection = self.database.connection
+        report = prune_history(connection, keep_days, dry_run=True)
+        if not report.exports:
+            print(f"No exports older than {keep_days:g} days to prune.")
+            return
+        print(
+            f"{report.exports} exports older than {keep_days:g} days will be pruned: "
+            f"{report.deleted} values deleted, {report.relinked} kept for later "
+            f"exports, about {report.bytes // 1024} KiB reclaimed."
+        )
+        if input("Enter 'y' to continue: ") != "y":
+            print("Aborted.")
+            return
+        report = prune_history(connection, keep_days)
+        print(
+            f"Pruned {report.exports} exports and {report.deleted} values, "
+            f"{report.bytes // 1024} KiB reclaimed."
+        )
 
     def pwd(self, *args) -> None:
         """Display current working directory. Wrapper for os.getcwd()"""
         print(os.getcwd())
 
+    def restore(self, *args) -> None:
+        """Restore a backup of the loaded workbook: r [target .xlsx path]"""
+        store = get_backup_store()
+        workbook_name: Optional[str] = None
+        if isinstance(self.excel_workbook, str):
+            workbook_name = os.path.basename(self.excel_workbook)
+        elif self.excel_workbook:
+            workbook_name = self.excel_workbook.name
+        # list every backup if the loaded workbook has none
+        backups = store.entries(workbook_name) or store.entries()
+        if not backups:
+            print("No backups available.")
+            return
+        backups.reverse()  # newest first
+        backup_index: Optional[int] = user_select_item(
+            [f"{entry.created}  {entry.workbook}" for entry in backups], "backup"
+        )
+        if backup_index is None:
+            return
+        entry = backups[backup_index]
+
+        if len(args) > 0:
+            target: str = " ".join(args)
+        else:
+            # never overwrite the workbook itself unless asked to
+            timestamp: str = entry.created.replace(":", "")
+            target = f"{Path(entry.workbook).stem}_RESTORED_{timestamp}.xlsx"
+        store.restore(entry, target)
+        print(f"Restored backup from {entry.created} to {target}")
+
     def status(self, *args) -> None:
         """Display loaded measurement & loaded workbook"""
         print(f"Loaded Measurement:\t{self.json_file}")
@@ -75,14 +273,55 @@ class ConsoleSession:
         """Update named ranges in the Excel file with matching
         data from the JSON measurement file"""
         self._load_json_excel()
-        if self.json_file and self.excel_workbook:
+        if self.excel_workbook and self._load_document():
             undo_buffer: dict = update_named_ranges(
-                self.json_file, self.excel_workbook, backup
+                self.document, self.excel_workbook, backup, database=self.writer
             )
             # Do not clear undo buffer to None on abort
             if undo_buffer:
                 self.undo_buffer = undo_buffer
 
+    def update_many(self, *args) -> None:
+        """Update named ranges in many .xlsx files: um <file or pattern> ..."""
+        if len(args) < 1:
+            print("Update many workbooks: um <file or pattern> ...")
+            return
+        targets: List[str] = sorted(
+            {path for pattern in args for path in glob.glob(pattern)}
+        )
+        targets = [path for path in targets if path.lower().endswith(".xlsx")]
+        if not targets:
+            print("No .xlsx files found.")
+            return
+        if not self.json_file:
+            self.load_measurement()
+        if not self._load_document():
+            return
+
+        for target in targets:
+            print(target)
+        print(f"Named ranges in these {len(targets)} workbooks will be overwritten.")
+        if input("Enter 'y' to continue: ") != "y":
+            print("Aborted.")
+            return
+        summaries = update_many_workbooks(
+            self.document, targets, database=self.writer
+        )
+
+        column_widths = [36, 17, 17, 17]
+        print_columns(column_widths, ["WORKBOOK", "WRITTEN", "SKIPPED", "SECONDS"])
+        for summary in summaries:
+            written: str = "ERROR" if summary.error else str(len(summary.written))
+            print_columns(
+                column_widths,
+                [
+                    os.path.basename(summary.workbook),
+                    written,
+                    str(len(summary.skipped)),
+                    f"{summary.seconds:.2f}",
+                ],
+            )
+
 
 def user_select_item(
     item_list: List[str], item_type: str = "choice", test_flag: bool = False
@@ -141,13 +380,13 @@ def user_select_open_workbook() -> Optional[xw.main.Book]:
 
 
 def user_select_json_file() -> Optional[str]:
-    """Select a JSON file"""
+    """Select a JSON file, or a measurement binary file"""
     json_file_list: List[str] = []
     # TODO: Document structure change for where files
     # should be kept -- OR -- do recursive directory search
     # such as os.walk()
     for file in os.listdir():
-        if file.endswith(".json"):
+        if file.endswith((".json", BINARY_EXTENSION)):
             json_file_list.append(file)
     json_index: Optional[int] = user_select_item(json_file_list, "JSON file")
     if json_index is None:
@@ -207,20 +446,44 @@ def console(command_list: list, test_flag: bool = False) -> None:
             break
 
 
-def main() -> None:
+def run_command(command_list: list, args: List[str]) -> None:
+    """Run one command of command_list with its arguments."""
+    for ids, function in command_list:
+        if args[0] in ids:
+            function(*args[1:])
+            return
+    print(f"Unknown command {args[0]}.")
+
+
+def main(args: Optional[List[str]] = None) -> None:
+    """Run the console, or just the command in args, e.g. datum ingest"""
     cs: ConsoleSession = ConsoleSession()
     command_list: list = [
         (["b"], cs.backup),
         (["cd"], cs.chdir),
         (["d", "dump"], cs.dump_json),
+        (["export"], cs.export),
+        (["hist"], cs.history),
+        (["ingest"], cs.ingest),
         (["lm"], cs.load_measurement),
         (["lw"], cs.load_workbook),
+        (["manifest"], cs.manifest),
+        (["prune"], cs.prune),
         (["pwd"], cs.pwd),
+        (["r", "restore"], cs.restore),
         (["s"], cs.status),
         (["u"], cs.update_named_ranges),
+        (["um"], cs.update_many),
         (["z", "undo"], cs.undo_last_update),
     ]
-    console(command_list)
+    try:
+        if args:
+            run_command(command_list, args)
+        else:
+            console(command_list)
+    finally:
+        cs.writer.close()  # finish queued database writes
+        cs.database.close()
 
 
 if __name__ == "__main__":
@@ -230,4 +493,4 @@ if __name__ == "__main__":
     print(f"DATUM - Version {__version__}")
     print(datum_url)
     print("=" * 40)
-    main()
+    main(sys.argv[1:])
@@ -0,0 +1,63 @@
+"""
+Manifest of the measurements a workbook uses, for the NX journal.
+
+A workbook names a few of the measurements of a part, by range names
+of the form FEATURE.expression, FEATURE.expression.x or
+FEATURE.expression.0. The manifest lists, for each feature, the
+expressions those names need, and nx_get_measurements only reads and
+exports those when it is given the manifest.
+
+The manifest is a JSON file:
+    {"version": MANIFEST_VERSION,
+     "features": {"CHASSIS": ["center_of_mass", "mass"], ...}}
+Feature names are as in range names, with spaces as underscores.
+
+Only the standard library is used, so the NX journals can read it.
+"""
+
+import json
+import os
+from typing import Dict, Iterable, List, Set, Union
+
+MANIFEST_VERSION = 1
+
+
+def manifest_features(range_names: Iterable[str]) -> Dict[str, List[str]]:
+    """The expressions of each feature named by range_names, sorted.
+    Names without a feature and an expression are left out."""
+    features: Dict[str, Set[str]] = dict()
+    for range_name in range_names:
+        # sheet-scoped names are prefixed with their sheet
+        parts: List[str] = range_name.rpartition("!")[2].split(".")
+        if len(parts) < 2 or not parts[0] or not parts[1]:
+            continue
+        features.setdefault(parts[0], set()).add(parts[1])
+    return {
+        feature: sorted(expressions)
+        for feature, expressions in sorted(features.items())
+    }
+
+
+def write_manifest(
+    manifest_file: Union[str, os.PathLike], range_names: Iterable[str]
+) -> Dict[str, List[str]]:
+    """Write the manifest of range_names. Returns its features."""
+    features: Dict[str, List[str]] = manifest_features(range_names)
+    with open(manifest_file, "w", encoding="utf-8") as manifest:
+        json.dump(
+            {"version": MANIFEST_VERSION, "features": features}, manifest, indent=4
+        )
+    return features
+
+
+def read_manifest(manifest_file: Union[str, os.PathLike]) -> Dict[str, List[str]]:
+    """Features of a manifest.
+
+    Raises ValueError if the file isn't a manifest of this version."""
+    with open(manifest_file, "r", encoding="utf-8") as manifest:
+        contents = json.load(manifest)
+    if not isinstance(contents, dict) or contents.get("version") != MANIFEST_VERSION:
+        raise ValueError(
+            f"{manifest_file} is not a version {MANIFEST_VERSION} manifest."
+        )
+    return contents["features"]
@@ -0,0 +1,234 @@
+"""
+Queries of the parameter history in the datum database.
+
+Results are streamed from the cursor FETCH_ROWS at a time, so a key
+with years of history starts printing at once and memory use doesn't
+grow with the number of rows. Comparisons between rows (the previous
+value of a key, the latest value of each key) are made by SQLite
+with window functions rather than in Python.
+
+A parameter may only be stored when its value changes, so the value
+of a key at an export is the latest one stored at or before it.
+Snapshots of an export or revision are rebuilt that way, and read the
+same whether every value or only the changes were stored.
+
+Packed points and vectors are unpacked on the records returned, as
+NumPy arrays if NumPy is installed, else as lists.
+"""
+
+import datetime
+import sqlite3
+from typing import Any, Dict, Iterable, Iterator, NamedTuple, Optional
+
+try:
+    from database import decode_value
+except ModuleNotFoundError:
+    from datum.database import decode_value
+
+FETCH_ROWS = 500  # rows fetched from SQLite at a time
+
+PARAMETER_COLUMNS = """
+    p.param_key, p.param_value, p.generation_time,
+    s.part_name, s.part_rev, p.source_id
+"""
+
+
+class ParameterRecord(NamedTuple):
+    """A stored parameter value and the export it came from.
+
+    previous_value is the value of the same key before this one,
+    and is only set by key_history."""
+
+    param_key: str
+    param_value: Any
+    generation_time: Optional[datetime.datetime]
+    part_name: Optional[str]
+    part_rev: Optional[str]
+    source_id: Optional[int]
+    previous_value: Any = None
+
+
+def _timestamp(value: Optional[datetime.datetime]) -> Optional[str]:
+    """Text of a datetime as it is stored in the database."""
+    return None if value is None else value.isoformat(" ")
+
+
+def _record(row: tuple) -> ParameterRecord:
+    record = ParameterRecord(*row)
+    return record._replace(
+        param_value=decode_value(record.param_value),
+        previous_value=decode_value(record.previous_value),
+    )
+
+
+def _stream(cursor: sqlite3.Cursor, rows: Optional[int] = None) -> Iterator[tuple]:
+    """Yield the rows of an executed query, fetching them in batches."""
+    while True:
+        batch = cursor.fetchmany(rows or FETCH_ROWS)
+        if not batch:
+            return
+        yield from batch
+
+
+def key_history(
+    connection: sqlite3.Connection,
+    param_key: str,
+    since: Optional[datetime.datetime] = None,
+) -> Iterator[ParameterRecord]:
+    """Time series of a key, oldest first, with the previous value of
+    the key on each record. Only values generated at or after since
+    are included, if given."""
+    cursor = connection.execute(
+        f"""--sql
+        SELECT {PARAMETER_COLUMNS},
+            LAG(p.param_value) OVER (ORDER BY p.generation_time, p.id)
+        FROM parameters p LEFT JOIN source_history s ON p.source_id = s.id
+        WHERE p.param_key = ? AND p.generation_time >= ?
+        ORDER BY p.generation_time, p.id
+        """,
+        [param_key, _timestamp(since) or ""],
+    )
+    for row in _stream(cursor):
+        yield _record(row)
+
+
+def values_at(
+    connection: sqlite3.Connection,
+    param_keys: Iterable[str],
+    at: datetime.datetime,
+    part_name: Optional[str],
+) -> Dict[str, Any]:
+    """The value of each key of a part at time at: the latest one
+    generated at or before it, from an export of part_name, as the
+    snapshot and latest values read them. Keys with no value by then
+    are left out. Values are as stored, with vectors packed, for
+    comparison with new rows.
+
+    The keys are loaded into a temporary table so all of them are
+    looked up by one query, each with a seek on the (key, time) index."""
+    connection.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS lookup_keys (param_key TEXT PRIMARY KEY)"
+    )
+    connection.execute("DELETE FROM lookup_keys")
+    connection.executemany(
+        "INSERT OR IGNORE INTO lookup_keys VALUES (?)", [[key] for key in param_keys]
+    )
+    cursor = connection.execute(
+        """--sql
+        SELECT * FROM (
+            SELECT k.param_key, (
+                SELECT p.param_value
+                FROM parameters p JOIN source_history s ON p.source_id = s.id
+                WHERE p.param_key = k.param_key
+                    AND s.part_name IS ?
+                    AND p.generation_time <= ?
+                ORDER BY p.generation_time DESC, p.id DESC
+                LIMIT 1
+            ) AS param_value
+            FROM lookup_keys k
+        )
+        WHERE param_value IS NOT NULL
+        """,
+        [part_name, _timestamp(at)],
+    )
+    return dict(_stream(cursor))
+
+
+def parameter_history(
+    connection: sqlite3.Connection,
+    key_pattern: str = "*",
+    part_name: Optional[str] = None,
+    part_rev: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+    rows: Optional[int] = None,
+) -> Iterator[ParameterRecord]:
+    """Stored values of every key matching key_pattern, a GLOB pattern
+    such as "HOUSING.*", ordered by key and then time. Only values
+    generated from since up to but excluding until, and from exports
+    of part_name and part_rev, are included, if given.
+
+    The rows are read in the order of the (key, time) index, so
+    SQLite doesn't sort them first, and fetched rows at a time."""
+    cursor = connection.execute(
+        f"""--sql
+        SELECT {PARAMETER_COLUMNS}
+        FROM parameters p LEFT JOIN source_history s ON p.source_id = s.id
+        WHERE p.param_key GLOB ?
+            AND p.generation_time >= ? AND (? IS NULL OR p.generation_time < ?)
+            AND (? IS NULL OR s.part_name = ?) AND (? IS NULL OR s.part_rev = ?)
+        ORDER BY p.param_key, p.generation_time, p.id
+        """,
+        [
+            key_pattern,
+            _timestamp(since) or "",
+            _timestamp(until),
+            _timestamp(until),
+            part_name,
+            part_name,
+            part_rev,
+            part_rev,
+        ],
+    )
+    for row in _stream(cursor, rows):
+        yield _record(row)
+
+
+def snapshot_values(
+    connection: sqlite3.Connection, source_id: int
+) -> Iterator[ParameterRecord]:
+    """The value of every key of the part at one export (a
+    source_history row), in key order. A key written more than once
+    from the export has its last value; keys not written from it have
+    the value stored before it."""
+    cursor = connection.execute(
+        f"""--sql
+        SELECT * FROM (
+            SELECT {PARAMETER_COLUMNS},
+                ROW_NUMBER() OVER (
+                    PARTITION BY p.param_key
+                    ORDER BY p.generation_time DESC, p.id DESC
+                ) AS row_number
+            FROM source_history export, parameters p
+                JOIN source_history s ON p.source_id = s.id
+            WHERE export.id = ?
+                AND s.part_name IS export.part_name
+                AND p.generation_time <= export.retrieval_ts
+        )
+        WHERE row_number = 1
+        ORDER BY param_key
+        """,
+        [source_id],
+    )
+    for row in _stream(cursor):
+        yield _record(row[:-1])
+
+
+def latest_values(
+    connection: sqlite3.Connection, part_name: str, part_rev: Optional[str] = None
+) -> Iterator[ParameterRecord]:
+    """The most recent value of every key of a part, in key order,
+    from exports of any revision, or at the latest export of part_rev."""
+    cursor = connection.execute(
+        f"""--sql
+        SELECT * FROM (
+            SELECT {PARAMETER_COLUMNS},
+                ROW_NUMBER() OVER (
+                    PARTITION BY p.param_key
+                    ORDER BY p.generation_time DESC, p.id DESC
+                ) AS row_number
+            FROM parameters p JOIN source_history s ON p.source_id = s.id
+            WHERE s.part_name = ? AND (
+                ? IS NULL OR p.generation_time <= (
+                    SELECT MAX(retrieval_ts) FROM source_history
+                    WHERE part_name = ? AND part_rev = ?
+                )
+            )
+        )
+        WHERE row_number = 1
+        ORDER BY param_key
+        """,
+        [part_name, part_rev, part_name, part_rev],
+    )
+    for row in _stream(cursor):
+        yield _record(row[:-1])
@@ -0,0 +1,275 @@
+"""
+Export of the parameter history to CSV and to a columnar file.
+
+Rows are streamed from history.parameter_history and written as they
+are read, so an export of any size holds at most one row group of
+GROUP_ROWS rows in memory.
+
+The columnar format stores each row group column by column, with the
+strings of the group (keys, part names and revisions, text values) in
+one table, so a history of a few thousand keys compresses to a few
+bytes of index per row. Layout, all little-endian:
+    header          MAGIC, VERSION
+    row groups, until the end of the file:
+        group header    GROUP_MAGIC, row count, size of the group in bytes
+        string count    uint32
+        string offsets  uint32[string count + 1] into the string data
+        string data     UTF-8 bytes
+        keys            uint32[rows] string indices
+        times           int64[rows] microseconds since EPOCH, or NO_TIME
+        values          float64[rows], NaN where the value is text
+        texts           uint32[rows] string indices, NO_STRING for numbers
+        part names      uint32[rows] string indices or NO_STRING
+        part revisions  uint32[rows] string indices or NO_STRING
+        source ids      int64[rows], or NO_SOURCE
+
+Only the standard library is used.
+"""
+
+import csv
+import datetime
+import json
+import math
+import os
+import sqlite3
+import struct
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+try:
+    from database import decode_value, is_packed
+    from history import ParameterRecord, parameter_history
+except ModuleNotFoundError:
+    from datum.database import decode_value, is_packed
+    from datum.history import ParameterRecord, parameter_history
+
+COLUMNAR_EXTENSION = ".dhc"
+GROUP_ROWS = 65536  # rows written to the columnar file at a time
+MAGIC = b"DTMH"
+VERSION = 1
+GROUP_MAGIC = b"ROWS"
+NO_STRING = 0xFFFFFFFF
+NO_TIME = -(2**63)
+NO_SOURCE = -1
+EPOCH = datetime.datetime(1970, 1, 1)
+
+HEADER = struct.Struct("<4sH")
+GROUP_HEADER = struct.Struct("<4sIQ")
+
+CSV_COLUMNS = [
+    "param_key",
+    "param_value",
+    "generation_time",
+    "part_name",
+    "part_rev",
+    "source_id",
+]
+
+
+def _text(value: Any) -> Any:
+    """A value as written to CSV or the string table: packed vectors
+    as JSON lists, other values unchanged."""
+    if is_packed(value):
+        return json.dumps(decode_value(value, arrays=False))
+    if hasattr(value, "tolist"):  # NumPy array
+        return json.dumps(value.tolist())
+    if isinstance(value, list):
+        return json.dumps(value)
+    return value
+
+
+def export_csv(
+    records: Iterable[ParameterRecord], csv_file: Union[str, os.PathLike]
+) -> int:
+    """Write records to a CSV file with a header row of CSV_COLUMNS.
+    Returns the number of rows written."""
+    num_rows: int = 0
+    with open(csv_file, "w", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_COLUMNS)
+        for record in records:
+            writer.writerow(
+                [
+                    record.param_key,
+                    _text(record.param_value),
+                    record.generation_time,
+                    record.part_name,
+                    record.part_rev,
+                    record.source_id,
+                ]
+            )
+            num_rows += 1
+    return num_rows
+
+
+def _microseconds(value: Any) -> int:
+    if value is None:
+        return NO_TIME
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return (value - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":  # pragma: no cover
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data: bytes, offset: int, count: int) -> array:
+    values = array(typecode)
+    values.frombytes(data[offset : offset + count * values.itemsize])
+    if len(values) != count:
+        raise ValueError("Columnar history file is truncated.")
+    if sys.byteorder == "big":  # pragma: no cover
+        values.byteswap()
+    return values
+
+
+def _encode_group(records: List[ParameterRecord]) -> bytes:
+    strings: Dict[str, int] = dict()
+
+    def _index(string: Optional[str]) -> int:
+        if string is None:
+            return NO_STRING
+        return strings.setdefault(string, len(strings))
+
+    keys, texts, part_names, part_revs = (array("I") for _ in range(4))
+    times, source_ids = array("q"), array("q")
+    values = array("d")
+    for record in records:
+        keys.append(_index(record.param_key))
+        times.append(_microseconds(record.generation_time))
+        value: Any = record.param_value
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            values.append(value)
+            texts.append(NO_STRING)
+        else:
+            values.append(math.nan)
+            texts.append(_index(None if value is None else str(_text(value))))
+        part_names.append(_index(record.part_name))
+        part_revs.append(_index(record.part_rev))
+        source_ids.append(NO_SOURCE if record.source_id is None else record.source_id)
+
+    encoded: List[bytes] = [string.encode("utf-8") for string in strings]
+    offsets = array("I", [0])
+    for string in encoded:
+        offsets.append(offsets[-1] + len(string))
+    body: bytes = b"".join(
+        [
+            struct.pack("<I", len(encoded)),
+            _to_bytes(offsets),
+            b"".join(encoded),
+            _to_bytes(keys),
+            _to_bytes(times),
+            _to_bytes(values),
+            _to_bytes(texts),
+            _to_bytes(part_names),
+            _to_bytes(part_revs),
+            _to_bytes(source_ids),
+        ]
+    )
+    return GROUP_HEADER.pack(GROUP_MAGIC, len(records), len(body)) + body
+
+
+def export_columnar(
+    records: Iterable[ParameterRecord],
+    columnar_file: Union[str, os.PathLike],
+    group_rows: Optional[int] = None,
+) -> int:
+    """Write records to a columnar history file, group_rows (default
+    GROUP_ROWS) at a time. Returns the number of rows written."""
+    group_rows = group_rows or GROUP_ROWS
+    num_rows: int = 0
+    group: List[ParameterRecord] = []
+    with open(columnar_file, "wb") as file:
+        file.write(HEADER.pack(MAGIC, VERSION))
+        for record in records:
+            group.append(record)
+            if len(group) == group_rows:
+                file.write(_encode_group(group))
+                num_rows += len(group)
+                group = []
+        if group:
+            file.write(_encode_group(group))
+            num_rows += len(group)
+    return num_rows
+
+
+def _decode_group(num_rows: int, data: bytes) -> Iterator[ParameterRecord]:
+    (num_strings,) = struct.unpack_from("<I", data)
+    offsets: array = _from_bytes("I", data, 4, num_strings + 1)
+    position: int = 4 + offsets.itemsize * len(offsets)
+    string_data: bytes = data[position : position + offsets[-1]]
+    strings: List[str] = [
+        string_data[offsets[index] : offsets[index + 1]].decode("utf-8")
+        for index in range(num_strings)
+    ]
+    position += offsets[-1]
+    columns: List[array] = []
+    for typecode in "IqdIIIq":  # in the order of the layout
+        columns.append(_from_bytes(typecode, data, position, num_rows))
+        position += columns[-1].itemsize * num_rows
+    keys, times, values, texts, part_names, part_revs, source_ids = columns
+
+    def _string(index: int) -> Optional[str]:
+        return None if index == NO_STRING else strings[index]
+
+    for row in range(num_rows):
+        time: int = times[row]
+        yield ParameterRecord(
+            strings[keys[row]],
+            values[row] if texts[row] == NO_STRING else strings[texts[row]],
+            None if time == NO_TIME else EPOCH + datetime.timedelta(microseconds=time),
+            _string(part_names[row]),
+            _string(part_revs[row]),
+            None if source_ids[row] == NO_SOURCE else source_ids[row],
+        )
+
+
+def iter_columnar(columnar_file: Union[str, os.PathLike]) -> Iterator[ParameterRecord]:
+    """Records of a columnar history file, read a row group at a time.
+    Text values, including vectors as JSON lists, are returned as str.
+
+    Raises ValueError if it isn't a columnar history file."""
+    with open(columnar_file, "rb") as file:
+        magic, version = HEADER.unpack(file.read(HEADER.size).ljust(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{columnar_file} is not a columnar history file.")
+        if version > VERSION:
+            raise ValueError(f"Columnar history version {version} is not supported.")
+        while True:
+            header: bytes = file.read(GROUP_HEADER.size)
+            if not header:
+                return
+            if len(header) < GROUP_HEADER.size:
+                raise ValueError("Columnar history file is truncated.")
+            group_magic, num_rows, size = GROUP_HEADER.unpack(header)
+            if group_magic != GROUP_MAGIC:
+                raise ValueError("Columnar history file has a corrupt row group.")
+            data: bytes = file.read(size)
+            if len(data) < size:
+                raise ValueError("Columnar history file is truncated.")
+            yield from _decode_group(num_rows, data)
+
+
+def export_history(
+    connection: sqlite3.Connection,
+    export_file: Union[str, os.PathLike],
+    key_pattern: str = "*",
+    part_name: Optional[str] = None,
+    part_rev: Optional[str] = None,
+    since: Optional[datetime.datetime] = None,
+    until: Optional[datetime.datetime] = None,
+) -> int:
+    """Export the history of the keys matching key_pattern, filtered as
+    by parameter_history, to a columnar file if export_file ends with
+    COLUMNAR_EXTENSION, else to CSV. Returns the number of rows."""
+    records: Iterator[ParameterRecord] = parameter_history(
+        connection, key_pattern, part_name, part_rev, since, until
+    )
+    if str(export_file).lower().endswith(COLUMNAR_EXTENSION):
+        return export_columnar(records, export_file)
+    return export_csv(records, export_file)
@@ -0,0 +1,109 @@
+"""
+Incremental reading of large JSON files.
+
+NX exports of large assemblies hold tens of thousands of measurements
+in a single array. iter_json_array decodes the elements of such an
+array one at a time, so memory use is bounded by the largest element
+rather than the size of the file.
+"""
+
+import json
+from typing import Any, Iterator, TextIO
+
+CHUNK_SIZE = 1 << 16  # characters read from the file at a time
+WHITESPACE = " \t\n\r"
+
+_decoder = json.JSONDecoder()
+
+
+class MissingKeyError(KeyError):
+    """The top-level JSON object has no such key."""
+
+
+class _Reader:
+    """Buffered view of a text file for decoding values one at a time."""
+
+    def __init__(self, handle: TextIO, chunk_size: int) -> None:
+        self.handle = handle
+        self.chunk_size = chunk_size
+        self.buffer: str = ""
+        self.pos: int = 0
+        self.eof: bool = False
+
+    def _fill(self) -> bool:
+        """Read another chunk, dropping consumed text. False at end of file."""
+        if self.eof:
+            return False
+        chunk: str = self.handle.read(self.chunk_size)
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        self.eof = chunk == ""
+        return not self.eof
+
+    def peek(self) -> str:
+        """Next non-whitespace character, or "" at end of file."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos : self.pos + 1]
+
+    def expect(self, characters: str) -> str:
+        character: str = self.peek()
+        if character == "" or character not in characters:
+            raise json.JSONDecodeError(
+                f"Expecting one of {characters!r}", self.buffer, self.pos
+            )
+        self.pos += 1
+        return character
+
+    def value(self) -> Any:
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # the value may continue in the next chunk
+                if self._fill():
+                    continue
+                raise
+            # a number at the end of the buffer may also be cut short
+            if end == len(self.buffer) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+
+def iter_json_array(
+    handle: TextIO, key: str, chunk_size: int = CHUNK_SIZE
+) -> Iterator[Any]:
+    """Yield the elements of the array stored under key in the
+    top-level object of a JSON document, one element at a time.
+
+    Other top-level values are decoded and discarded. Raises
+    MissingKeyError if the key isn't found, TypeError if the
+    document isn't an object, and JSONDecodeError for bad JSON."""
+    reader = _Reader(handle, chunk_size)
+    if reader.peek() != "{":
+        reader.value()  # raises for invalid JSON
+        raise TypeError("JSON document is not an object")
+    reader.expect("{")
+    if reader.peek() == "}":
+        raise MissingKeyError(key)
+    while True:
+        name: Any = reader.value()
+        reader.expect(":")
+        if name == key and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.expect(",]") == "]":
+                        break
+            return
+        reader.value()
+        if reader.expect(",}") == "}":
+            raise MissingKeyError(key)
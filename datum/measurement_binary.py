@@ -0,0 +1,311 @@
+"""
+Compact binary container for NX measurement exports.
+
+Holds the same document as the JSON export, {"measurements": [...],
+"METADATA": {...}}, without text-encoded numbers. Names, types and
+units are stored once each in a string table, and the values of
+numbers, points, vectors and lists in a single float64 array, so a
+reader decodes whole columns at a time instead of parsing text.
+
+Layout, all little-endian:
+    header              MAGIC, VERSION, flags and the counts below
+    metadata            METADATA as UTF-8 JSON, absent if size 0
+    string offsets      uint32[string_count + 1] into the string data
+    string data         UTF-8 bytes
+    measurement names   uint32[measurement_count] string indices
+    expression counts   uint32[measurement_count]
+    expression names    uint32[expression_count] string indices
+    expression types    uint32[expression_count] string indices
+    expression units    uint32[expression_count] string indices or NO_STRING
+    value encodings     uint8[expression_count], one of the ENCODING_ values
+    value offsets       uint32[expression_count] float or string index
+    value sizes         uint32[expression_count] number of floats
+    floats              float64[float_count]
+
+Only the standard library is used, so the NX journals can write the
+format too. Values that don't fit a float encoding exactly (integers,
+None, irregular points) are kept as JSON strings, so a document reads
+back exactly as it was written.
+"""
+
+import json
+import logging
+import os
+import struct
+import sys
+from array import array
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+BINARY_EXTENSION = ".dmb"
+MAGIC = b"DTMB"
+VERSION = 1
+NO_STRING = 0xFFFFFFFF
+
+HEADER = struct.Struct("<4sHHIIIII")
+
+# how an expression value is stored
+ENCODING_FLOAT = 0  # one float
+ENCODING_XYZ = 1  # three floats, read back as {"x", "y", "z"}
+ENCODING_FLOATS = 2  # list of floats
+ENCODING_STRING = 3  # string table entry
+ENCODING_JSON = 4  # string table entry holding any other value as JSON
+
+XYZ = ("x", "y", "z")
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class _StringTable:
+    """Deduplicated strings, numbered in order of first use."""
+
+    def __init__(self) -> None:
+        self.indices: Dict[str, int] = dict()
+        self.offsets = array("I", [0])
+        self.data = bytearray()
+
+    def add(self, string: str) -> int:
+        index: Optional[int] = self.indices.get(string)
+        if index is None:
+            index = self.indices[string] = len(self.indices)
+            self.data += string.encode("utf-8")
+            self.offsets.append(len(self.data))
+        return index
+
+
+def _is_float_list(value: Any) -> bool:
+    return isinstance(value, list) and all(type(item) is float for item in value)
+
+
+def _encode_value(
+    value: Any, strings: _StringTable, floats: array
+) -> Tuple[int, int, int]:
+    """Store a value, returning its (encoding, offset, size)."""
+    if type(value) is float:
+        floats.append(value)
+        return ENCODING_FLOAT, len(floats) - 1, 1
+    if (
+        isinstance(value, dict)
+        and sorted(value) == list(XYZ)
+        and _is_float_list(list(value.values()))
+    ):
+        floats.extend([value[coordinate] for coordinate in XYZ])
+        return ENCODING_XYZ, len(floats) - 3, 3
+    if _is_float_list(value):
+        floats.extend(value)
+        return ENCODING_FLOATS, len(floats) - len(value), len(value)
+    if isinstance(value, str):
+        return ENCODING_STRING, strings.add(value), 0
+    return ENCODING_JSON, strings.add(json.dumps(value)), 0
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":  # pragma: no cover
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data: bytes, offset: int, count: int) -> array:
+    values = array(typecode)
+    values.frombytes(data[offset : offset + count * values.itemsize])
+    if len(values) != count:
+        raise ValueError("Measurement binary file is truncated.")
+    if sys.byteorder == "big":  # pragma: no cover
+        values.byteswap()
+    return values
+
+
+def write_measurement_binary(document: dict, binary_file: Union[str, os.PathLike]):
+    """Write a measurement document, as exported to JSON, in the
+    binary format.
+
+    Measurements without a name or expressions, and expressions
+    without a name, type or value, are left out with a warning;
+    they hold no named range values."""
+    strings = _StringTable()
+    floats = array("d")
+    measurement_names = array("I")
+    expression_counts = array("I")
+    columns: Dict[str, array] = {
+        "names": array("I"),
+        "types": array("I"),
+        "units": array("I"),
+        "encodings": array("B"),
+        "offsets": array("I"),
+        "sizes": array("I"),
+    }
+
+    for measurement in document.get("measurements", []):
+        if not (
+            isinstance(measurement, dict)
+            and isinstance(measurement.get("name"), str)
+            and isinstance(measurement.get("expressions"), list)
+        ):
+            logger.warning(f"{measurement} is missing name and/or expressions")
+            continue
+        measurement_names.append(strings.add(measurement["name"]))
+        count: int = 0
+        for expr in measurement["expressions"]:
+            if not (
+                isinstance(expr, dict)
+                and isinstance(expr.get("name"), str)
+                and isinstance(expr.get("type"), str)
+                and "value" in expr
+            ):
+                logger.warning(f"missing name/type/value fields in {expr}")
+                continue
+            count += 1
+            columns["names"].append(strings.add(expr["name"]))
+            columns["types"].append(strings.add(expr["type"]))
+            units: Any = expr.get("units")
+            columns["units"].append(
+                strings.add(units) if isinstance(units, str) else NO_STRING
+            )
+            encoding, offset, size = _encode_value(expr["value"], strings, floats)
+            columns["encodings"].append(encoding)
+            columns["offsets"].append(offset)
+            columns["sizes"].append(size)
+        expression_counts.append(count)
+
+    metadata: bytes = b""
+    if "METADATA" in document:
+        metadata = json.dumps(document["METADATA"]).encode("utf-8")
+
+    with open(binary_file, "wb") as binary_handle:
+        binary_handle.write(
+            HEADER.pack(
+                MAGIC,
+                VERSION,
+                0,
+                len(metadata),
+                len(strings.indices),
+                len(measurement_names),
+                len(columns["names"]),
+                len(floats),
+            )
+        )
+        binary_handle.write(metadata)
+        binary_handle.write(_to_bytes(strings.offsets))
+        binary_handle.write(strings.data)
+        for column in [measurement_names, expression_counts, *columns.values()]:
+            binary_handle.write(_to_bytes(column))
+        binary_handle.write(_to_bytes(floats))
+
+
+def load_measurement_binary(binary_file: Union[str, os.PathLike]) -> dict:
+    """Read a binary measurement file back into the document written.
+
+    Raises ValueError if the file isn't a measurement binary file
+    of a supported version, or is truncated."""
+    with open(binary_file, "rb") as binary_handle:
+        data: bytes = binary_handle.read()
+    if len(data) < HEADER.size or data[:4] != MAGIC:
+        raise ValueError(f"{binary_file} is not a measurement binary file.")
+    (
+        _,
+        version,
+        _,
+        metadata_size,
+        string_count,
+        measurement_count,
+        expression_count,
+        float_count,
+    ) = HEADER.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported measurement binary version {version}.")
+
+    position: int = HEADER.size
+    metadata: bytes = data[position : position + metadata_size]
+    position += metadata_size
+    string_offsets = _from_bytes("I", data, position, string_count + 1)
+    position += string_offsets.itemsize * len(string_offsets)
+    string_data: bytes = data[position : position + string_offsets[-1]]
+    if len(string_data) != string_offsets[-1]:
+        raise ValueError("Measurement binary file is truncated.")
+    position += len(string_data)
+    strings: List[str] = [
+        string_data[start:end].decode("utf-8")
+        for start, end in zip(string_offsets, string_offsets[1:])
+    ]
+
+    def _column(typecode: str, count: int) -> array:
+        nonlocal position
+        values = _from_bytes(typecode, data, position, count)
+        position += values.itemsize * count
+        return values
+
+    measurement_names = _column("I", measurement_count)
+    expression_counts = _column("I", measurement_count)
+    names = _column("I", expression_count)
+    types = _column("I", expression_count)
+    units = _column("I", expression_count)
+    encodings = _column("B", expression_count)
+    offsets = _column("I", expression_count)
+    sizes = _column("I", expression_count)
+    floats = _column("d", float_count)
+
+    # decode one expression per row of the columns
+    values: List[Any] = []
+    float_list: List[float] = floats.tolist()
+    for encoding, offset, size in zip(encodings, offsets, sizes):
+        if encoding == ENCODING_FLOAT:
+            values.append(float_list[offset])
+        elif encoding == ENCODING_XYZ:
+            values.append(dict(zip(XYZ, float_list[offset : offset + 3])))
+        elif encoding == ENCODING_FLOATS:
+            values.append(float_list[offset : offset + size])
+        elif encoding == ENCODING_STRING:
+            values.append(strings[offset])
+        else:
+            values.append(json.loads(strings[offset]))
+    expressions: List[dict] = []
+    for name, expr_type, unit, value in zip(names, types, units, values):
+        if unit == NO_STRING:
+            expressions.append(
+                {"name": strings[name], "type": strings[expr_type], "value": value}
+            )
+        else:
+            expressions.append(
+                {
+                    "name": strings[name],
+                    "type": strings[expr_type],
+                    "units": strings[unit],
+                    "value": value,
+                }
+            )
+
+    measurements: List[dict] = []
+    first: int = 0
+    for name, count in zip(measurement_names, expression_counts):
+        measurements.append(
+            {"name": strings[name], "expressions": expressions[first : first + count]}
+        )
+        first += count
+
+    document: dict = {"measurements": measurements}
+    if metadata_size:
+        document["METADATA"] = json.loads(metadata.decode("utf-8"))
+    return document
+
+
+def convert_json_to_binary(
+    json_file: Union[str, os.PathLike],
+    binary_file: Optional[Union[str, os.PathLike]] = None,
+) -> str:
+    """Convert a JSON measurement export to the binary format, by
+    default next to it with BINARY_EXTENSION. Returns the new path."""
+    if binary_file is None:
+        binary_file = os.path.splitext(json_file)[0] + BINARY_EXTENSION
+    with open(json_file, "r") as json_handle:
+        document: Any = json.load(json_handle)
+    if not isinstance(document, dict):
+        raise TypeError(f"{json_file} is not a measurement document.")
+    write_measurement_binary(document, binary_file)
+    return str(binary_file)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: measurement_binary.py <file.json> [<file.dmb>]")
+        sys.exit(1)
+    print(convert_json_to_binary(*sys.argv[1:3]))
@@ -0,0 +1,275 @@
+"""
+Retention policy for the datum database.
+
+Every export is kept for keep_days. Older exports are thinned to the
+last export of each part revision in each week; the rest are pruned
+from source_history with their parameters.
+
+With only changed values stored, a value from a pruned export may
+still be the value of its key at a later export that is kept. Such
+values are moved to the first kept export after them, keeping the
+time they were measured, so every kept snapshot reads the same after
+pruning. Values changed again before that export are deleted.
+
+Exports are pruned chunk_exports at a time, each chunk in its own
+transaction, so other sessions never wait long for the write lock.
+Freed pages are returned to the file system by incremental vacuum
+steps between chunks, which needs auto_vacuum=INCREMENTAL; new
+databases are created that way by open_connection, and older ones
+are converted once by enable_incremental_vacuum.
+"""
+
+import datetime
+import logging
+import sqlite3
+import time
+from typing import List, NamedTuple, Optional
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+PRUNE_CHUNK_EXPORTS = 50  # exports pruned in each transaction
+PRUNE_PAUSE_SECONDS = 0.1  # pause between chunks for other writers
+VACUUM_PAGES = 1024  # pages freed by each incremental vacuum step
+AUTO_VACUUM_INCREMENTAL = 2  # PRAGMA auto_vacuum value
+
+
+class PruneReport(NamedTuple):
+    """What prune_history removed, or would remove in a dry run."""
+
+    exports: int  # source_history rows pruned
+    deleted: int  # parameter rows deleted
+    relinked: int  # parameter rows moved to a kept export
+    bytes: int  # bytes the file shrank by, estimated in a dry run
+    dry_run: bool
+
+
+def exports_to_prune(
+    connection: sqlite3.Connection,
+    keep_days: float,
+    now: Optional[datetime.datetime] = None,
+) -> List[int]:
+    """Ids of the exports older than keep_days that aren't the last of
+    their part revision in their week, oldest first. Exports without a
+    timestamp are never pruned."""
+    cutoff: datetime.datetime = (now or datetime.datetime.now()) - datetime.timedelta(
+        days=keep_days
+    )
+    cursor = connection.execute(
+        """--sql
+        SELECT id FROM (
+            SELECT id, retrieval_ts,
+                ROW_NUMBER() OVER (
+                    PARTITION BY part_name, part_rev, strftime('%Y-%W', retrieval_ts)
+                    ORDER BY retrieval_ts DESC, id DESC
+                ) AS row_number
+            FROM source_history
+            WHERE retrieval_ts IS NOT NULL
+        )
+        WHERE retrieval_ts < ? AND row_number > 1
+        ORDER BY retrieval_ts, id
+        """,
+        [cutoff.isoformat(" ")],
+    )
+    return [row[0] for row in cursor]
+
+
+def _plan_chunk(connection: sqlite3.Connection, export_ids: List[int]) -> None:
+    """Fill prune_rows with the parameters of the exports in
+    export_ids: kept_id is the kept export a row is moved to, or NULL
+    if the row is deleted.
+
+    A row is deleted if its key changed again, in the same part, at or
+    before the first kept export after it. Pruning earlier chunks
+    doesn't change the plan of a later one, so a dry run plans every
+    chunk without applying any."""
+    connection.execute("DELETE FROM prune_chunk")
+    connection.execute("DELETE FROM prune_rows")
+    connection.executemany(
+        "INSERT INTO prune_chunk (id) VALUES (?)", [[id] for id in export_ids]
+    )
+    # the first kept export of the same part after each pruned one
+    connection.execute(
+        """--sql
+        UPDATE prune_chunk SET kept_id = (
+            SELECT k.id FROM source_history e, source_history k
+            WHERE e.id = prune_chunk.id
+                AND k.part_name IS e.part_name
+                AND k.retrieval_ts >= e.retrieval_ts
+                AND k.id NOT IN prune_exports
+            ORDER BY k.retrieval_ts, k.id
+            LIMIT 1
+        )
+        """
+    )
+    connection.execute(
+        """--sql
+        INSERT INTO prune_rows (id, kept_id, next_time)
+        SELECT p.id, c.kept_id, (
+            SELECT n.generation_time
+            FROM parameters n JOIN source_history ns ON n.source_id = ns.id
+            WHERE n.param_key = p.param_key
+                AND ns.part_name IS s.part_name
+                AND (n.generation_time, n.id) > (p.generation_time, p.id)
+            ORDER BY n.generation_time, n.id
+            LIMIT 1
+        )
+        FROM prune_chunk c
+            JOIN parameters p ON p.source_id = c.id
+            JOIN source_history s ON s.id = c.id
+        """
+    )
+    connection.execute(
+        """--sql
+        UPDATE prune_rows SET kept_id = NULL
+        WHERE next_time IS NOT NULL AND (
+            kept_id IS NULL
+            OR next_time <= (SELECT retrieval_ts FROM source_history WHERE id = kept_id)
+        )
+        """
+    )
+
+
+def _apply_chunk(connection: sqlite3.Connection) -> None:
+    connection.execute(
+        """--sql
+        UPDATE parameters SET source_id = (
+            SELECT kept_id FROM prune_rows WHERE prune_rows.id = parameters.id
+        )
+        WHERE id IN (SELECT id FROM prune_rows WHERE kept_id IS NOT NULL)
+        """
+    )
+    connection.execute(
+        "DELETE FROM parameters "
+        "WHERE id IN (SELECT id FROM prune_rows WHERE kept_id IS NULL)"
+    )
+    connection.execute(
+        "DELETE FROM source_history WHERE id IN (SELECT id FROM prune_chunk)"
+    )
+
+
+def _file_bytes(connection: sqlite3.Connection, free: bool = True) -> int:
+    """Bytes of the pages of the database, or of the pages in use."""
+    page_size: int = connection.execute("PRAGMA page_size").fetchone()[0]
+    page_count: int = connection.execute("PRAGMA page_count").fetchone()[0]
+    if not free:
+        page_count -= connection.execute("PRAGMA freelist_count").fetchone()[0]
+    return page_size * page_count
+
+
+def _row_bytes(connection: sqlite3.Connection, table: str) -> float:
+    """Average bytes of a row of table, with its index entries.
+
+    Measured with the dbstat table where SQLite has it, else the whole
+    database is shared out by rows."""
+    num_rows: int = connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    if not num_rows:
+        return 0.0
+    try:
+        (table_bytes,) = connection.execute(
+            """--sql
+            SELECT SUM(pgsize) FROM dbstat
+            WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = ?)
+            """,
+            [table],
+        ).fetchone()
+    except sqlite3.OperationalError:  # SQLite built without dbstat
+        total_rows: int = connection.execute(
+            "SELECT (SELECT COUNT(*) FROM parameters) "
+            "+ (SELECT COUNT(*) FROM source_history)"
+        ).fetchone()[0]
+        return _file_bytes(connection, free=False) / total_rows
+    return (table_bytes or 0) / num_rows
+
+
+def enable_incremental_vacuum(connection: sqlite3.Connection) -> bool:
+    """Set auto_vacuum=INCREMENTAL on a database created without it.
+    This rebuilds the database with VACUUM, once, which locks it for
+    as long as copying the file takes. Returns True if it was
+    converted."""
+    mode: int = connection.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode == AUTO_VACUUM_INCREMENTAL:
+        return False
+    logger.info("Converting the database to incremental vacuum.")
+    connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    connection.execute("VACUUM")
+    return True
+
+
+def vacuum_step(connection: sqlite3.Connection, pages: Optional[int] = None) -> int:
+    """Return up to pages (default VACUUM_PAGES) free pages to the file
+    system, committing any open transaction first. Returns the number
+    of free pages left."""
+    # the pragma frees one page per step and returns no rows, so
+    # execute would stop after the first page; executescript runs it out
+    connection.executescript(f"PRAGMA incremental_vacuum({pages or VACUUM_PAGES})")
+    return connection.execute("PRAGMA freelist_count").fetchone()[0]
+
+
+def prune_history(
+    connection: sqlite3.Connection,
+    keep_days: float,
+    dry_run: bool = False,
+    now: Optional[datetime.datetime] = None,
+    chunk_exports: Optional[int] = None,
+) -> PruneReport:
+    """Prune the exports older than keep_days by the retention policy,
+    committing each chunk of chunk_exports (default PRUNE_CHUNK_EXPORTS)
+    exports and running a vacuum step after it. The connection must
+    not be in a transaction.
+
+    A dry run plans every chunk and reports what would be removed,
+    with the bytes estimated from the average size of a row, but
+    changes nothing."""
+    chunk_exports = chunk_exports or PRUNE_CHUNK_EXPORTS
+    export_ids: List[int] = exports_to_prune(connection, keep_days, now)
+    connection.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS prune_exports (id INTEGER PRIMARY KEY)"
+    )
+    connection.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS prune_chunk "
+        "(id INTEGER PRIMARY KEY, kept_id INTEGER)"
+    )
+    connection.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS prune_rows "
+        "(id INTEGER PRIMARY KEY, kept_id INTEGER, next_time TIMESTAMP)"
+    )
+    connection.execute("DELETE FROM prune_exports")
+    connection.executemany(
+        "INSERT INTO prune_exports VALUES (?)", [[id] for id in export_ids]
+    )
+    connection.commit()  # the temp tables don't lock the database
+
+    deleted: int = 0
+    relinked: int = 0
+    bytes_before: int = _file_bytes(connection)
+    parameter_bytes: float = _row_bytes(connection, "parameters")
+    source_bytes: float = _row_bytes(connection, "source_history")
+    if not dry_run:
+        enable_incremental_vacuum(connection)
+    for start in range(0, len(export_ids), chunk_exports):
+        with connection:
+            # the plan must not change before it is applied
+            connection.execute("BEGIN" if dry_run else "BEGIN IMMEDIATE")
+            _plan_chunk(connection, export_ids[start : start + chunk_exports])
+            chunk_deleted, chunk_relinked = connection.execute(
+                "SELECT COUNT(*) - COUNT(kept_id), COUNT(kept_id) FROM prune_rows"
+            ).fetchone()
+            if dry_run:
+                connection.rollback()
+            else:
+                _apply_chunk(connection)
+        deleted += chunk_deleted
+        relinked += chunk_relinked
+        if not dry_run:
+            vacuum_step(connection)
+            # longer than SQLite's busy handler waits between retries, so
+            # a session waiting to write gets the lock before the next chunk
+            time.sleep(PRUNE_PAUSE_SECONDS)
+
+    if dry_run:
+        reclaimed: float = deleted * parameter_bytes + len(export_ids) * source_bytes
+    else:
+        while vacuum_step(connection):
+            pass
+        reclaimed = bytes_before - _file_bytes(connection)
+    return PruneReport(len(export_ids), deleted, relinked, int(reclaimed), dry_run)
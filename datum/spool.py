@@ -0,0 +1,116 @@
+"""
+Append-only spool of exports from the NX journals.
+
+Writing to the database from NX waits while another export holds its
+lock, so the journal instead appends the metadata of each export as a
+line of JSON to a local spool file, which never waits on the database.
+ingest_spool loads the lines added since the last ingest into
+source_history, and records how far it read, the high-water mark, in
+the same transaction.
+
+Ingesting again is safe: lines before the mark are skipped, and an
+export already in source_history is found rather than added again,
+so a lost mark or a spool ingested twice doesn't duplicate rows.
+
+Only the standard library is used, so the NX journals can write the
+spool.
+"""
+
+import datetime
+import json
+import logging
+import os
+import sqlite3
+from typing import List, NamedTuple, Tuple, Union
+
+try:
+    from database import find_or_add_source
+except ModuleNotFoundError:
+    from datum.database import find_or_add_source
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+
+class IngestReport(NamedTuple):
+    """What one ingest_spool read from a spool file."""
+
+    records: int  # complete records read after the high-water mark
+    added: int  # exports not already in source_history
+    position: int  # new high-water mark, in bytes
+
+
+def append_record(spool_file: Union[str, os.PathLike], record: dict) -> None:
+    """Append a record to the spool as one line of JSON.
+
+    The line is written by a single write to a file opened for
+    appending, so it is never mixed with a record appended at the same
+    time. Values JSON can't encode, such as datetimes, are written as
+    their str()."""
+    line: bytes = (json.dumps(record, default=str) + "\n").encode("utf-8")
+    flags: int = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    spool_fd: int = os.open(spool_file, flags, 0o666)
+    try:
+        os.write(spool_fd, line)
+    finally:
+        os.close(spool_fd)
+
+
+def read_spool(
+    spool_file: Union[str, os.PathLike], position: int = 0
+) -> Tuple[List[dict], int]:
+    """Records of the complete lines after byte position, and the
+    position after the last of them. A line still being written is
+    left for the next read. Lines that aren't a JSON object are logged
+    and skipped."""
+    with open(spool_file, "rb") as spool:
+        spool.seek(position)
+        data: bytes = spool.read()
+    end: int = data.rfind(b"\n") + 1
+    records: List[dict] = []
+    for line in data[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = None
+        if isinstance(record, dict):
+            records.append(record)
+        else:
+            logger.warning(f"Skipped spool line that isn't a record: {line[:80]!r}")
+    return records, position + end
+
+
+def ingest_spool(
+    connection: sqlite3.Connection, spool_file: Union[str, os.PathLike]
+) -> IngestReport:
+    """Load the records added to a spool file since its high-water mark
+    into source_history, in the caller's transaction, so the records
+    and the new mark are committed together."""
+    spool_path: str = os.path.abspath(spool_file)
+    mark = connection.execute(
+        "SELECT position FROM spool_marks WHERE spool_path = ?", [spool_path]
+    ).fetchone()
+    position: int = mark[0] if mark else 0
+    if not os.path.isfile(spool_path):
+        return IngestReport(0, 0, position)
+    if os.path.getsize(spool_path) < position:
+        logger.warning(f"{spool_path} is shorter than when ingested, reading it all.")
+        position = 0
+
+    records, end = read_spool(spool_path, position)
+    changes: int = connection.total_changes
+    for record in records:
+        find_or_add_source(connection, record)
+    added: int = connection.total_changes - changes
+    connection.execute(
+        """--sql
+        INSERT OR REPLACE INTO spool_marks (spool_path, position, ingested_ts)
+        VALUES (?, ?, ?)
+        """,
+        [spool_path, end, datetime.datetime.now().isoformat(" ", "seconds")],
+    )
+    logger.info(
+        f"Ingested {len(records)} records from {spool_path}, {added} new exports."
+    )
+    return IngestReport(len(records), added, end)
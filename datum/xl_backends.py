@@ -0,0 +1,759 @@
+"""
+Workbook backends used to read and write named ranges.
+
+XlwingsWorkbook talks to a workbook that is open in Excel.
+OfflineWorkbook edits the defined names and cell values of an
+.xlsx file directly in its zip/XML parts, so updates can run
+on machines without Excel. Both implement WorkbookBackend.
+"""
+
+import datetime
+import io
+import logging
+import os
+import posixpath
+import re
+import shutil
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+import zipfile
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from pathlib import Path
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+try:
+    from typing import Protocol
+except ImportError:  # pragma: no cover
+    from typing_extensions import Protocol  # type: ignore
+
+import xlwings as xw
+
+try:
+    from xl_ranges import RangeAddress, column_index, column_letters
+except ModuleNotFoundError:
+    from datum.xl_ranges import RangeAddress, column_index, column_letters
+
+logger: logging.Logger = logging.getLogger(__name__)
+
+# permissions of new files, read once as os.umask can only be read by setting it
+_UMASK: int = os.umask(0)
+os.umask(_UMASK)
+
+# Open XML namespaces, relationship and content types
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+CONTENT_TYPES_NS = "http://schemas.openxmlformats.org/package/2006/content-types"
+XML_NS = "http://www.w3.org/XML/1998/namespace"
+OFFICE_DOCUMENT_REL = f"{REL_NS}/officeDocument"
+WORKSHEET_REL = f"{REL_NS}/worksheet"
+SHARED_STRINGS_REL = f"{REL_NS}/sharedStrings"
+STYLES_REL = f"{REL_NS}/styles"
+CALC_CHAIN_REL = f"{REL_NS}/calcChain"
+WORKSHEET_CONTENT_TYPE = (
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+)
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\r\n'
+EMPTY_WORKSHEET = (
+    f'{XML_DECLARATION}<worksheet xmlns="{MAIN_NS}" xmlns:r="{REL_NS}">'
+    '<dimension ref="A1"/><sheetData/>'
+    '<pageMargins left="0.7" right="0.7" top="0.75" bottom="0.75" '
+    'header="0.3" footer="0.3"/></worksheet>'
+).encode("utf-8")
+
+# Number formats Excel displays as dates, see ECMA-376 18.8.30
+BUILTIN_DATE_FORMATS = set(range(14, 23)) | {45, 46, 47}
+# Elements that must follow calcPr in workbook.xml
+AFTER_CALC_PR = [
+    "oleSize",
+    "customWorkbookViews",
+    "pivotCaches",
+    "smartTagPr",
+    "smartTagTypes",
+    "webPublishing",
+    "fileRecoveryPr",
+    "webPublishObjects",
+    "extLst",
+]
+INVALID_SHEET_CHARS = re.compile(r"[\[\]:*?/\\]")
+
+
+def _tag(name: str, namespace: str = MAIN_NS) -> str:
+    return f"{{{namespace}}}{name}"
+
+
+class Recalculation:
+    """Time spent recalculating once updates are resumed."""
+
+    def __init__(self) -> None:
+        self.seconds: float = 0.0
+
+
+class WorkbookBackend(Protocol):
+    """Operations the named range functions need from a workbook.
+
+    Rows and columns are 1-based. com_calls counts round trips to
+    Excel, and stays at 0 for backends that don't use COM."""
+
+    name: str
+    fullname: str
+    com_calls: int
+
+    def names(self) -> Dict[str, str]:
+        """Return a dict of name: refers_to, e.g. "=Sheet1!$A$1"."""
+
+    def read_range(self, address: RangeAddress) -> List[list]:
+        """Return the values of a range as a list of rows."""
+
+    def write_range(self, sheet: str, row: int, column: int, values: List[list]):
+        """Write a list of rows with its top left cell at (row, column)."""
+
+    def read_name(self, name: str) -> Any:
+        """Read a name that doesn't refer to a single contiguous range."""
+
+    def write_name(self, name: str, value: Any) -> None:
+        """Write a name that doesn't refer to a single contiguous range."""
+
+    def add_sheet(self, sheet: str) -> None:
+        """Add an empty sheet, replacing any existing sheet with that name."""
+
+    def save(self, path: Optional[Union[str, Path]] = None) -> None:
+        """Save the workbook, or save a copy of it to path."""
+
+    def suspend_updates(self) -> ContextManager[Recalculation]:
+        """Context for bulk writes: recalculation and redrawing are held
+        until the context exits, and timed recalculation is reported."""
+
+
+def replace_file(temp_path: Union[str, Path], target: Union[str, Path]) -> None:
+    """Move a temporary file over target in one step. mkstemp creates
+    files readable only by their owner, so the file is given the
+    permissions of target, or of a new file if there is none."""
+    if os.path.exists(target):
+        shutil.copymode(target, temp_path)
+    else:
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+    os.replace(temp_path, target)
+
+
+def is_workbook_path(workbook: Any) -> bool:
+    """True if workbook is a path to a file rather than a workbook object."""
+    return isinstance(workbook, (str, os.PathLike))
+
+
+def open_workbook(workbook: Any) -> WorkbookBackend:
+    """Return a backend for a workbook.
+
+    Keyword arguments:
+    workbook -- path to an .xlsx file, xlwings Book, or a backend
+    """
+    if is_workbook_path(workbook):
+        return OfflineWorkbook(workbook)
+    if hasattr(workbook, "write_range"):
+        return workbook
+    return XlwingsWorkbook(workbook)
+
+
+class XlwingsWorkbook:
+    """WorkbookBackend for a workbook open in Excel."""
+
+    def __init__(self, book: xw.main.Book) -> None:
+        self.book = book
+        self.com_calls: int = 0
+        self._sheets: Dict[str, xw.main.Sheet] = dict()
+        self._names: Dict[str, xw.main.Name] = dict()
+        self._suspended: bool = False
+
+    @property
+    def name(self) -> str:
+        return self.book.name
+
+    @property
+    def fullname(self) -> str:
+        return self.book.fullname
+
+    def _sheet(self, sheet: str) -> xw.main.Sheet:
+        if sheet not in self._sheets:
+            self._sheets[sheet] = self.book.sheets[sheet]
+            self.com_calls += 1
+        return self._sheets[sheet]
+
+    def _name(self, name: str) -> xw.main.Name:
+        if name not in self._names:
+            self._names[name] = self.book.names[name]
+            self.com_calls += 1
+        return self._names[name]
+
+    def names(self) -> Dict[str, str]:
+        names: Dict[str, str] = dict()
+        for named_range in self.book.names:
+            self._names[named_range.name] = named_range
+            names[named_range.name] = named_range.refers_to
+            self.com_calls += 2
+        return names
+
+    def read_range(self, address: RangeAddress) -> List[list]:
+        self.com_calls += 1
+        return (
+            self._sheet(address.sheet)
+            .range(
+                (address.first_row, address.first_col),
+                (address.last_row, address.last_col),
+            )
+            .options(ndim=2)
+            .value
+        )
+
+    def write_range(self, sheet: str, row: int, column: int, values: List[list]):
+        self.com_calls += 1
+        self._sheet(sheet).range(
+            (row, column), (row + len(values) - 1, column + len(values[0]) - 1)
+        ).value = values
+
+    def read_name(self, name: str) -> Any:
+        self.com_calls += 1
+        return self._name(name).refers_to_range.value
+
+    def write_name(self, name: str, value: Any) -> None:
+        self.com_calls += 1
+        self._name(name).refers_to_range.value = value
+
+    def add_sheet(self, sheet: str) -> None:
+        try:
+            self._sheets[sheet] = self.book.sheets.add(sheet)
+        except ValueError:  # sheet already exists
+            self.book.sheets[sheet].delete()
+            self._sheets[sheet] = self.book.sheets.add(sheet)
+            self.com_calls += 2
+        self.com_calls += 1
+
+    @contextmanager
+    def suspend_updates(self) -> Iterator[Recalculation]:
+        """Turn off screen updating, events and automatic calculation,
+        recalculating once at the end. The previous application state
+        is always restored. Nested contexts do nothing."""
+        recalculation = Recalculation()
+        if self._suspended:
+            yield recalculation
+            return
+
+        app: xw.main.App = self.book.app
+        screen_updating: bool = app.screen_updating
+        enable_events: bool = app.enable_events
+        calculation: str = app.calculation
+        app.screen_updating = False
+        app.enable_events = False
+        app.calculation = "manual"
+        self.com_calls += 6
+        self._suspended = True
+        try:
+            yield recalculation
+            # a workbook that was in manual mode is left for the user to calculate
+            if calculation != "manual":
+                start: float = time.perf_counter()
+                app.calculate()
+                recalculation.seconds = time.perf_counter() - start
+                self.com_calls += 1
+        finally:
+            self._suspended = False
+            app.calculation = calculation
+            app.enable_events = enable_events
+            app.screen_updating = screen_updating
+            self.com_calls += 3
+
+    def save(self, path: Optional[Union[str, Path]] = None) -> None:
+        if path is None:
+            self.book.save()
+            return
+
+        # Saving the open book to a new path would rename it,
+        # so copy the sheets into a new book instead
+        copy_wb: xw.main.Book = xw.Book()
+        for sheet in self.book.sheets:
+            sheet.copy(after=copy_wb.sheets[0])
+        # Delete the first blank sheet
+        copy_wb.sheets[0].delete()
+        copy_wb.save(path=path)
+        copy_wb.close()
+
+
+class OfflineWorkbook:
+    """WorkbookBackend that edits an .xlsx file without Excel.
+
+    The whole package is read into memory when opened. XML parts are
+    parsed when first needed, and only the parts that were changed are
+    serialized again on save; all other parts are copied byte for byte.
+
+    Written cells lose any formula they held. Dependent formulas keep
+    their cached results until Excel recalculates, so the workbook is
+    flagged for a full recalculation the next time it is opened."""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self.com_calls: int = 0
+        with zipfile.ZipFile(self.path) as archive:
+            self._infos: List[zipfile.ZipInfo] = archive.infolist()
+            self._parts: Dict[str, bytes] = {
+                info.filename: archive.read(info) for info in self._infos
+            }
+        self._trees: Dict[str, ET.Element] = dict()
+        self._namespaces: Dict[str, List[Tuple[str, str]]] = dict()
+        self._dirty: Set[str] = set()
+        self._cells: Dict[str, Dict[Tuple[int, int], ET.Element]] = dict()
+        self._rows: Dict[str, Dict[int, ET.Element]] = dict()
+        self._row_numbers: Dict[str, List[int]] = dict()
+        self._cells_written: bool = False
+        self._formulas_removed: bool = False
+        self._shared_strings: Optional[List[str]] = None
+        self._date_styles: Optional[Set[int]] = None
+
+        self._workbook_part: str = self._related_parts("", OFFICE_DOCUMENT_REL)[0]
+        workbook = self._tree(self._workbook_part)
+        workbook_rels: Dict[str, str] = self._relationships(self._workbook_part)
+        self._sheet_parts: Dict[str, str] = dict()
+        for sheet in workbook.iter(_tag("sheet")):
+            self._sheet_parts[sheet.get("name")] = workbook_rels[
+                sheet.get(_tag("id", REL_NS))
+            ]
+        workbook_pr = workbook.find(_tag("workbookPr"))
+        self._date1904: bool = workbook_pr is not None and workbook_pr.get(
+            "date1904"
+        ) in ("1", "true")
+
+    @property
+    def name(self) -> str:
+        return self.path.name
+
+    @property
+    def fullname(self) -> str:
+        return str(self.path.resolve())
+
+    #######################
+    #### XML PLUMBING #####
+    #######################
+    def _tree(self, part: str) -> ET.Element:
+        """Parsed root element of a part, keeping track of the
+        namespace declarations it was written with."""
+        if part not in self._trees:
+            parser = ET.iterparse(io.BytesIO(self._parts[part]), events=("start-ns",))
+            self._namespaces[part] = [namespace for _, namespace in parser]
+            self._trees[part] = parser.root
+        return self._trees[part]
+
+    def _serialize(self, part: str) -> bytes:
+        namespaces: List[Tuple[str, str]] = self._namespaces.get(part, [])
+        # reuse the original prefixes; the default namespace is set last
+        for prefix, uri in namespaces:
+            if prefix:
+                ET.register_namespace(prefix, uri)
+        for prefix, uri in namespaces:
+            if not prefix:
+                ET.register_namespace("", uri)
+        xml: str = ET.tostring(self._trees[part], encoding="unicode")
+        # ElementTree drops declarations it doesn't use, but prefixes named
+        # in attributes such as mc:Ignorable still need to be declared
+        start_tag: str = xml[: xml.index(">")]
+        missing: str = "".join(
+            f' xmlns:{prefix}="{uri}"'
+            for prefix, uri in dict(namespaces).items()
+            if prefix and f"xmlns:{prefix}=" not in start_tag
+        )
+        tag_end: int = re.match(r"<[^\s>/]+", xml).end()
+        return (XML_DECLARATION + xml[:tag_end] + missing + xml[tag_end:]).encode(
+            "utf-8"
+        )
+
+    @staticmethod
+    def _rels_part(part: str) -> str:
+        directory, file_name = posixpath.split(part)
+        return posixpath.join(directory, "_rels", f"{file_name}.rels")
+
+    def _relationships(self, part: str) -> Dict[str, str]:
+        """Relationship id: target part for the relationships of a part."""
+        rels_part: str = self._rels_part(part)
+        if rels_part not in self._parts:
+            return dict()
+        relationships: Dict[str, str] = dict()
+        for rel in self._tree(rels_part):
+            if rel.get("TargetMode") == "External":
+                continue
+            target: str = rel.get("Target")
+            if target.startswith("/"):
+                target = target[1:]
+            else:
+                target = posixpath.normpath(
+                    posixpath.join(posixpath.dirname(part), target)
+                )
+            relationships[rel.get("Id")] = target
+        return relationships
+
+    def _related_parts(self, part: str, rel_type: str) -> List[str]:
+        rels_part: str = self._rels_part(part)
+        if rels_part not in self._parts:
+            return []
+        relationships: Dict[str, str] = self._relationships(part)
+        return [
+            relationships[rel.get("Id")]
+            for rel in self._tree(rels_part)
+            if rel.get("Type") == rel_type and rel.get("Id") in relationships
+        ]
+
+    def _sheet_part(self, sheet: str) -> str:
+        if sheet not in self._sheet_parts:
+            raise KeyError(f"No sheet named {sheet} in {self.name}")
+        part: str = self._sheet_parts[sheet]
+        if part not in self._cells:
+            self._index_cells(part)
+        return part
+
+    def _index_cells(self, part: str) -> None:
+        """Index the rows and cells of a worksheet by position.
+        Missing (optional) r attributes are filled in."""
+        rows: Dict[int, ET.Element] = dict()
+        cells: Dict[Tuple[int, int], ET.Element] = dict()
+        row_number: int = 0
+        for row in self._tree(part).find(_tag("sheetData")):
+            row_number = int(row.get("r", row_number + 1))
+            row.set("r", str(row_number))
+            rows[row_number] = row
+            col: int = 0
+            for cell in row.iter(_tag("c")):
+                reference: Optional[str] = cell.get("r")
+                if reference is None:
+                    col += 1
+                    cell.set("r", f"{column_letters(col)}{row_number}")
+                else:
+                    col = column_index(re.match(r"[A-Za-z]+", reference)[0])
+                cells[row_number, col] = cell
+        self._rows[part] = rows
+        self._row_numbers[part] = sorted(rows)
+        self._cells[part] = cells
+
+    ########################
+    ###### CELL VALUES #####
+    ########################
+    def _load_shared_strings(self) -> List[str]:
+        if self._shared_strings is None:
+            self._shared_strings = []
+            for part in self._related_parts(self._workbook_part, SHARED_STRINGS_REL):
+                for item in self._tree(part):
+                    # plain text is in <t>, rich text in <r><t>; skip <rPh>
+                    text: List[str] = [
+                        element.text or ""
+                        for child in item
+                        if child.tag in (_tag("t"), _tag("r"))
+                        for element in child.iter(_tag("t"))
+                    ]
+                    self._shared_strings.append("".join(text))
+        return self._shared_strings
+
+    def _load_date_styles(self) -> Set[int]:
+        """Indices of cell styles with a date number format."""
+        if self._date_styles is None:
+            self._date_styles = set()
+            for part in self._related_parts(self._workbook_part, STYLES_REL):
+                styles = self._tree(part)
+                date_formats: Set[int] = set(BUILTIN_DATE_FORMATS)
+                for number_format in styles.iter(_tag("numFmt")):
+                    if is_date_format(number_format.get("formatCode", "")):
+                        date_formats.add(int(number_format.get("numFmtId")))
+                cell_xfs = styles.find(_tag("cellXfs"))
+                if cell_xfs is None:
+                    continue
+                for index, xf in enumerate(cell_xfs):
+                    if int(xf.get("numFmtId", 0)) in date_formats:
+                        self._date_styles.add(index)
+        return self._date_styles
+
+    def _date_origin(self) -> datetime.datetime:
+        if self._date1904:
+            return datetime.datetime(1904, 1, 1)
+        return datetime.datetime(1899, 12, 30)
+
+    def _cell_value(self, cell: Optional[ET.Element]) -> Any:
+        if cell is None:
+            return None
+        cell_type: str = cell.get("t", "n")
+        if cell_type == "inlineStr":
+            inline = cell.find(_tag("is"))
+            if inline is None:
+                return None
+            return "".join(t.text or "" for t in inline.iter(_tag("t")))
+        value = cell.find(_tag("v"))
+        if value is None or value.text is None:
+            return None
+        if cell_type == "s":
+            return self._load_shared_strings()[int(value.text)]
+        if cell_type == "str":
+            return value.text
+        if cell_type == "b":
+            return value.text == "1"
+        if cell_type == "e":
+            return None
+        number: float = float(value.text)
+        if int(cell.get("s", 0)) in self._load_date_styles():
+            return self._date_origin() + datetime.timedelta(
+                milliseconds=round(number * 86400000)
+            )
+        return number
+
+    def _new_cell(self, part: str, row: int, col: int) -> ET.Element:
+        row_element: Optional[ET.Element] = self._rows[part].get(row)
+        if row_element is None:
+            row_element = ET.Element(_tag("row"), {"r": str(row)})
+            position: int = bisect_left(self._row_numbers[part], row)
+            self._tree(part).find(_tag("sheetData")).insert(position, row_element)
+            insort(self._row_numbers[part], row)
+            self._rows[part][row] = row_element
+        # spans is an optional hint that may no longer be accurate
+        row_element.attrib.pop("spans", None)
+
+        cell = ET.Element(_tag("c"), {"r": f"{column_letters(col)}{row}"})
+        columns: List[int] = [
+            column_index(re.match(r"[A-Za-z]+", existing.get("r"))[0])
+            for existing in row_element.iter(_tag("c"))
+        ]
+        row_element.insert(bisect_left(columns, col), cell)
+        self._cells[part][row, col] = cell
+        return cell
+
+    def _set_cell(self, part: str, row: int, col: int, value: Any) -> None:
+        cell: Optional[ET.Element] = self._cells[part].get((row, col))
+        if cell is None:
+            cell = self._new_cell(part, row, col)
+        formula = cell.find(_tag("f"))
+        if formula is not None:
+            if formula.get("ref") is not None:
+                raise ValueError(
+                    f"Cell {cell.get('r')} holds a shared or array formula "
+                    "and cannot be overwritten offline."
+                )
+            self._formulas_removed = True
+        for child in list(cell):
+            cell.remove(child)
+        cell.attrib.pop("t", None)
+
+        if value is None:
+            return
+        if isinstance(value, bool):
+            cell.set("t", "b")
+            ET.SubElement(cell, _tag("v")).text = "1" if value else "0"
+        elif isinstance(value, (int, float)):
+            ET.SubElement(cell, _tag("v")).text = repr(value)
+        elif isinstance(value, datetime.datetime):
+            serial: float = (value - self._date_origin()) / datetime.timedelta(days=1)
+            ET.SubElement(cell, _tag("v")).text = repr(serial)
+        elif isinstance(value, str):
+            cell.set("t", "inlineStr")
+            text = ET.SubElement(ET.SubElement(cell, _tag("is")), _tag("t"))
+            text.text = value
+            if value != value.strip():
+                text.set(_tag("space", XML_NS), "preserve")
+        else:
+            raise TypeError(f"Cannot write value of type {type(value)}")
+
+    #######################
+    ### BACKEND METHODS ###
+    #######################
+    def names(self) -> Dict[str, str]:
+        workbook = self._tree(self._workbook_part)
+        sheet_names: List[str] = list(self._sheet_parts)
+        names: Dict[str, str] = dict()
+        for defined_name in workbook.iter(_tag("definedName")):
+            name: str = defined_name.get("name")
+            local_sheet: Optional[str] = defined_name.get("localSheetId")
+            if local_sheet is not None:
+                # sheet scoped names are reported as Sheet!name, like xlwings
+                sheet: str = sheet_names[int(local_sheet)]
+                if not re.fullmatch(r"\w+", sheet):
+                    sheet = "'" + sheet.replace("'", "''") + "'"
+                name = f"{sheet}!{name}"
+            names[name] = "=" + (defined_name.text or "")
+        return names
+
+    def read_range(self, address: RangeAddress) -> List[list]:
+        cells = self._cells[self._sheet_part(address.sheet)]
+        return [
+            [
+                self._cell_value(cells.get((row, col)))
+                for col in range(address.first_col, address.last_col + 1)
+            ]
+            for row in range(address.first_row, address.last_row + 1)
+        ]
+
+    def write_range(self, sheet: str, row: int, column: int, values: List[list]):
+        part: str = self._sheet_part(sheet)
+        for row_offset, row_values in enumerate(values):
+            for col_offset, value in enumerate(row_values):
+                self._set_cell(part, row + row_offset, column + col_offset, value)
+        self._dirty.add(part)
+        self._cells_written = True
+
+    def read_name(self, name: str) -> Any:
+        logger.error(f"Name {name} is not a single range; cannot read it offline.")
+        return None
+
+    def write_name(self, name: str, value: Any) -> None:
+        logger.error(f"Name {name} is not a single range; cannot write it offline.")
+
+    def add_sheet(self, sheet: str) -> None:
+        if len(sheet) > 31 or INVALID_SHEET_CHARS.search(sheet):
+            raise ValueError(f"Invalid sheet name {sheet}")
+
+        if sheet in self._sheet_parts:
+            # keep the existing part, but clear everything in it
+            part: str = self._sheet_parts[sheet]
+            self._parts[part] = EMPTY_WORKSHEET
+            self._trees.pop(part, None)
+            self._cells.pop(part, None)
+            self._dirty.add(part)
+            return
+
+        workbook_dir: str = posixpath.dirname(self._workbook_part)
+        number: int = 1
+        while posixpath.join(workbook_dir, f"worksheets/sheet{number}.xml") in (
+            self._parts
+        ):
+            number += 1
+        part = posixpath.join(workbook_dir, f"worksheets/sheet{number}.xml")
+        self._parts[part] = EMPTY_WORKSHEET
+
+        rels_part: str = self._rels_part(self._workbook_part)
+        rels = self._tree(rels_part)
+        rel_ids: Set[str] = {rel.get("Id") for rel in rels}
+        rel_number: int = len(rel_ids) + 1
+        while f"rId{rel_number}" in rel_ids:
+            rel_number += 1
+        ET.SubElement(
+            rels,
+            _tag("Relationship", PKG_REL_NS),
+            {
+                "Id": f"rId{rel_number}",
+                "Type": WORKSHEET_REL,
+                "Target": f"worksheets/sheet{number}.xml",
+            },
+        )
+
+        ET.SubElement(
+            self._tree("[Content_Types].xml"),
+            _tag("Override", CONTENT_TYPES_NS),
+            {"PartName": f"/{part}", "ContentType": WORKSHEET_CONTENT_TYPE},
+        )
+
+        sheets = self._tree(self._workbook_part).find(_tag("sheets"))
+        sheet_id: int = 1 + max([int(s.get("sheetId")) for s in sheets] + [0])
+        ET.SubElement(
+            sheets,
+            _tag("sheet"),
+            {
+                "name": sheet,
+                "sheetId": str(sheet_id),
+                _tag("id", REL_NS): f"rId{rel_number}",
+            },
+        )
+        self._sheet_parts[sheet] = part
+        self._dirty.update([rels_part, "[Content_Types].xml", self._workbook_part])
+
+    @contextmanager
+    def suspend_updates(self) -> Iterator[Recalculation]:
+        """Nothing is calculated offline; Excel recalculates on open."""
+        yield Recalculation()
+
+    def save(self, path: Optional[Union[str, Path]] = None) -> None:
+        if self._formulas_removed:
+            self._remove_calc_chain()
+        if self._cells_written:
+            self._set_full_calc_on_load()
+        for part in self._dirty:
+            if part in self._cells:
+                self._update_dimension(part)
+            self._parts[part] = self._serialize(part)
+        self._dirty.clear()
+
+        target: Path = self.path if path is None else Path(path)
+        known_parts: Set[str] = {info.filename for info in self._infos}
+        infos: List[zipfile.ZipInfo] = [
+            info for info in self._infos if info.filename in self._parts
+        ] + [
+            zipfile.ZipInfo(part, datetime.datetime.now().timetuple()[:6])
+            for part in self._parts
+            if part not in known_parts
+        ]
+        # write to a temporary file first so a failed save can't
+        # leave a half written workbook behind
+        handle, temp_path = tempfile.mkstemp(suffix=".xlsx", dir=target.parent)
+        os.close(handle)
+        try:
+            with zipfile.ZipFile(temp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+                for info in infos:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    archive.writestr(info, self._parts[info.filename])
+            replace_file(temp_path, target)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        if path is None:
+            self._infos = infos
+
+    def _update_dimension(self, part: str) -> None:
+        dimension = self._tree(part).find(_tag("dimension"))
+        cells = self._cells[part]
+        if dimension is None or not cells:
+            return
+        rows: List[int] = [row for row, _ in cells]
+        cols: List[int] = [col for _, col in cells]
+        first: str = f"{column_letters(min(cols))}{min(rows)}"
+        last: str = f"{column_letters(max(cols))}{max(rows)}"
+        dimension.set("ref", first if first == last else f"{first}:{last}")
+
+    def _set_full_calc_on_load(self) -> None:
+        """Ask Excel to recalculate formulas that depend on written cells."""
+        workbook = self._tree(self._workbook_part)
+        calc_pr = workbook.find(_tag("calcPr"))
+        if calc_pr is None:
+            calc_pr = ET.Element(_tag("calcPr"))
+            position: int = len(workbook)
+            for index, child in enumerate(workbook):
+                if child.tag in [_tag(name) for name in AFTER_CALC_PR]:
+                    position = index
+                    break
+            workbook.insert(position, calc_pr)
+        calc_pr.set("fullCalcOnLoad", "1")
+        self._dirty.add(self._workbook_part)
+
+    def _remove_calc_chain(self) -> None:
+        """The calculation chain lists formula cells; Excel rebuilds it,
+        but reports the file as corrupt if it names cells without formulas."""
+        for part in self._related_parts(self._workbook_part, CALC_CHAIN_REL):
+            self._parts.pop(part, None)
+            rels = self._tree(self._rels_part(self._workbook_part))
+            for rel in list(rels):
+                if rel.get("Type") == CALC_CHAIN_REL:
+                    rels.remove(rel)
+            content_types = self._tree("[Content_Types].xml")
+            for override in list(content_types):
+                if override.get("PartName") == f"/{part}":
+                    content_types.remove(override)
+            self._dirty.update(
+                [self._rels_part(self._workbook_part), "[Content_Types].xml"]
+            )
+        self._formulas_removed = False
+
+
+def is_date_format(format_code: str) -> bool:
+    """True if an Excel number format code displays a date or time."""
+    # ignore quoted text, [colors]/[conditions], escaped and padding characters
+    stripped: str = re.sub(r'"[^"]*"|\[[^\]]*\]|\\.|[_*].', "", format_code)
+    return re.search(r"[dmyhs]", stripped, re.IGNORECASE) is not None
@@ -6,125 +6,313 @@ Prior to use, the Excel document needs to have ranges named
 and ready to populate, which takes some time to setup
 the first time this is used.
 
-xlwings requires that Excel be open in order to run this code.
+Workbooks can be an xlwings Book open in Excel, or the path to an
+.xlsx file, which is edited directly without Excel.
 """
 
 # USER DEFINED PARAMETERS
 DATUM_DB = "datum.db"  # SQLite database file
+DATUM_SPOOL = "datum_spool.jsonl"  # Exports spooled by the NX journal for ingest
+DATUM_MANIFEST = "datum_manifest.json"  # Measurements a workbook uses, for NX
+DB_CACHE_KIB = 16384  # SQLite page cache size of each database connection
+DB_CHANGES_ONLY = True  # Only store parameters that changed since their last value
+DB_MIN_DIFF = 0.0001  # Minimum difference fraction for a value to be stored again
+DB_WRITE_QUEUE = 16  # Database writes queued by the console before updates wait
+DB_KEEP_DAYS = 90  # Days every export is kept; older ones keep one per revision a week
 BACKUP_DEFAULT = "."  # Default dir to for Excel backups
+BACKUP_STORE = ".datum_backups"  # Backup store, created inside the backup dir
+BACKUP_KEEP_LAST = 10  # Number of backups kept for each workbook
+BACKUP_MAX_AGE_DAYS = None  # Backups older than this are removed, None keeps all
 PREVIEW_MIN_DIFF = 0.0001  # Minimum difference fraction for preview of changes
 PREVEIW_NA_STRING = "-"  # String to display when no comparison available
+DUMP_CHUNK_ROWS = 10000  # Maximum rows written to Excel in a single dump call
+BULK_READ_MAX_CELLS = 1000000  # Maximum cells read from a sheet in a single call
+DOCUMENT_CACHE_SIZE = 4  # Number of parsed JSON measurement files kept in memory
 
 import datetime
+import functools
 import json
 import logging
 import logging.config
+import multiprocessing.util
+import os
 import sqlite3
+import tempfile
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from typing import List, Optional, Union
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
 
 import xlwings as xw
 
+try:
+    from backup_store import BackupEntry, BackupStore, wait_for_backups
+    from database import (
+        Database,
+        DatabaseWriter,
+        find_or_add_source,
+        is_packed,
+        open_connection,
+        pack_vector,
+        unpack_components,
+    )
+    from history import values_at
+    from json_stream import MissingKeyError, iter_json_array
+    from measurement_binary import BINARY_EXTENSION, load_measurement_binary
+    from xl_backends import WorkbookBackend, is_workbook_path, open_workbook
+    from xl_ranges import NameIndex, coalesce_cells, range_value
+except ModuleNotFoundError:
+    from datum.backup_store import BackupEntry, BackupStore, wait_for_backups
+    from datum.database import (
+        Database,
+        DatabaseWriter,
+        find_or_add_source,
+        is_packed,
+        open_connection,
+        pack_vector,
+        unpack_components,
+    )
+    from datum.history import values_at
+    from datum.json_stream import MissingKeyError, iter_json_array
+    from datum.measurement_binary import BINARY_EXTENSION, load_measurement_binary
+    from datum.xl_backends import WorkbookBackend, is_workbook_path, open_workbook
+    from datum.xl_ranges import NameIndex, coalesce_cells, range_value
+
 # logging set-up
-logging.config.fileConfig("logging.conf")
+# found next to the package, not in the working directory, as worker
+# processes of update_many_workbooks import this module after a `cd`
+LOGGING_CONF: str = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "logging.conf"
+)
+# keep the loggers of helper modules imported above enabled
+logging.config.fileConfig(LOGGING_CONF, disable_existing_loggers=False)
 logger: logging.Logger = logging.getLogger(__name__)
 
-########################
-## XLWINGS INTERFACES ##
-########################
+# Excel instance of a worker process in update_many_workbooks
+_worker_app: Optional[xw.App] = None
+
 
+class WorkbookSummary(NamedTuple):
+    """Result of updating one workbook with update_many_workbooks.
 
-def backup_workbook(workbook: xw.main.Book, backup_dir: str = BACKUP_DEFAULT) -> Path:
-    """Create a backup copy of the workbook.
-    Returns the path of the backup copy."""
-    # TODO: Make more robust naming convention
-    # TODO: Verify M365 files are backing up correctly
-    print(f"Backuping up {workbook.name}...")
-    wb_name: str = workbook.name.split(".xlsx")[0]
+    skipped lists source names that were not written, either because
+    the workbook has no such name or because the update failed."""
 
-    backup_path = Path(f"{backup_dir}\\{wb_name}_BACKUP.xlsx")
+    workbook: str
+    written: List[str]
+    skipped: List[str]
+    seconds: float
+    error: Optional[str] = None
 
-    # Open a new blank workbook
-    backup_wb: xw.main.Book = xw.Book()
 
-    # Copy sheets individually
-    for sheet in workbook.sheets:
-        sheet.copy(after=backup_wb.sheets[0])
+class MeasurementDocument(NamedTuple):
+    """A JSON measurement file, parsed once.
 
-    # Delete the first blank sheet
-    backup_wb.sheets[0].delete()
+    pairs holds the flattened range name: value pairs, as returned by
+    get_json_key_value_pairs, and measurements the raw measurement
+    dicts. Documents are shared through the cache of
+    load_measurement_document and must not be modified."""
 
-    # Save & close
-    backup_wb.save(path=backup_path)
-    backup_wb.close()
+    path: str
+    metadata: Optional[dict]
+    pairs: dict
+    measurements: List[dict]
 
-    return backup_path
 
+class WriteReport(NamedTuple):
+    """Summary of a batched named range write.
+
+    com_calls is the number of round trips to Excel the write made,
+    as counted by the workbook backend (0 for offline workbooks).
+    naive_com_calls is the count the same update costs in Excel when
+    written one range (and one list element) at a time with
+    write_named_range. Recalculation after the write is timed
+    separately from the write itself."""
+
+    ranges: int
+    cells: int
+    blocks: int
+    com_calls: int
+    naive_com_calls: int
+    write_seconds: float = 0.0
+    recalc_seconds: float = 0.0
+
+
+########################
+## XLWINGS INTERFACES ##
+########################
 
-def dump(workbook: xw.main.Book, json_file: str) -> None:
+
+def backup_workbook(
+    workbook: Union[xw.main.Book, WorkbookBackend, str],
+    backup_dir: str = BACKUP_DEFAULT,
+    background: bool = False,
+) -> Union[BackupEntry, Future]:
+    """Back up the saved workbook file to the backup store.
+
+    The file on disk is stored, so changes not yet saved in Excel
+    are not included. Workbooks that have never been saved are
+    copied to a temporary file first.
+
+    Keyword arguments:
+    workbook -- xlwings Book, workbook backend or .xlsx file path
+    backup_dir -- directory the backup store is kept in
+    background -- back up on the backup thread and return a Future
+    """
+    backend: WorkbookBackend = open_workbook(workbook)
+    print(f"Backing up {backend.name}...")
+    store: BackupStore = get_backup_store(backup_dir)
+
+    source = Path(backend.fullname)
+    if source.is_file():
+        if background:
+            return store.add_in_background(source, backend.name)
+        return store.add(source, backend.name)
+
+    handle, temp_path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(handle)
+    try:
+        backend.save(temp_path)
+        entry: BackupEntry = store.add(temp_path, backend.name)
+    finally:
+        os.remove(temp_path)
+    if background:
+        future: Future = Future()
+        future.set_result(entry)
+        return future
+    return entry
+
+
+def get_backup_store(backup_dir: str = BACKUP_DEFAULT) -> BackupStore:
+    """Backup store in backup_dir, with the configured retention policy."""
+    return BackupStore(
+        Path(backup_dir) / BACKUP_STORE, BACKUP_KEEP_LAST, BACKUP_MAX_AGE_DAYS
+    )
+
+
+def dump(
+    workbook: Union[xw.main.Book, WorkbookBackend, str],
+    json_file: Union[str, MeasurementDocument],
+) -> None:
     """Take data frome a dictionary of key-value pairs
     that originated from a JSON file, and place it in Excel
     in a new worksheet for easy access.
+
+    json_file may be a path or an already loaded MeasurementDocument.
+
+    The sheet is built as one rectangular array and written with
+    a single range assignment (or one per DUMP_CHUNK_ROWS rows),
+    with Excel's calculation and screen updates suspended.
+    A workbook given as a file path is saved afterwards.
     """
-    sheet_name: str = "DATUM " + json_file.split("\\")[-1]
     # get the data from the json_file
-    data = get_json_key_value_pairs(json_file)
-    if data is None:
+    document: Optional[MeasurementDocument] = as_measurement_document(json_file)
+    if document is None or not document.pairs:
         logger.error("No key-value pairs in JSON file to dump.")
     else:
-        # create a new worksheet
-        try:
-            workbook.sheets.add(sheet_name)
-        except ValueError:  # sheet already exists
-            workbook.sheets[sheet_name].delete()
-            workbook.sheets.add(sheet_name)
-
-        # keep count of rows added
-        current_row: int = 1
-
-        # dump metadata
-        metadata = load_metadata_from_json(json_file)
-        if metadata is not None:
-            for key in metadata:
-                target_range: str = f"A{current_row}:B{current_row}"
-                workbook.sheets[sheet_name].range(target_range).value = [
-                    key,
-                    metadata[key],
-                ]
-                current_row += 1
-            current_row += 1  # blank row
-
-        # create header row
-        target_range = f"A{current_row}:B{current_row}"
-        workbook.sheets[sheet_name].range(target_range).value = ["PARAMETER", "VALUE"]
-        current_row += 1
-
-        # add each key-value pair from the data
-        for index, key in enumerate(sorted(data)):
-            target_range = f"A{current_row + index}:B{current_row + index}"
-            workbook.sheets[sheet_name].range(target_range).value = list(
-                flatten_list([key, data[key]])
-            )
+        sheet_name: str = "DATUM " + document.path.replace("/", "\\").split("\\")[-1]
+        backend: WorkbookBackend = open_workbook(workbook)
+        rows: List[list] = build_dump_rows(document.pairs, document.metadata)
+        with backend.suspend_updates() as recalculation:
+            # create a new worksheet, replacing any previous dump
+            backend.add_sheet(sheet_name)
+            for first_row in range(0, len(rows), DUMP_CHUNK_ROWS):
+                backend.write_range(
+                    sheet_name,
+                    first_row + 1,
+                    1,
+                    rows[first_row : first_row + DUMP_CHUNK_ROWS],
+                )
+        logger.debug(f"Recalculated in {recalculation.seconds:.3f} s after dump.")
+        if is_workbook_path(workbook):
+            backend.save()
 
 
-def get_workbook_key_value_pairs(workbook: xw.main.Book) -> Optional[dict]:
-    """Find all named ranges in a workbook and return
-    a dictionary of name-value pairs."""
-    if len(workbook.names) == 0:
-        logger.error(f"workbook{workbook.name} has no named ranges.")
-        return None
-    # make a dict of named ranges, measurement names, and measurement types
-    workbook_named_ranges = dict()
-    for named_range in workbook.names:
+def build_dump_rows(data: dict, metadata: Optional[dict] = None) -> List[list]:
+    """Lay out the rows of a dump sheet as a rectangular 2D list.
+
+    Metadata key-value pairs come first, followed by a blank row,
+    a header row, and a row for each key in data with any list
+    values flattened. Short rows are padded with None."""
+    rows: List[list] = []
+    if metadata is not None:
+        for key in metadata:
+            rows.append([key, metadata[key]])
+        rows.append([])  # blank row
+
+    rows.append(["PARAMETER", "VALUE"])
+    for key in sorted(data):
+        rows.append(list(flatten_list([key, data[key]])))
+
+    width: int = max(len(row) for row in rows)
+    for row in rows:
+        row.extend([None] * (width - len(row)))
+
+    return rows
+
+
+def build_name_index(workbook: Union[xw.main.Book, WorkbookBackend, str]) -> NameIndex:
+    """Index the named ranges of a workbook by sheet and address.
+
+    Makes a single pass over the workbook's names; addresses are
+    parsed in Python rather than resolved through Excel."""
+    name_index = NameIndex()
+    for name, refers_to in open_workbook(workbook).names().items():
         # Sometimes Excel puts in hidden names that start
         # with _xlfn. -- skip these
-        if named_range.name.startswith("_xlfn."):
-            logger.debug(f"Skipping range {named_range.name}")
+        if name.startswith("_xlfn."):
+            logger.debug(f"Skipping range {name}")
             continue
-        if "!#REF" in named_range.refers_to:
-            logger.error(f"Name {named_range.name} has a #REF! error.")
+        if "!#REF" in refers_to:
+            logger.error(f"Name {name} has a #REF! error.")
+            name_index.broken.add(name)
             continue
-        workbook_named_ranges[named_range.name] = named_range.refers_to_range.value
+        name_index.add(name, refers_to, refers_to)
+
+    return name_index
+
+
+def get_workbook_key_value_pairs(
+    workbook: Union[xw.main.Book, WorkbookBackend, str],
+    name_index: Optional[NameIndex] = None,
+) -> Optional[dict]:
+    """Find all named ranges in a workbook and return
+    a dictionary of name-value pairs.
+
+    Values are read a sheet at a time: the range bounding all names
+    on a sheet is read in one call and each value is sliced out of it.
+
+    Keyword arguments:
+    workbook -- xlwings Book, workbook backend or .xlsx file path
+    name_index -- index from build_name_index, built if not given
+    """
+    backend: WorkbookBackend = open_workbook(workbook)
+    if name_index is None:
+        name_index = build_name_index(backend)
+    if len(name_index) == 0:
+        logger.error(f"workbook{backend.name} has no named ranges.")
+        return None
+
+    workbook_named_ranges = dict()
+    for sheet_name, names in name_index.sheets.items():
+        bounds = name_index.bounds(sheet_name)
+        if bounds.size > BULK_READ_MAX_CELLS:
+            # names are too spread out to read the whole area at once
+            logger.debug(f"Reading names on {sheet_name} individually")
+            for name in names:
+                workbook_named_ranges[name] = range_value(
+                    backend.read_range(name_index.addresses[name])
+                )
+            continue
+        block: List[list] = backend.read_range(bounds)
+        for name in names:
+            workbook_named_ranges[name] = name_index.slice_value(name, block, bounds)
+
+    # names that don't refer to a single contiguous range
+    for name in name_index.unparsed:
+        workbook_named_ranges[name] = backend.read_name(name)
 
     return workbook_named_ranges
 
@@ -149,59 +337,153 @@ def load_metadata_from_json(json_file: str) -> Optional[dict]:
         return None
 
 
-def write_named_range(
-    workbook: xw.main.Book,
-    range_name: str,
-    new_value: Optional[Union[list, float, int, str, datetime.datetime]],
-) -> Optional[Union[list, int, str, float, datetime.datetime]]:
-    """Write a value or list to a named range.
+def batch_write_named_ranges(
+    workbook: Union[xw.main.Book, WorkbookBackend, str],
+    new_values: dict,
+    name_index: Optional[NameIndex] = None,
+) -> WriteReport:
+    """Write values to many named ranges with as few COM calls as possible.
+
+    Every target address is resolved before anything is written, so
+    a bad name or value aborts the update without a partial write.
+    Cells are grouped by sheet and adjacent cells are merged into
+    rectangular blocks, each written with a single 2D assignment.
 
     Keyword arguments:
-    workbook -- xlwings Book object
-    range_name -- string with range name
-    new_value -- new value or list of values to write
+    workbook -- xlwings Book, workbook backend or .xlsx file path
+    new_values -- dict of range name: new value or list of values
+    name_index -- index from build_name_index, built if not given
     """
-    if range_name not in workbook.names:
-        raise KeyError(f"Name {range_name} not in {workbook.name}")
-    if "!#REF" in workbook.names[range_name].refers_to:
-        raise TypeError(f"Name {range_name} has a #REF! error.")
+    backend: WorkbookBackend = open_workbook(workbook)
+    calls_before: int = backend.com_calls
+    if name_index is None:
+        name_index = build_name_index(backend)
+
+    sheet_cells: Dict[str, Dict[Tuple[int, int], Any]] = defaultdict(dict)
+    fallback_ranges: dict = dict()
+    naive_com_calls: int = 0
+    num_cells: int = 0
+
+    for range_name, new_value in new_values.items():
+        if range_name not in name_index:
+            raise KeyError(f"Name {range_name} not in {backend.name}")
+        if range_name in name_index.broken:
+            raise TypeError(f"Name {range_name} has a #REF! error.")
+        address = name_index.addresses.get(range_name)
+
+        if address is None:
+            # multi-area or constant names can't be placed in a block
+            logger.debug(f"Writing {range_name} directly")
+            fallback_ranges[range_name] = new_value
+            continue
 
-    target_range: xw.main.Range = workbook.names[range_name].refers_to_range
+        cell_values: list = range_cell_values(range_name, new_value, address.size)
+        # membership, refers_to and refers_to_range, then one write per
+        # list element or a single write for a scalar
+        naive_com_calls += 3 + (len(cell_values) if isinstance(new_value, list) else 1)
+        num_cells += len(cell_values)
+        for index, value in enumerate(cell_values):
+            sheet_cells[address.sheet][address.cell(index)] = value
+
+    num_blocks: int = 0
+    for sheet_name, cells in sheet_cells.items():
+        for block in coalesce_cells(cells):
+            backend.write_range(sheet_name, block.row, block.column, block.values)
+            num_blocks += 1
+
+    for range_name, new_value in fallback_ranges.items():
+        if isinstance(new_value, list):
+            new_value = list(flatten_list(new_value))
+            range_cell_values(range_name, new_value, len(new_value))  # type check
+        else:
+            range_cell_values(range_name, new_value, 1)
+        backend.write_name(range_name, new_value)
+        num_cells += len(new_value) if isinstance(new_value, list) else 1
+        naive_com_calls += 3 + (len(new_value) if isinstance(new_value, list) else 1)
+        num_blocks += 1
+
+    return WriteReport(
+        len(new_values),
+        num_cells,
+        num_blocks,
+        backend.com_calls - calls_before,
+        naive_com_calls,
+    )
 
+
+def range_cell_values(
+    range_name: str,
+    new_value: Optional[Union[list, float, int, str, datetime.datetime]],
+    range_size: int,
+) -> list:
+    """Return the list of cell values that writing new_value to a range
+    of range_size cells produces, in row-by-row order.
+
+    Lists are flattened and truncated to fit the range; scalars fill
+    every cell of the range."""
     if isinstance(new_value, list):
         # Flatten any arbitrary list
         new_value = list(flatten_list(new_value))
         new_value_len: int = len(new_value)
-        if new_value_len > target_range.size:
+        if new_value_len > range_size:
             # Truncate input if range size is too small
-            new_value = new_value[: target_range.size]
-            logger.warning(f"range {target_range.name} has size {target_range.size}.")
+            new_value = new_value[:range_size]
+            logger.warning(f"range {range_name} has size {range_size}.")
             logger.warning(f"Vector of length {new_value_len} will be truncated.")
-        elif new_value_len < target_range.size:
+        elif new_value_len < range_size:
             # If range is too big, warn that not all cells will be populated
             logger.warning(
                 f"Range {range_name} of size\
-                {target_range.size} is larger than required."
+                {range_size} is larger than required."
             )
-        for index in range(min(target_range.size, new_value_len)):
+        for item in new_value:
             if (
-                not isinstance(
-                    new_value[index], (int, str, float, list, datetime.datetime)
-                )
-                and new_value[index] is not None
+                not isinstance(item, (int, str, float, list, datetime.datetime))
+                and item is not None
             ):
-                raise TypeError(f"Write {type(new_value[index])} not allowed.")
-            target_range[index].value = new_value[index]
+                raise TypeError(f"Write {type(item)} not allowed.")
         return new_value
     elif (
         isinstance(new_value, (int, str, float, datetime.datetime)) or new_value is None
     ):
-        target_range.value = new_value
-        return new_value
+        return [new_value] * range_size
     else:
         raise TypeError(f"Cannot write value of type {type(new_value)}")
 
 
+def write_named_range(
+    workbook: xw.main.Book,
+    range_name: str,
+    new_value: Optional[Union[list, float, int, str, datetime.datetime]],
+) -> Optional[Union[list, int, str, float, datetime.datetime]]:
+    """Write a value or list to a named range.
+
+    Writes one cell at a time; use batch_write_named_ranges
+    to update many ranges at once.
+
+    Keyword arguments:
+    workbook -- xlwings Book object
+    range_name -- string with range name
+    new_value -- new value or list of values to write
+    """
+    if range_name not in workbook.names:
+        raise KeyError(f"Name {range_name} not in {workbook.name}")
+    if "!#REF" in workbook.names[range_name].refers_to:
+        raise TypeError(f"Name {range_name} has a #REF! error.")
+
+    target_range: xw.main.Range = workbook.names[range_name].refers_to_range
+
+    if isinstance(new_value, list):
+        new_value = range_cell_values(range_name, new_value, target_range.size)
+        for index, value in enumerate(new_value):
+            target_range[index].value = value
+        return new_value
+    else:
+        range_cell_values(range_name, new_value, 1)  # type check only
+        target_range.value = new_value
+        return new_value
+
+
 #######################
 ###### UTILITIES ######
 #######################
@@ -235,14 +517,50 @@ def flatten_list(target_list: list):
             yield element
 
 
+def vector_components(value: Any) -> Optional[List[float]]:
+    """Components of a point, vector or matrix, in row-major order,
+    from a list, an array or a packed database value. None for any
+    other value."""
+    if is_packed(value):
+        return unpack_components(value)[1]
+    if hasattr(value, "tolist"):  # NumPy array
+        value = value.tolist()
+    if not isinstance(value, list):
+        return None
+    components: List[Any] = []
+    for item in value:
+        if isinstance(item, list):
+            item_components: Optional[List[float]] = vector_components(item)
+            if item_components is None:
+                return None
+            components.extend(item_components)
+        elif isinstance(item, (int, float)):
+            components.append(item)
+        else:
+            return None
+    return components
+
+
 def report_difference(
-    old_value: Optional[Union[int, float, str, datetime.datetime]],
-    new_value: Optional[Union[int, float, str, datetime.datetime]],
+    old_value: Optional[Union[int, float, str, datetime.datetime, list]],
+    new_value: Optional[Union[int, float, str, datetime.datetime, list]],
 ) -> Optional[Union[float, datetime.timedelta]]:
     """Report the difference between any two instances of
-    int, float, str, date or None. Return None if no numerical
+    int, float, str, date, vector or None. Return None if no numerical
     comparison can be made. Return percent difference for ints and floats.
-    Return timedelta for comparison of dates."""
+    Return timedelta for comparison of dates. Vectors of the same size
+    return the largest change of a component as a fraction of the
+    largest component of old_value."""
+    old_components: Optional[List[float]] = vector_components(old_value)
+    new_components: Optional[List[float]] = vector_components(new_value)
+    if old_components is not None and new_components is not None:
+        if len(old_components) != len(new_components) or not any(old_components):
+            return None
+        changes = [new - old for old, new in zip(old_components, new_components)]
+        scale: float = max(abs(component) for component in old_components)
+        return max(changes, key=abs) / scale
+    if old_components is not None or new_components is not None:
+        return None
     if old_value == 0:
         return None  # otherwise divide by zero error
     if isinstance(old_value, datetime.datetime) and isinstance(
@@ -260,11 +578,80 @@ def report_difference(
 ########################
 
 
+def load_measurement_document(
+    json_file: Union[str, Path]
+) -> Optional[MeasurementDocument]:
+    """Parse a JSON measurement file into a MeasurementDocument.
+    Files with BINARY_EXTENSION are read as measurement binary files.
+
+    Documents are cached by path, modification time and size, so
+    loading an unchanged file again returns the same document
+    without reading it. Errors are logged and None is returned."""
+    try:
+        file_stat: os.stat_result = os.stat(json_file)
+        return _parse_measurement_document(
+            os.path.abspath(json_file), file_stat.st_mtime_ns, file_stat.st_size
+        )
+    # TODO: Build JSON Validation function
+    except FileNotFoundError:
+        logger.error(f"Unable to open {json_file}")
+    except ValueError:  # includes JSONDecodeError
+        logger.error(f"Measurement file {json_file} is corrupt.")
+    except TypeError:
+        logger.warning("Not a dictionary.")
+    return None
+
+
+def as_measurement_document(
+    source: Union[str, Path, MeasurementDocument]
+) -> Optional[MeasurementDocument]:
+    """Load source if it is a path, or return the document given."""
+    if isinstance(source, (str, Path)):
+        return load_measurement_document(source)
+    return source
+
+
+@functools.lru_cache(maxsize=DOCUMENT_CACHE_SIZE)
+def _parse_measurement_document(
+    path: str, mtime_ns: int, size: int
+) -> MeasurementDocument:
+    """Read and flatten a measurement file in a single pass.
+    mtime_ns and size are only used as part of the cache key."""
+    if path.lower().endswith(BINARY_EXTENSION):
+        json_data: Any = load_measurement_binary(path)
+    else:
+        with open(path, "r") as json_handle:
+            json_data = json.load(json_handle)
+
+    measurements: List[dict] = []
+    metadata: Optional[dict] = None
+    if check_dict_keys(json_data, ["measurements"]):
+        measurements = json_data["measurements"]
+    else:
+        logger.warning(f'No "measurement" field in {path}')
+    if isinstance(json_data, dict) and "METADATA" in json_data:
+        metadata = json_data["METADATA"]
+    else:
+        logger.debug(f'No "METADATA" in {path}')
+
+    pairs: dict = dict()
+    for measurement in measurements:
+        pairs.update(measurement_key_value_pairs(measurement))
+
+    return MeasurementDocument(path, metadata, pairs, measurements)
+
+
 def get_json_key_value_pairs(json_file: str) -> Optional[dict]:
-    """Load JSON measurement dict from a JSON file."""
+    """Load JSON measurement dict from a JSON file.
+
+    Built on iter_json_measurements, so only one measurement is
+    decoded at a time; the returned dict holds the flattened values."""
+    json_named_measurements: dict = dict()
+    num_measurements: int = 0
     try:
-        with open(json_file, "r") as json_file_handle:
-            json_data: dict = json.load(json_file_handle)
+        for measurement in iter_json_measurements(json_file):
+            num_measurements += 1
+            json_named_measurements.update(measurement_key_value_pairs(measurement))
     # TODO: Build JSON Validation function
     except FileNotFoundError:
         logger.error(f"Unable to open {json_file}")
@@ -272,44 +659,63 @@ def get_json_key_value_pairs(json_file: str) -> Optional[dict]:
     except json.decoder.JSONDecodeError:
         logger.error(f"JSON file {json_file} is corrupt.")
         return None
+    except MissingKeyError:
+        logger.warning('Key "measurements" not found.')
+    except TypeError:
+        logger.warning("Not a dictionary.")
 
-    if not check_dict_keys(json_data, ["measurements"]):
+    if num_measurements == 0:
         logger.warning(f'No "measurement" field in {json_file}')
         return None
 
-    json_named_measurements: dict = dict()
-    for measurement in json_data["measurements"]:
-        if not check_dict_keys(measurement, ["name", "expressions"]):
-            logger.warning(f"{measurement} is missing name and/or expressions")
-            continue
+    return json_named_measurements
 
-        # replace spaces with underscores - no spaces allowed in excel range names
-        # TODO: Ensure all measurement names possible in NX are valid in Excel
-        measurement_name: str = measurement["name"].replace(" ", "_")
-        for expr in measurement["expressions"]:
-            if not check_dict_keys(expr, ["name", "type", "value"]):
-                logger.warning(f"missing name/type/value fields in {expr}")
-                continue
-            range_name: str = f"{measurement_name}.{expr['name']}"
-            if expr["type"] == "Point" or expr["type"] == "Vector":
-                vector: List[float] = []
-                for coordinate in ["x", "y", "z"]:
-                    coordinate_name: str = f"{range_name}.{coordinate}"
-                    json_named_measurements[coordinate_name] = expr["value"][coordinate]
-                    vector.append(expr["value"][coordinate])
-                # TODO: Keep dicts as dicts, don't conver them to vectors.
-                # Requires update of write_named_range to handle dicts.
-                # json_named_measurements[range_name] = expr["value"]
-                json_named_measurements[range_name] = vector
-            elif expr["type"] == "List":
-                json_named_measurements[range_name] = expr["value"]
-                for index in range(3):
-                    range_index = f"{range_name}.{index}"
-                    json_named_measurements[range_index] = expr["value"][index]
-            else:
-                json_named_measurements[range_name] = expr["value"]
 
-    return json_named_measurements
+def iter_json_measurements(json_file: str) -> Iterator[dict]:
+    """Yield the raw measurements of a JSON file one at a time.
+    Memory use is bounded by the largest single measurement."""
+    with open(json_file, "r") as json_file_handle:
+        yield from iter_json_array(json_file_handle, "measurements")
+
+
+def iter_json_key_value_pairs(json_file: str) -> Iterator[Tuple[str, Any]]:
+    """Yield (range name, value) pairs from a JSON file, reading
+    one measurement at a time. Errors are raised, not logged."""
+    for measurement in iter_json_measurements(json_file):
+        yield from measurement_key_value_pairs(measurement)
+
+
+def measurement_key_value_pairs(measurement: dict) -> Iterator[Tuple[str, Any]]:
+    """Yield the (range name, value) pairs of a single measurement."""
+    if not check_dict_keys(measurement, ["name", "expressions"]):
+        logger.warning(f"{measurement} is missing name and/or expressions")
+        return
+
+    # replace spaces with underscores - no spaces allowed in excel range names
+    # TODO: Ensure all measurement names possible in NX are valid in Excel
+    measurement_name: str = measurement["name"].replace(" ", "_")
+    for expr in measurement["expressions"]:
+        if not check_dict_keys(expr, ["name", "type", "value"]):
+            logger.warning(f"missing name/type/value fields in {expr}")
+            continue
+        range_name: str = f"{measurement_name}.{expr['name']}"
+        if expr["type"] == "Point" or expr["type"] == "Vector":
+            vector: List[float] = []
+            for coordinate in ["x", "y", "z"]:
+                coordinate_name: str = f"{range_name}.{coordinate}"
+                yield coordinate_name, expr["value"][coordinate]
+                vector.append(expr["value"][coordinate])
+            # TODO: Keep dicts as dicts, don't conver them to vectors.
+            # Requires update of write_named_range to handle dicts.
+            # yield range_name, expr["value"]
+            yield range_name, vector
+        elif expr["type"] == "List":
+            yield range_name, expr["value"]
+            for index in range(3):
+                range_index = f"{range_name}.{index}"
+                yield range_index, expr["value"][index]
+        else:
+            yield range_name, expr["value"]
 
 
 def preview_named_range_update(
@@ -412,7 +818,11 @@ def print_columns(
 
 
 def update_named_ranges(
-    source: Union[str, dict], target: xw.main.Book, backup: bool = False
+    source: Union[str, dict, MeasurementDocument],
+    target: Union[xw.main.Book, WorkbookBackend, str],
+    backup: bool = False,
+    confirm: bool = True,
+    database: Optional[Union[Database, DatabaseWriter]] = None,
 ) -> Optional[dict]:
     """
     Open a JSON file and an excel file. Update the named
@@ -422,25 +832,32 @@ def update_named_ranges(
     For example, the measurement SURFACE_SPHERICAL has an expression
     of type "area", along with other expressions. To populate this in
     Excel, we need to name the range "SURFACE_SPHERICAL.area"
+
+    source may be a JSON file path, a loaded MeasurementDocument or
+    a dict of range name: value (the undo buffer). target may be an
+    open xlwings Book or the path to an .xlsx file, which is saved
+    once the update is written. With confirm=False the preview and
+    prompt are skipped. Parameters are written to database if given,
+    e.g. the writer of a console session, else to DATUM_DB.
     """
-    # Assume target is open excel worksheet
-    # TODO: Implement ability to take .xlsx file path as argument
-    target_data: Optional[dict] = get_workbook_key_value_pairs(target)
+    workbook: WorkbookBackend = open_workbook(target)
+    name_index: NameIndex = build_name_index(workbook)
+    target_data: Optional[dict] = get_workbook_key_value_pairs(workbook, name_index)
     if not target_data:
         print("No named ranges in Excel file.")
         return None
 
-    # Check if source is json file
-    if isinstance(source, str) and source.lower().endswith(".json"):
-        source_data: Optional[dict] = get_json_key_value_pairs(source)
-        source_str: str = source
-        if not source_data:
+    document: Optional[MeasurementDocument] = None
+    if isinstance(source, dict):
+        source_data: dict = source
+        source_str: str = "UNDO BUFFER"
+    else:
+        document = as_measurement_document(source)
+        if document is None or not document.pairs:
             print("No measurement data found in JSON file.")
             return None
-
-    elif isinstance(source, dict):
-        source_data = source
-        source_str = "UNDO BUFFER"
+        source_data = document.pairs
+        source_str = document.path
 
     # find range names that occur both in Excel and JSON
     ranges_to_update: list = list(source_data.keys() & target_data.keys())
@@ -452,98 +869,365 @@ def update_named_ranges(
         range_update_buffer[range] = source_data[range]
         range_undo_buffer[range] = target_data[range]
 
-    write_named_ranges(
-        range_undo_buffer, range_update_buffer, target, source_str, backup
+    report: Optional[WriteReport] = write_named_ranges(
+        range_undo_buffer,
+        range_update_buffer,
+        workbook,
+        source_str,
+        backup,
+        name_index,
+        confirm,
     )
+    if report is not None and is_workbook_path(target):
+        # the backup must read the file before it is replaced
+        wait_for_backups()
+        workbook.save()
     # TODO: Test coverage; handle writing parameters if no metadata available
-    if source_str != "UNDO BUFFER":
-        write_database_parameters(range_update_buffer, load_metadata_from_json(source))
+    if document is not None:
+        write_database_parameters(
+            range_update_buffer, document.metadata, database=database
+        )
 
     return range_undo_buffer
 
 
-def write_database_parameters(  # NOTE NOT YET IMPLEMENTED
-    parameter_dict: dict,
-    metadata_dict: dict,
-    test_flag=False,
-) -> None:
-    """Write values from a dictionary of key-value pairs to an SQLite database."""
-    db_connection = sqlite3.connect(DATUM_DB, detect_types=sqlite3.PARSE_DECLTYPES)
-    cur = db_connection.cursor()
-
-    # Table for metadata
-    # TODO: Implement this
-    metadata_table_create = """--sql
-        CREATE TABLE IF NOT EXISTS source_history (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            part_name TEXT,
-            part_path TEXT,
-            part_rev TEXT,
-            part_units TEXT,
-            user TEXT,
-            computer TEXT,
-            datum_version TEXT,
-            source_type TEXT,
-            source_version TEXT,
-            retrieval_ts TIMESTAMP /* timestamp for source generation */
-        )
+def update_many_workbooks(
+    source: Union[str, dict, MeasurementDocument],
+    targets: List[Union[str, Path]],
+    backup: bool = False,
+    processes: Optional[int] = None,
+    use_excel: bool = False,
+    database: Optional[Union[Database, DatabaseWriter]] = None,
+) -> List[WorkbookSummary]:
+    """Update the named ranges of many .xlsx files from one source.
+
+    The JSON file is parsed once and the workbooks are updated in a
+    process pool without confirmation. Offline workbooks are edited
+    fully in parallel; with use_excel each worker runs its own hidden
+    Excel instance. Measurement parameters are written to the database
+    once, for every name written to any workbook.
+
+    Keyword arguments:
+    source -- JSON file path, MeasurementDocument or dict of range name: value
+    targets -- paths of the .xlsx files to update
+    backup -- back up each workbook before it is updated
+    processes -- number of worker processes, defaults to the CPU count
+    use_excel -- update through Excel rather than the offline backend
+    database -- open database or writer for the parameters, defaults to DATUM_DB
     """
+    metadata: Optional[dict] = None
+    if isinstance(source, dict):
+        source_data: dict = source
+    else:
+        document: Optional[MeasurementDocument] = as_measurement_document(source)
+        if document is None or not document.pairs:
+            print("No measurement data found in JSON file.")
+            return []
+        source_data = document.pairs
+        metadata = document.metadata
+
+    initializer = _start_worker_excel if use_excel else None
+    with ProcessPoolExecutor(processes, initializer=initializer) as executor:
+        futures: List[Future] = [
+            _submit_update(executor, source_data, str(target), backup, use_excel)
+            for target in targets
+        ]
+        summaries: List[WorkbookSummary] = [
+            _update_summary(future, str(target), source_data)
+            for future, target in zip(futures, targets)
+        ]
+
+    for summary in summaries:
+        if summary.error:
+            logger.error(f"Updating {summary.workbook} failed: {summary.error}")
+        else:
+            logger.info(
+                f"Updated {summary.workbook}: {len(summary.written)} written, "
+                f"{len(summary.skipped)} skipped in {summary.seconds:.2f} s."
+            )
 
-    # Table for parameters
-    parameter_table_create = """--sql
-        CREATE TABLE IF NOT EXISTS parameters(
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            param_key TEXT,
-            param_value NUMERIC,
-            generation_time TIMESTAMP /* time measurement was made */
+    written: set = set().union(*[summary.written for summary in summaries])
+    if written and metadata is not None:
+        write_database_parameters(
+            {name: source_data[name] for name in sorted(written)},
+            metadata,
+            database=database,
         )
-    """
-    cur.execute(parameter_table_create)
 
-    generation_time = datetime.datetime.fromisoformat(metadata_dict["retrieval_ts"])
+    return summaries
+
+
+def _submit_update(
+    executor: ProcessPoolExecutor,
+    source_data: dict,
+    target: str,
+    backup: bool,
+    use_excel: bool,
+) -> Future:
+    """Submit update_workbook for a target. If the pool has already
+    broken, the Future holds the error."""
+    try:
+        return executor.submit(update_workbook, source_data, target, backup, use_excel)
+    except BrokenProcessPool as exception:
+        future: Future = Future()
+        future.set_exception(exception)
+        return future
+
+
+def _update_summary(future: Future, target: str, source_data: dict) -> WorkbookSummary:
+    """Summary of an update_workbook job, or of the failure of its
+    worker, e.g. a BrokenProcessPool if a worker couldn't start."""
+    try:
+        return future.result()
+    except Exception as exception:
+        return WorkbookSummary(
+            target,
+            [],
+            sorted(source_data.keys()),
+            0.0,
+            f"{type(exception).__name__}: {exception}",
+        )
+
+
+def update_workbook(
+    source_data: dict, target: str, backup: bool = False, use_excel: bool = False
+) -> WorkbookSummary:
+    """Update one workbook without confirmation, for update_many_workbooks.
+    Errors are reported in the summary rather than raised."""
+    start: float = time.perf_counter()
+    written: List[str] = []
+    error: Optional[str] = None
+    book: Optional[xw.main.Book] = None
+    try:
+        workbook: Union[xw.main.Book, str] = target
+        if use_excel:
+            book = _worker_app.books.open(target)
+            workbook = book
+        undo_buffer: Optional[dict] = update_named_ranges(
+            source_data, workbook, backup, confirm=False
+        )
+        if book is not None:
+            # the backup must read the file before it is replaced
+            wait_for_backups()
+            book.save()
+        written = sorted(undo_buffer or [])
+    except Exception as exception:
+        error = f"{type(exception).__name__}: {exception}"
+    finally:
+        if book is not None:
+            book.close()
+
+    return WorkbookSummary(
+        target,
+        written,
+        sorted(source_data.keys() - set(written)),
+        time.perf_counter() - start,
+        error,
+    )
+
+
+def _start_worker_excel() -> None:
+    """Process pool initializer: start a hidden Excel instance for this
+    worker, closed when the worker exits."""
+    global _worker_app
+    _worker_app = xw.App(visible=False, add_book=False)
+    multiprocessing.util.Finalize(_worker_app, _worker_app.quit, exitpriority=10)
+
+
+def connect_database(db_file: Optional[str] = None) -> sqlite3.Connection:
+    """Open a connection to the SQLite database, DATUM_DB by default,
+    tuned for bulk writes and upgraded to the current schema."""
+    return open_connection(db_file or DATUM_DB, DB_CACHE_KIB)
+
+
+def open_database(db_file: Optional[str] = None) -> Database:
+    """Database for a session of writes to DATUM_DB, or db_file."""
+    return Database(db_file or DATUM_DB, DB_CACHE_KIB)
+
 
-    # Write all parameters to database
+def open_database_writer(db_file: Optional[str] = None) -> DatabaseWriter:
+    """Background writer for a session of writes to DATUM_DB, or db_file."""
+    return DatabaseWriter(db_file or DATUM_DB, DB_CACHE_KIB, DB_WRITE_QUEUE)
+
+
+def encode_parameter_rows(
+    parameter_dict: dict,
+    generation_time: datetime.datetime,
+    source_id: Optional[int] = None,
+) -> List[tuple]:
+    """Build the rows of the parameters table for a dict of key-value pairs.
+
+    Points, vectors and other lists of numbers are stored packed by
+    pack_vector. Other values SQLite can't store, such as dicts, are
+    stored as their str(), with one warning for each type rather than
+    each row.
+    generation_time is converted to text once, as sqlite3 would for
+    every row."""
+    scalar_types = (int, float, str, datetime.datetime)
+    timestamp: str = generation_time.isoformat(" ")
+    rows: List[tuple] = []
+    other_types: Counter = Counter()
     for key, value in parameter_dict.items():
-        if not isinstance(value, (int, float, str, datetime.datetime)):
-            logger.warning(
-                f"Dict with type {type(value)} attempting to write to {DATUM_DB}. {value = }"
-            )
-            value = str(value)
-        insert_command = """--sql
-            INSERT INTO parameters (param_key, param_value, generation_time) VALUES (?, ?, ?)
-            """
-        cur.execute(insert_command, [key, value, generation_time])
+        if not isinstance(value, scalar_types):
+            packed: Optional[bytes] = pack_vector(value)
+            if packed is None:
+                other_types[type(value)] += 1
+            value = str(value) if packed is None else packed
+        rows.append((key, value, timestamp, source_id))
+    for value_type, count in other_types.items():
+        logger.warning(
+            f"Dict with type {value_type} attempting to write to {DATUM_DB}. "
+            f"{count} values stored as text."
+        )
+    return rows
+
+
+def is_unchanged(
+    stored_value: Any, new_value: Any, min_diff: float = DB_MIN_DIFF
+) -> bool:
+    """Whether new_value is the value already stored. Numbers within
+    min_diff as a fraction of the stored value are the same, as in the
+    preview of changes; other values must be equal."""
+    if stored_value == new_value:
+        return True
+    if isinstance(new_value, datetime.datetime):
+        new_value = new_value.isoformat(" ")  # as sqlite3 stores it
+    difference = report_difference(stored_value, new_value)
+    if isinstance(difference, float):
+        return abs(difference) < min_diff
+    return stored_value == new_value
+
+
+def insert_parameters(
+    db_connection: sqlite3.Connection,
+    parameter_dict: dict,
+    metadata_dict: dict,
+    changes_only: bool = DB_CHANGES_ONLY,
+    min_diff: float = DB_MIN_DIFF,
+) -> int:
+    """Insert the parameters of an export in the caller's transaction.
+    Returns the number of rows written.
+
+    With changes_only, a key is skipped if its stored value for the
+    same part at the time of the export is unchanged within min_diff. The history
+    queries read the skipped values from the earlier rows."""
+    generation_time = datetime.datetime.fromisoformat(metadata_dict["retrieval_ts"])
+
+    insert_command = """--sql
+        INSERT INTO parameters (param_key, param_value, generation_time, source_id)
+        VALUES (?, ?, ?, ?)
+        """
+    source_id: int = find_or_add_source(db_connection, metadata_dict)
+    rows: List[tuple] = encode_parameter_rows(
+        parameter_dict, generation_time, source_id
+    )
+    if changes_only:
+        stored: dict = values_at(
+            db_connection,
+            parameter_dict,
+            generation_time,
+            metadata_dict.get("part_name"),
+        )
+        rows = [
+            row
+            for row in rows
+            if row[0] not in stored
+            or not is_unchanged(stored[row[0]], row[1], min_diff)
+        ]
+    db_connection.executemany(insert_command, rows)
+    logger.info(
+        f"Successfully wrote {len(rows)} items to the database, "
+        f"{len(parameter_dict) - len(rows)} unchanged"
+    )
+    return len(rows)
 
-    logger.info(f"Successfully wrote {len(parameter_dict)} items to {DATUM_DB}")
-    if not test_flag:  #  pragma: no cover
-        db_connection.commit()
-        db_connection.close()
+
+def write_database_parameters(
+    parameter_dict: dict,
+    metadata_dict: dict,
+    database: Optional[Union[Database, DatabaseWriter]] = None,
+    changes_only: bool = DB_CHANGES_ONLY,
+    min_diff: float = DB_MIN_DIFF,
+) -> Optional[Future]:
+    """Write values from a dictionary of key-value pairs to an SQLite database.
+
+    Parameters reference the source_history row of their export, which
+    is added from metadata_dict if the NX journal didn't record it.
+    All rows are inserted with a single executemany in one transaction,
+    by insert_parameters.
+
+    With a DatabaseWriter the write is queued for its thread, and a
+    Future for the number of rows written is returned. Otherwise it is
+    written before returning, to database if held open by the caller,
+    else to DATUM_DB, opened for this write and closed again."""
+    job = functools.partial(
+        insert_parameters,
+        parameter_dict=dict(parameter_dict),
+        metadata_dict=dict(metadata_dict),
+        changes_only=changes_only,
+        min_diff=min_diff,
+    )
+    if hasattr(database, "submit"):  # DatabaseWriter
+        return database.submit(job)
+
+    own_database: bool = database is None
+    if database is None:
+        database = open_database()
+    # Write all parameters to database, committed or rolled back together
+    with database.transaction() as db_connection:
+        job(db_connection)
+    if own_database:
+        database.close()
+    return None
 
 
 def write_named_ranges(
     exiting_values: dict,
     new_values: dict,
-    workbook: xw.main.Book,
+    workbook: Union[xw.main.Book, WorkbookBackend, str],
     source_str: str,
     backup: bool = False,
-) -> None:
-    """Update named ranges in a workbook from a dictionary."""
-
-    preview_named_range_update(exiting_values, new_values)
-
-    print("The values listed above will be overwritten.")
-    # TODO: Add argument to function to skip confirmation
-    overwrite_confirm: str = input("Enter 'y' to continue: ")
+    name_index: Optional[NameIndex] = None,
+    confirm: bool = True,
+) -> Optional[WriteReport]:
+    """Update named ranges in a workbook from a dictionary.
+    Returns a report of the write, or None if aborted.
+
+    Excel's calculation and screen updates are suspended during the
+    write; the single recalculation afterwards is timed separately.
+    With confirm=False values are written without a preview or prompt."""
+
+    overwrite_confirm: str = "y"
+    if confirm:
+        preview_named_range_update(exiting_values, new_values)
+        print("The values listed above will be overwritten.")
+        overwrite_confirm = input("Enter 'y' to continue: ")
     if overwrite_confirm == "y":
+        workbook = open_workbook(workbook)
         if backup:
-            backup_path: Path = backup_workbook(workbook)
-            logger.debug(f"Backed up to {backup_path}")
+            # the backup reads the saved file, so it can run alongside the write
+            backup_workbook(workbook, background=True)
         logger.debug(
             f"Updating named ranges.\n\
             Source: {source_str}\n\
             Target: {workbook.fullname}"
         )
-        for range in new_values.keys():
-            write_named_range(workbook, range, new_values[range])
+        start: float = time.perf_counter()
+        with workbook.suspend_updates() as recalculation:
+            report: WriteReport = batch_write_named_ranges(
+                workbook, new_values, name_index
+            )
+            report = report._replace(write_seconds=time.perf_counter() - start)
+        report = report._replace(recalc_seconds=recalculation.seconds)
+        logger.info(
+            f"Wrote {report.cells} cells in {report.blocks} blocks using "
+            f"{report.com_calls} COM calls ({report.naive_com_calls} unbatched)."
+        )
+        logger.info(
+            f"Write took {report.write_seconds:.3f} s, "
+            f"recalculation {report.recalc_seconds:.3f} s."
+        )
+        return report
     else:
         print("Aborted.")
+        return None
@@ -0,0 +1,213 @@
+"""
+Helpers for working with Excel range addresses in plain Python.
+
+Named ranges refer to addresses such as "=Sheet1!$A$1:$C$1". Parsing
+these strings locally means the cell layout of every name can be known
+without asking Excel, so many small writes can be merged into a few
+rectangular block writes.
+"""
+
+import re
+from collections import defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+# Matches a single contiguous area, e.g. ='My Sheet'!$A$1:$C$3 or =Sheet1!B2
+REFERS_TO_PATTERN = re.compile(
+    r"^=(?:'(?P<quoted_sheet>(?:[^']|'')+)'|(?P<sheet>[^'!:]+))!"
+    r"\$?(?P<first_col>[A-Za-z]{1,3})\$?(?P<first_row>\d+)"
+    r"(?::\$?(?P<last_col>[A-Za-z]{1,3})\$?(?P<last_row>\d+))?$"
+)
+
+
+class RangeAddress(NamedTuple):
+    """Location of a contiguous, rectangular range of cells.
+
+    Rows and columns are 1-based, as in Excel."""
+
+    sheet: str
+    first_row: int
+    first_col: int
+    last_row: int
+    last_col: int
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (
+            self.last_row - self.first_row + 1,
+            self.last_col - self.first_col + 1,
+        )
+
+    @property
+    def size(self) -> int:
+        rows, cols = self.shape
+        return rows * cols
+
+    def cell(self, index: int) -> Tuple[int, int]:
+        """Return (row, column) of the index-th cell, counted row by row.
+        Matches the ordering xlwings uses for range[index]."""
+        cols: int = self.shape[1]
+        return self.first_row + index // cols, self.first_col + index % cols
+
+
+class CellBlock(NamedTuple):
+    """Rectangular block of values anchored at (row, column)."""
+
+    row: int
+    column: int
+    values: List[list]
+
+    @property
+    def last_row(self) -> int:
+        return self.row + len(self.values) - 1
+
+    @property
+    def last_column(self) -> int:
+        return self.column + len(self.values[0]) - 1
+
+
+class NameIndex:
+    """Addresses of the named ranges in a workbook, grouped by sheet.
+
+    Built in a single pass over a workbook's names so that values
+    can be read and written a whole sheet at a time. Names whose
+    refers_to can't be parsed are kept in unparsed, mapped to the
+    object supplied for them, so callers can fall back to reading
+    or writing them directly. Names with #REF! errors are kept
+    in broken."""
+
+    def __init__(self) -> None:
+        self.addresses: Dict[str, RangeAddress] = dict()
+        self.sheets: Dict[str, List[str]] = defaultdict(list)
+        self.unparsed: Dict[str, Any] = dict()
+        self.broken: Set[str] = set()
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.addresses or name in self.unparsed or name in self.broken
+
+    def __len__(self) -> int:
+        return len(self.addresses) + len(self.unparsed) + len(self.broken)
+
+    def add(self, name: str, refers_to: str, source: Any = None) -> None:
+        """Parse and add a name. source is kept for unparseable names."""
+        address: Optional[RangeAddress] = parse_refers_to(refers_to)
+        if address is None:
+            self.unparsed[name] = source
+        else:
+            self.addresses[name] = address
+            self.sheets[address.sheet].append(name)
+
+    def bounds(self, sheet: str) -> RangeAddress:
+        """Smallest range containing every named range on a sheet."""
+        addresses: List[RangeAddress] = [
+            self.addresses[name] for name in self.sheets[sheet]
+        ]
+        return RangeAddress(
+            sheet,
+            min(address.first_row for address in addresses),
+            min(address.first_col for address in addresses),
+            max(address.last_row for address in addresses),
+            max(address.last_col for address in addresses),
+        )
+
+    def slice_value(self, name: str, block: List[list], origin: RangeAddress) -> Any:
+        """Cut the value of a name out of a 2D block of values
+        read from the range origin."""
+        address: RangeAddress = self.addresses[name]
+        first_row: int = address.first_row - origin.first_row
+        last_row: int = address.last_row - origin.first_row + 1
+        first_col: int = address.first_col - origin.first_col
+        last_col: int = address.last_col - origin.first_col + 1
+        rows: List[list] = [
+            row[first_col:last_col] for row in block[first_row:last_row]
+        ]
+        return range_value(rows)
+
+
+def column_index(column_letters: str) -> int:
+    """Convert Excel column letters to a 1-based index, e.g. 'AB' -> 28."""
+    index: int = 0
+    for letter in column_letters.upper():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index
+
+
+def column_letters(column_index: int) -> str:
+    """Convert a 1-based column index to Excel column letters, e.g. 28 -> 'AB'."""
+    if column_index < 1:
+        raise ValueError(f"Invalid column index {column_index}")
+    letters: str = ""
+    while column_index > 0:
+        column_index, remainder = divmod(column_index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+
+def parse_refers_to(refers_to: str) -> Optional[RangeAddress]:
+    """Parse the refers_to string of a name into a RangeAddress.
+
+    Returns None for anything other than a single contiguous area,
+    e.g. constants, formulas, or multi-area references."""
+    match = REFERS_TO_PATTERN.match(refers_to.strip())
+    if match is None:
+        return None
+    if match["quoted_sheet"] is not None:
+        sheet: str = match["quoted_sheet"].replace("''", "'")
+    else:
+        sheet = match["sheet"]
+    first_row, first_col = int(match["first_row"]), column_index(match["first_col"])
+    if match["last_col"] is None:
+        last_row, last_col = first_row, first_col
+    else:
+        last_row, last_col = int(match["last_row"]), column_index(match["last_col"])
+    return RangeAddress(
+        sheet,
+        min(first_row, last_row),
+        min(first_col, last_col),
+        max(first_row, last_row),
+        max(first_col, last_col),
+    )
+
+
+def range_value(rows: List[list]) -> Any:
+    """Collapse a 2D list of cell values the way xlwings returns range
+    values: a scalar for one cell, a flat list for a single row or
+    column, and a list of rows otherwise."""
+    if len(rows) == 1:
+        return rows[0][0] if len(rows[0]) == 1 else rows[0]
+    if all(len(row) == 1 for row in rows):
+        return [row[0] for row in rows]
+    return rows
+
+
+def coalesce_cells(cells: Dict[Tuple[int, int], Any]) -> List[CellBlock]:
+    """Merge individual cell values into rectangular blocks.
+
+    Keyword arguments:
+    cells -- dict of (row, column): value for a single sheet
+
+    Cells that are adjacent in a row are joined into runs, and runs that
+    span the same columns on consecutive rows are stacked into blocks.
+    Cells not in the dict are never covered by a block."""
+    row_runs: List[Tuple[int, int, list]] = []
+    for row, col in sorted(cells):
+        if row_runs:
+            run_row, run_col, run_values = row_runs[-1]
+            if run_row == row and run_col + len(run_values) == col:
+                run_values.append(cells[row, col])
+                continue
+        row_runs.append((row, col, [cells[row, col]]))
+
+    blocks: List[CellBlock] = []
+    # most recent block for each (first column, width) span
+    open_blocks: Dict[Tuple[int, int], CellBlock] = dict()
+    for row, col, values in row_runs:
+        span: Tuple[int, int] = (col, len(values))
+        block: Optional[CellBlock] = open_blocks.get(span)
+        if block is not None and block.last_row == row - 1:
+            block.values.append(values)
+        else:
+            block = CellBlock(row, col, [values])
+            blocks.append(block)
+            open_blocks[span] = block
+
+    return blocks
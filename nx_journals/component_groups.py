@@ -6,7 +6,7 @@ import math
 import NXOpen
 import NXOpen.UF
 import NXOpen.UIStyler
-from nxmods import nxdir, nxprint
+from nxmods import listing, nxdir, nxprint
 
 # Component groups that NX makes by default
 DEFAULT_COMPONENT_GROUPS = [
@@ -57,3 +57,4 @@ def main():
 
 if __name__ == "__main__":
     main()
+    listing.close()
@@ -15,6 +15,7 @@ import os
 import re
 import sys
 import sqlite3
+import time
 from tkinter import TclError
 
 try:
@@ -24,9 +25,9 @@ except ModuleNotFoundError as err:  # pragma: no cover
     print("Please run this module from NX.")
 
 try:
-    from nxmods import nxprint
+    from nxmods import DETAIL, NORMAL, feature_index, listing, nxprint
 except ModuleNotFoundError:
-    from nx_journals.nxmods import nxprint
+    from nx_journals.nxmods import DETAIL, NORMAL, feature_index, listing, nxprint
 
 try:
     from datum import __version__ as datum_version
@@ -34,19 +35,57 @@ except ModuleNotFoundError:  # pragma: no cover
     nxprint("datum module not found.")
     datum_version = "UNKNOWN"
 
+try:
+    from datum.database import migrate
+    from datum.export_manifest import read_manifest
+    from datum.measurement_binary import BINARY_EXTENSION, write_measurement_binary
+    from datum.spool import append_record
+except ModuleNotFoundError:  # pragma: no cover
+    migrate = None
+    read_manifest = None
+    BINARY_EXTENSION = ".dmb"
+    write_measurement_binary = None
+    append_record = None
+
 # user settable defaults for where to save JSON file
 DATUM_DIR = f"C:\\Users\\{os.getlogin()}\\Documents\\datum"
 DATUM_DB_FILE = f"C:\\Users\\{os.getlogin()}\\Documents\\datum\\datum.db"
+# exports are appended here and loaded into DATUM_DB_FILE by `datum ingest`
+DATUM_SPOOL_FILE = f"{DATUM_DIR}\\datum_spool.jsonl"
+# written by `manifest` in the datum console from the target workbook
+DATUM_MANIFEST_FILE = f"{DATUM_DIR}\\datum_manifest.json"
 JSON_DEFAULT_FILE = "nx_measurements.json"
 DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+EXPORT_BINARY = False  # also save a compact binary copy next to the JSON file
+LISTING_VERBOSITY = NORMAL  # DETAIL also lists each feature and metadata key
+INCREMENTAL_EXPORT = False  # reuse the last export of an unchanged, saved part
+EXPORT_CACHE_EXTENSION = ".cache.json"  # sidecar cache of incremental exports
+EXPORT_CACHE_VERSION = 2
+EXPORT_MANIFEST = False  # only export the measurements DATUM_MANIFEST_FILE lists
+HARVEST_ASSEMBLY = False  # also export the measurements of the components
+HARVEST_COMPONENT_GROUP = None  # e.g. "FRAME" to only harvest that group
+COMPONENT_SEPARATOR = "__"  # between component and feature names
 
 sys.path.insert(0, DATUM_DIR)
 
 
-# TODO: Test case in test_db
+def spool_metadata(metadata_dict: dict) -> None:
+    """Append metadata to the spool file, for `datum ingest` to load
+    into the database. Without the datum package it is written to the
+    database directly."""
+    if append_record is None:  # pragma: no cover
+        write_metadata_db(metadata_dict)
+        return
+    append_record(DATUM_SPOOL_FILE, metadata_dict)
+    nxprint(f"Spooled export metadata to {DATUM_SPOOL_FILE}")
+
+
 def write_metadata_db(metadata_dict: dict) -> None:
     """Write metadata to an SQLite DB"""
     db_connection = sqlite3.connect(DATUM_DB_FILE, detect_types=sqlite3.PARSE_DECLTYPES)
+    if migrate is not None:
+        # bring an existing database up to the schema datum reads
+        migrate(db_connection)
     cur = db_connection.cursor()
     # NOTE: Keys in metadata_dict must match keys in table
     metadata_table_create = """--sql
@@ -67,19 +106,17 @@ def write_metadata_db(metadata_dict: dict) -> None:
 
     cur.execute(metadata_table_create)
 
-    key_str = ", ".join([key for key in metadata_dict.keys()])
-    value_str = '"' + '", "'.join(value for value in metadata_dict.values()) + '"'
-    insert_command = (
-        "INSERT INTO source_history (" + key_str + ") VALUES (" + value_str + ")"
-    )
-    nxprint(insert_command)
-    cur.execute(insert_command)
+    key_str = ", ".join(metadata_dict.keys())
+    placeholders = ", ".join("?" for _ in metadata_dict)
+    insert_command = f"INSERT INTO source_history ({key_str}) VALUES ({placeholders})"
+    nxprint(insert_command, DETAIL)
+    cur.execute(insert_command, list(metadata_dict.values()))
     get_last_key = """--sql
         SELECT MAX(id) FROM source_history 
     """
     cur.execute(get_last_key)
     last_key = cur.fetchone()[0]
-    nxprint(f"{last_key = }")
+    nxprint(f"{last_key = }", DETAIL)
 
     db_connection.commit()
     db_connection.close()
@@ -115,20 +152,17 @@ def get_metadata(nxSession) -> dict:
     metadata["source_version"] = str(nxSession.ReleaseNumber)
 
     for key in metadata.keys():
-        nxprint(f"{key}: {metadata[key]}")
+        nxprint(f"{key}: {metadata[key]}", DETAIL)
 
     return {"METADATA": metadata}
 
 
-def find_feature_by_name(feature_name):
+def find_feature_by_name(feature_name, feature_type=None):
+    """Feature of the work part with a name, and of feature_type if
+    given, or None. Looked up in the part's FeatureIndex."""
     theSession = NXOpen.Session.GetSession()
     workPart = theSession.Parts.Work
-
-    for feature in workPart.Features:
-        if feature.Name == feature_name:
-            return feature
-
-    return None
+    return feature_index(workPart).find(feature_name, feature_type)
 
 
 # NOTE: NOT IMPLEMENTED
@@ -159,7 +193,356 @@ def get_WCS(nxSession):
     return wcs
 
 
-def export_measurements(json_export_file, nxSession):
+def extract_feature(feature, expression_names=None):
+    """Read the name, type, units and value of each expression of a
+    measurement feature, or only of those in expression_names."""
+    point_count = 0
+    current_feature = {"name": feature.Name, "expressions": []}
+    for expr in feature.GetExpressions():
+        # typical type string: "p7( Face Measure : area )"
+        # the regex below extracts "area"
+        expr_name = re.search(r"(?<=\d\) )\w+(?=\))", expr.Description)
+        if expr_name is None:
+            if expr.Type == "Point":
+                # TODO: If only a single point in expression,
+                # name it "point" instead of "point_1"
+                point_count += 1
+                expr_name = f"point_{point_count}"
+            elif expr.Type == "Number":
+                if expr.Units.Name == "Degrees":
+                    expr_name = "angle"
+                else:
+                    expr_name = "distance"
+            else:
+                expr_name = "UNKNOWN"
+        else:
+            expr_name = expr_name[0]
+        if expression_names is not None and expr_name not in expression_names:
+            continue
+        # if no expression type, likely a distance measurement.
+        # leave this as None / null
+        current_expr = {
+            "name": expr_name,
+            "type": expr.Type,
+        }
+
+        expr_value = None
+        if expr.Type == "Number":
+            expr_value = expr.Value
+            current_expr["units"] = expr.Units.Name
+        elif expr.Type == "Point":
+            expr_value = {
+                "x": expr.PointValue.X,
+                "y": expr.PointValue.Y,
+                "z": expr.PointValue.Z,
+            }
+        elif expr.Type == "Vector":
+            expr_value = {
+                "x": expr.VectorValue.X,
+                "y": expr.VectorValue.Y,
+                "z": expr.VectorValue.Z,
+            }
+        elif expr.Type == "List":
+            expr_value = expr.GetListValue()
+        elif expr.Type == "String":
+            expr_value = expr.StringValue
+        else:
+            continue
+
+        current_expr["value"] = expr_value
+
+        current_feature["expressions"].append(current_expr)
+
+    return current_feature
+
+
+def feature_signature(feature):
+    """Identity, name and place in the part history of a feature. None
+    of these change when the feature's values do, so the cache is only
+    used for a part whose saved file is unchanged, by saved_part_state."""
+    identifier = getattr(feature, "JournalIdentifier", feature.Name)
+    return [identifier, feature.Name, getattr(feature, "Timestamp", None)]
+
+
+def saved_part_state(workPart):
+    """Path, size and modification time of the saved file of the part,
+    or None if the part has changes that aren't saved, including those
+    of the interpart update, or isn't a file (e.g. in Teamcenter).
+    Values cached for a state are current while the state is the same."""
+    if workPart.IsModified:
+        return None
+    try:
+        stat = os.stat(workPart.FullPath)
+    except OSError:
+        return None
+    return [workPart.FullPath, stat.st_size, stat.st_mtime_ns]
+
+
+def cache_file_path(json_export_file):
+    """Sidecar cache of the extracted features, next to the JSON file."""
+    return os.path.splitext(json_export_file)[0] + EXPORT_CACHE_EXTENSION
+
+
+def load_export_cache(cache_file, part_state):
+    """Cached features of the part by identifier, or an empty dict if
+    there is no cache, or it is for another part state or version."""
+    if part_state is None:
+        return dict()
+    try:
+        with open(cache_file, "r") as cache:
+            contents = json.load(cache)
+    except (OSError, ValueError):
+        return dict()
+    if (
+        not isinstance(contents, dict)
+        or contents.get("version") != EXPORT_CACHE_VERSION
+        or contents.get("part_state") != part_state
+    ):
+        return dict()
+    return contents.get("features", dict())
+
+
+def save_export_cache(cache_file, part_state, features):
+    """Replace the cache in one step, so an interrupted export never
+    leaves half a cache."""
+    contents = {
+        "version": EXPORT_CACHE_VERSION,
+        "part_state": part_state,
+        "features": features,
+    }
+    temp_file = f"{cache_file}.tmp"
+    with open(temp_file, "w") as cache:
+        json.dump(contents, cache)
+    os.replace(temp_file, cache_file)
+
+
+def load_export_manifest():
+    """Features and expressions of DATUM_MANIFEST_FILE, or None to
+    export every measurement if it can't be read."""
+    if read_manifest is None:  # pragma: no cover
+        nxprint("datum module not found, exporting all measurements.")
+        return None
+    try:
+        manifest = read_manifest(DATUM_MANIFEST_FILE)
+    except (OSError, ValueError) as error:
+        nxprint(error)
+        nxprint("No valid manifest, exporting all measurements.")
+        return None
+    nxprint(f"exporting the {len(manifest)} features in {DATUM_MANIFEST_FILE}")
+    return manifest
+
+
+def component_paths(root_component):
+    """Components under root_component, each after its children, with
+    the names of the components from the root down to it."""
+    ordered = []
+    stack = [(child, (child.Name,), False) for child in root_component.GetChildren()]
+    stack.reverse()
+    while stack:
+        component, path, visited = stack.pop()
+        if visited:
+            ordered.append((component, path))
+            continue
+        stack.append((component, path, True))
+        for child in reversed(list(component.GetChildren())):
+            stack.append((child, path + (child.Name,), False))
+    return ordered
+
+
+def component_group_members(workPart, group_name):
+    """Tags of the components of a component group, or None if the
+    part has no group of that name."""
+    for group in workPart.ComponentGroups:
+        if group.Name == group_name:
+            return {component.Tag for component in group.GetComponents()}
+    return None
+
+
+def names_component_feature(name, prefix):
+    """True if name is of a feature of the component of prefix itself,
+    not of one of its subcomponents."""
+    return name.startswith(prefix) and COMPONENT_SEPARATOR not in name[len(prefix) :]
+
+
+def open_prototype(prototype):
+    """Load a prototype in full to read its features, which a partially
+    loaded part doesn't have. Returns True if it was loaded here, and
+    should be closed when it has been read."""
+    if prototype.IsFullyLoaded:
+        return False
+    prototype.LoadThisPartFully()
+    return True
+
+
+def open_component(workPart, component):
+    """Open the part of a component that isn't loaded, e.g. by the load
+    options, to read its features. Returns its prototype, which should
+    be closed when it has been read, or None if it can't be opened."""
+    load_status, _ = workPart.ComponentAssembly.OpenComponents(
+        NXOpen.Assemblies.ComponentAssembly.OpenOption.ComponentOnly, [component]
+    )
+    load_status.Dispose()
+    return component.Prototype
+
+
+def close_prototype(prototype):
+    """Unload a prototype, leaving the parts of its components loaded.
+    A prototype with unsaved changes, e.g. from the interpart update,
+    is left open rather than losing them. Returns True if it was
+    closed."""
+    if prototype.IsModified:
+        return False
+    prototype.Close(
+        NXOpen.BasePart.CloseWholeTree.FalseValue,
+        NXOpen.BasePart.CloseModified.DontCloseModified,
+        None,
+    )
+    return True
+
+
+def harvest_components(nxSession, manifest=None, group_name=None):
+    """Measurement features of the components of the work part, named
+    with the path of component names from the root, e.g.
+    FRAME__BRACKET__MASS with COMPONENT_SEPARATOR.
+
+    Each prototype is read once for all its components. A prototype
+    that isn't fully loaded is loaded, read and closed before the next
+    one, so the harvest holds at most one such prototype in memory
+    whatever the size of the assembly. The part of a component that
+    isn't loaded at all is opened, read and closed the same way, for
+    each such component; components whose part can't be opened are
+    skipped, and listed. Prototypes with unsaved changes are left open,
+    and listed. Components are read before the
+    subassemblies they are in. The load and read times of each
+    prototype are listed.
+
+    Given a manifest, only the features and expressions it names are
+    read, and prototypes it names none of aren't loaded. Given
+    group_name, only the components of that component group are
+    harvested."""
+    workPart = nxSession.Parts.Work
+    root_component = workPart.ComponentAssembly.RootComponent
+    if root_component is None:
+        nxprint("work part is not an assembly, no components harvested.")
+        return []
+    members = None
+    if group_name is not None:
+        members = component_group_members(workPart, group_name)
+        if members is None:
+            nxprint(f"no component group {group_name}, no components harvested.")
+            return []
+
+    # the prototype, first component and prefixes of the components of
+    # each prototype, in the order read
+    prototypes = dict()
+    for component, path in component_paths(root_component):
+        if members is not None and component.Tag not in members:
+            continue
+        if component.IsSuppressed:
+            nxprint(f"Component {component.Name} is suppressed.", DETAIL)
+            continue
+        prototype = component.Prototype
+        prefix = COMPONENT_SEPARATOR.join(path) + COMPONENT_SEPARATOR
+        if prototype is None:  # not loaded, its part unknown until opened
+            key = ("component", id(component))
+        else:
+            key = getattr(prototype, "Tag", id(prototype))
+        prototypes.setdefault(key, (prototype, component, []))[2].append(prefix)
+
+    harvested = []
+    left_open = []
+    skipped = []
+    for prototype, component, prefixes in prototypes.values():
+        if manifest is not None and not any(
+            names_component_feature(name, prefix.replace(" ", "_"))
+            for prefix in prefixes
+            for name in manifest
+        ):
+            continue  # not used by the workbook
+        start = time.perf_counter()
+        opened_here = False
+        if prototype is None:
+            prototype = open_component(workPart, component)
+            if prototype is None:
+                skipped.append(component.Name)
+                continue
+            opened_here = True
+        loaded_here = open_prototype(prototype) or opened_here
+        loaded = time.perf_counter()
+        num_features = 0
+        try:
+            for feature in prototype.Features:
+                if feature.Suppressed or "MEASUREMENT" not in feature.FeatureType:
+                    continue
+                names = dict.fromkeys(prefix + feature.Name for prefix in prefixes)
+                expression_names = None
+                if manifest is not None:
+                    for name in names:
+                        names[name] = manifest.get(name.replace(" ", "_"))
+                    wanted = [value for value in names.values() if value is not None]
+                    if not wanted:
+                        continue
+                    expression_names = set().union(*wanted)
+                current_feature = extract_feature(feature, expression_names)
+                num_features += 1
+                for name, wanted in names.items():
+                    if manifest is not None and wanted is None:
+                        continue
+                    harvested.append(
+                        {
+                            "name": name,
+                            "expressions": [
+                                expression
+                                for expression in current_feature["expressions"]
+                                if wanted is None or expression["name"] in wanted
+                            ],
+                        }
+                    )
+        finally:
+            if loaded_here and not close_prototype(prototype):
+                left_open.append(prototype.Name)
+        nxprint(
+            f"{prototype.Name}: loaded in {loaded - start:.2f} s, "
+            f"{num_features} measurement features read in "
+            f"{time.perf_counter() - loaded:.2f} s for {len(prefixes)} components"
+        )
+    if left_open:
+        nxprint(
+            f"left {len(left_open)} prototypes with unsaved changes open: "
+            + ", ".join(left_open)
+        )
+    if skipped:
+        nxprint(
+            f"skipped {len(skipped)} components that could not be loaded: "
+            + ", ".join(skipped)
+        )
+    return harvested
+
+
+def export_measurements(
+    json_export_file, nxSession, incremental=None, manifest=None, harvest=None
+):
+    """Export the measurement features of the work part to JSON.
+    Returns the number of measurement features exported.
+
+    With harvest (default HARVEST_ASSEMBLY), the measurements of the
+    components of the assembly, or of HARVEST_COMPONENT_GROUP, are
+    exported too by harvest_components, after those of the work part.
+
+    Given a manifest, a dict of feature names (with spaces as
+    underscores, as in range names) to lists of expression names, only
+    those features and expressions are read and exported.
+
+    With incremental (default INCREMENTAL_EXPORT), features of a part
+    whose saved file is unchanged since the last export, and that has
+    no unsaved changes, are taken from the sidecar cache rather than
+    read from NX again. Any change to the part, or to the geometry its
+    measurements depend on, reads every feature again, so the JSON is
+    the same as a full export."""
+    if incremental is None:
+        incremental = INCREMENTAL_EXPORT
+    if harvest is None:
+        harvest = HARVEST_ASSEMBLY
     #   Ensure that measruements are updated in the model
     #   Menu: Tools->Update->Interpart Update->Update All
     markId2 = nxSession.SetUndoMark(
@@ -169,6 +552,18 @@ def export_measurements(json_export_file, nxSession):
     nxSession.UpdateManager.DoInterpartUpdate(markId2)
     workPart = nxSession.Parts.Work
 
+    cache_file = cache_file_path(json_export_file)
+    cached = dict()
+    part_state = None
+    if incremental:
+        # after the update, so changes it makes to the part are seen
+        part_state = saved_part_state(workPart)
+        if part_state is None:
+            nxprint("part has unsaved changes, reading every measurement feature.")
+        cached = load_export_cache(cache_file, part_state)
+    extracted = dict()
+    num_extracted = 0
+
     # check_feature_errors(nxSession)
     num_measurements_found = 0
     measurement_features = {"measurements": []}
@@ -176,75 +571,65 @@ def export_measurements(json_export_file, nxSession):
 
     for feature in workPart.Features:
         if feature.Suppressed:
-            nxprint(f"Feature {feature.Name} is suppressed.")
+            nxprint(f"Feature {feature.Name} is suppressed.", DETAIL)
             continue
         if "MEASUREMENT" in feature.FeatureType:
+            expression_names = None
+            if manifest is not None:
+                expression_names = manifest.get(feature.Name.replace(" ", "_"))
+                if expression_names is None:
+                    continue  # not used by the workbook
             num_measurements_found += 1
-            point_count = 0
-            current_feature = {"name": feature.Name, "expressions": []}
-            for expr in feature.GetExpressions():
-                # typical type string: "p7( Face Measure : area )"
-                # the regex below extracts "area"
-                expr_name = re.search(r"(?<=\d\) )\w+(?=\))", expr.Description)
-                if expr_name is None:
-                    if expr.Type == "Point":
-                        # TODO: If only a single point in expression,
-                        # name it "point" instead of "point_1"
-                        point_count += 1
-                        expr_name = f"point_{point_count}"
-                    elif expr.Type == "Number":
-                        if expr.Units.Name == "Degrees":
-                            expr_name = "angle"
-                        else:
-                            expr_name = "distance"
-                    else:
-                        expr_name = "UNKNOWN"
-                else:
-                    expr_name = expr_name[0]
-                # if no expression type, likely a distance measurement.
-                # leave this as None / null
-                current_expr = {
-                    "name": expr_name,
-                    "type": expr.Type,
+            signature = feature_signature(feature) + [expression_names]
+            entry = cached.get(signature[0])
+            if entry is None or entry["signature"] != signature:
+                if expression_names is not None:
+                    expression_names = set(expression_names)
+                entry = {
+                    "signature": signature,
+                    "feature": extract_feature(feature, expression_names),
                 }
+                num_extracted += 1
+            extracted[signature[0]] = entry
+            measurement_features["measurements"].append(entry["feature"])
 
-                expr_value = None
-                if expr.Type == "Number":
-                    expr_value = expr.Value
-                    current_expr["units"] = expr.Units.Name
-                elif expr.Type == "Point":
-                    expr_value = {
-                        "x": expr.PointValue.X,
-                        "y": expr.PointValue.Y,
-                        "z": expr.PointValue.Z,
-                    }
-                elif expr.Type == "Vector":
-                    expr_value = {
-                        "x": expr.VectorValue.X,
-                        "y": expr.VectorValue.Y,
-                        "z": expr.VectorValue.Z,
-                    }
-                elif expr.Type == "List":
-                    expr_value = expr.GetListValue()
-                elif expr.Type == "String":
-                    expr_value = expr.StringValue
-                else:
-                    continue
-
-                current_expr["value"] = expr_value
-
-                current_feature["expressions"].append(current_expr)
-
-            measurement_features["measurements"].append(current_feature)
+    if harvest:
+        harvested = harvest_components(nxSession, manifest, HARVEST_COMPONENT_GROUP)
+        num_measurements_found += len(harvested)
+        measurement_features["measurements"].extend(harvested)
 
+    # the same metadata, and timestamp, for the JSON file and the spool
+    metadata = get_metadata(nxSession)
     with open(json_export_file, "w") as json_file:
-        measurement_features.update(get_metadata(nxSession))
+        measurement_features.update(metadata)
         json.dump(measurement_features, json_file, indent=4)
 
-    write_metadata_db(get_metadata(nxSession)["METADATA"])
+    if part_state is not None:
+        save_export_cache(cache_file, part_state, extracted)
+    if incremental:
+        nxprint(
+            f"read {num_extracted} new or changed measurement features, "
+            f"{num_measurements_found - num_extracted} from the cache."
+        )
+
+    if EXPORT_BINARY:
+        export_binary(json_export_file, measurement_features)
+
+    spool_metadata(metadata["METADATA"])
     return num_measurements_found
 
 
+def export_binary(json_export_file, measurement_features):
+    """Save the measurements in the binary format next to the JSON file"""
+    if write_measurement_binary is None:  # pragma: no cover
+        nxprint("datum module not found, binary export skipped.")
+        return None
+    binary_export_file = os.path.splitext(json_export_file)[0] + BINARY_EXTENSION
+    write_measurement_binary(measurement_features, binary_export_file)
+    nxprint(f"exported binary measurements to {binary_export_file}")
+    return binary_export_file
+
+
 def get_json_file_path():
     """Opens dialog box for user to choose where to save the measurements.
     Uses default directory in case of failure.
@@ -280,15 +665,22 @@ def get_json_file_path():
 
 def main():
     nxSession = NXOpen.Session.GetSession()
-    nxprint("Measurement Extractor. Using Python Version:")
-    nxprint(sys.version)
-    json_export_path = get_json_file_path()
-    if json_export_path is not None:
-        nxprint(f"exporting to {json_export_path}")
-        num_measurements = export_measurements(json_export_path, nxSession)
-        nxprint(f"found total of {num_measurements} measurement features.")
-    else:
-        nxprint("no json file specified, exiting...")
+    listing.verbosity = LISTING_VERBOSITY
+    try:
+        nxprint("Measurement Extractor. Using Python Version:")
+        nxprint(sys.version)
+        json_export_path = get_json_file_path()
+        if json_export_path is not None:
+            nxprint(f"exporting to {json_export_path}")
+            manifest = load_export_manifest() if EXPORT_MANIFEST else None
+            num_measurements = export_measurements(
+                json_export_path, nxSession, manifest=manifest
+            )
+            nxprint(f"found total of {num_measurements} measurement features.")
+        else:
+            nxprint("no json file specified, exiting...")
+    finally:
+        listing.close()  # write the buffered messages
 
 
 if __name__ == "__main__":
@@ -1,24 +1,179 @@
-def nxprint(message):
+import atexit
+
+# verbosity levels of messages; set VERBOSITY to NORMAL to hide DETAIL
+QUIET = 0
+NORMAL = 1
+DETAIL = 2  # per-feature and per-key messages
+
+VERBOSITY = DETAIL  # messages above this level aren't written
+FLUSH_LINES = 200  # lines buffered before they are written to the window
+
+
+class ListingWriter:
+    """
+    Buffered writer for the listing window.
+    Getting the session and opening the listing window for each
+    message is slow when printing hundreds of lines, so the window is
+    opened once and lines are written FLUSH_LINES at a time. Buffered
+    lines are written by flush() or close(), which journals call at
+    the end, or at exit.
+    Outside NX, lines are printed to the console instead.
+    @param  flush_lines     lines buffered before they are written
+    @param  verbosity       highest level of message written
+    """
+
+    def __init__(self, flush_lines=None, verbosity=None):
+        self.flush_lines = flush_lines or FLUSH_LINES
+        self.verbosity = VERBOSITY if verbosity is None else verbosity
+        self.lines = []
+        self._window = None
+        self._registered = False
+
+    def write(self, message, level=NORMAL):
+        """
+        Buffer a message, dropped if level is above the verbosity.
+        @param  message     message to print to the listing window
+        @param  level       NORMAL, or DETAIL for per-feature messages
+        """
+        if level > self.verbosity:
+            return
+        self.lines.append(str(message))
+        if not self._registered:
+            atexit.register(self.close)
+            self._registered = True
+        if len(self.lines) >= self.flush_lines:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered lines to the listing window."""
+        if not self.lines:
+            return
+        lines, self.lines = self.lines, []
+        window = self._listing_window()
+        if window is None:
+            # if working outside NX, print messages to console
+            print("\n".join(lines))
+        else:
+            window.WriteLine("\n".join(lines))
+
+    def close(self):
+        """Flush, and close the listing window if it was opened."""
+        self.flush()
+        if self._window is not None:
+            self._window.Close()
+            self._window = None
+        if self._registered:
+            atexit.unregister(self.close)
+            self._registered = False
+
+    def _listing_window(self):
+        if self._window is None:
+            try:
+                import NXOpen
+            except ModuleNotFoundError:
+                return None
+            self._window = NXOpen.Session.GetSession().ListingWindow
+            self._window.Open()
+        return self._window
+
+
+listing = ListingWriter()
+
+
+def nxprint(message, level=NORMAL):
     """
     Simple wrapper for writing to the listing window.
-    Useful for debugging NX journals.
+    Useful for debugging NX journals. Messages are buffered by
+    listing; call listing.close() at the end of a journal.
     @param  message     message to print to the listing window
+    @param  level       NORMAL, or DETAIL for per-feature messages
+    """
+    listing.write(message, level)
+
+
+class FeatureIndex:
+    """
+    Features of a part by name, by name and feature type, and by tag,
+    built in one pass over the part's features.
+    Getting every feature from NX is slow on large parts, so a lookup
+    doesn't check the whole part for changes. A feature found is
+    checked by reading its name, and the index rebuilt if it has been
+    renamed or deleted. A feature not found rebuilds the index, to find
+    a feature added since, at the cost of the linear scan it replaces.
+    @param  part    part whose features are indexed
+    """
+
+    def __init__(self, part):
+        self.part = part
+        self.stale = True
+        self.by_name = dict()
+        self.by_name_type = dict()
+        self.by_tag = dict()
+
+    def _features(self):
+        features = self.part.Features
+        if hasattr(features, "GetFeatures"):
+            # one call to NX rather than a step per feature
+            return list(features.GetFeatures())
+        return list(features)
+
+    def rebuild(self):
+        """Index the features of the part."""
+        self.by_name = dict()
+        self.by_name_type = dict()
+        self.by_tag = dict()
+        for feature in self._features():
+            name = feature.Name
+            # the first feature of a name is found, as by a linear scan
+            self.by_name.setdefault(name, feature)
+            feature_type = getattr(feature, "FeatureType", None)
+            self.by_name_type.setdefault((name, feature_type), feature)
+            self.by_tag[getattr(feature, "Tag", id(feature))] = feature
+        self.stale = False
+
+    def find(self, name, feature_type=None):
+        """
+        Feature with a name, and of feature_type if given, or None.
+        @param  name            name of the feature
+        @param  feature_type    e.g. "MEASURE_BODY"
+        """
+        if feature_type is None:
+            return self._find("by_name", name, name)
+        return self._find("by_name_type", (name, feature_type), name)
+
+    def find_by_tag(self, tag):
+        """Feature with a tag, or None."""
+        return self._find("by_tag", tag)
+
+    def _find(self, index_name, key, name=None):
+        if not self.stale:
+            feature = getattr(self, index_name).get(key)
+            if feature is not None:
+                try:
+                    current_name = feature.Name
+                except Exception:  # deleted since the index was built
+                    current_name = None
+                if current_name is not None and name in (None, current_name):
+                    return feature
+        self.rebuild()
+        return getattr(self, index_name).get(key)
+
+
+_feature_indexes = dict()
+
+
+def feature_index(part):
+    """
+    The FeatureIndex of a part, kept between calls.
+    @param  part    part whose features are indexed
     """
-    try:
-        # TODO: See if I can set this up so I don't have to keep
-        # getting the session & opening/closing the listing window
-        # for every message. If printing hundreds of lines, this can
-        # take a while.
-        import NXOpen
-
-        nxSession = NXOpen.Session.GetSession()
-        lw = nxSession.ListingWindow
-        lw.Open()
-        lw.WriteLine(str(message))
-        lw.Close()
-    except ModuleNotFoundError:
-        # if working outside NX, print messages to console
-        print(message)
+    # NX may return a new object for the same part, so it is keyed by tag
+    key = getattr(part, "Tag", id(part))
+    index = _feature_indexes.get(key)
+    if index is None:
+        index = _feature_indexes[key] = FeatureIndex(part)
+    index.part = part
+    return index
 
 
 def nxdir(object):
@@ -0,0 +1,98 @@
+import datetime
+import gzip
+import os
+import stat
+
+import pytest
+
+from datum import backup_store as bs
+
+
+@pytest.fixture
+def store(tmp_path):
+    return bs.BackupStore(tmp_path / "store", keep_last=2)
+
+
+@pytest.fixture
+def workbook_path(tmp_path):
+    path = tmp_path / "design.xlsx"
+    path.write_bytes(b"version 1" * 100)
+    return path
+
+
+def test_add_deduplicates(store, workbook_path, tmp_path):
+    entry = store.add(workbook_path)
+    assert entry.workbook == "design.xlsx"
+    assert entry.size == 900
+    object_path = store.object_path(entry.digest)
+    with gzip.open(object_path, "rb") as compressed:
+        assert compressed.read() == workbook_path.read_bytes()
+    assert object_path.stat().st_size < entry.size
+
+    # unchanged workbook is not stored again
+    assert store.add(workbook_path) == entry
+    # identical contents from another workbook share the object
+    copy_path = tmp_path / "copy.xlsx"
+    copy_path.write_bytes(workbook_path.read_bytes())
+    copy_entry = store.add(copy_path)
+    assert copy_entry.digest == entry.digest
+    assert len(store.entries()) == 2
+    assert store.entries("copy.xlsx") == [copy_entry]
+    assert len(list(store.root.glob("objects/*/*.gz"))) == 1
+
+
+def test_retention(store, workbook_path):
+    entries = []
+    for version in range(4):
+        workbook_path.write_bytes(f"version {version}".encode())
+        entries.append(store.add(workbook_path))
+    # keep_last=2 keeps the two newest, and removes unused objects
+    assert store.entries() == entries[2:]
+    assert not store.object_path(entries[0].digest).is_file()
+    assert store.object_path(entries[3].digest).is_file()
+
+
+def test_prune_max_age(store, workbook_path):
+    entry = store.add(workbook_path)
+    old = entry._replace(created="2000-01-01T00:00:00", digest="0" * 64)
+    store._write_index([old, entry])
+    store.max_age_days = 30
+    assert store.prune() == [old]
+    assert store.entries() == [entry]
+
+
+def test_restore(store, workbook_path, tmp_path):
+    entry = store.add(workbook_path)
+    target = store.restore(entry, tmp_path / "restored.xlsx")
+    assert target.read_bytes() == workbook_path.read_bytes()
+
+    with gzip.open(store.object_path(entry.digest), "wb") as compressed:
+        compressed.write(b"tampered")
+    with pytest.raises(ValueError):
+        store.restore(entry, tmp_path / "corrupt.xlsx")
+    assert not (tmp_path / "corrupt.xlsx").exists()
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+def test_restore_keeps_mode(store, workbook_path, tmp_path, monkeypatch):
+    monkeypatch.setitem(bs.replace_file.__globals__, "_UMASK", 0o002)
+    entry = store.add(workbook_path)
+    assert stat.S_IMODE(store.index_path.stat().st_mode) == 0o664
+    assert stat.S_IMODE(store.object_path(entry.digest).stat().st_mode) == 0o664
+    target = tmp_path / "shared.xlsx"
+    target.write_bytes(b"")
+    target.chmod(0o640)
+    store.restore(entry, target)
+    assert stat.S_IMODE(target.stat().st_mode) == 0o640
+
+
+def test_add_in_background(store, workbook_path, caplog):
+    future = store.add_in_background(workbook_path)
+    bs.wait_for_backups()
+    assert future.done()
+    assert store.entries() == [future.result()]
+    assert datetime.datetime.fromisoformat(future.result().created)
+
+    store.add_in_background(workbook_path.parent / "missing.xlsx")
+    bs.wait_for_backups()
+    assert "Backup failed" in caplog.text
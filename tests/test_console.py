@@ -2,7 +2,12 @@ import os
 
 import pytest
 
+import datum.xl_populate_named_ranges as xlpnr
 from datum import datum_console as dc
+from datum.backup_store import BackupStore
+from datum.spool import append_record
+from datum.xl_populate_named_ranges import WorkbookSummary
+from datum.xl_ranges import NameIndex
 
 
 class MockWorkbook:
@@ -12,7 +17,10 @@ class MockWorkbook:
 
 @pytest.fixture
 def console_test_session():
-    return dc.ConsoleSession()
+    cs = dc.ConsoleSession()
+    yield cs
+    cs.writer.close()
+    cs.database.close()
 
 
 @pytest.fixture
@@ -22,11 +30,18 @@ def console_command_list(console_test_session):
         (["b"], cs.backup),
         (["cd"], cs.chdir),
         (["d", "dump"], cs.dump_json),
+        (["export"], cs.export),
+        (["hist"], cs.history),
+        (["ingest"], cs.ingest),
         (["lm"], cs.load_measurement),
         (["lw"], cs.load_workbook),
+        (["manifest"], cs.manifest),
+        (["prune"], cs.prune),
         (["pwd"], cs.pwd),
+        (["r", "restore"], cs.restore),
         (["s"], cs.status),
         (["u"], cs.update_named_ranges),
+        (["um"], cs.update_many),
         (["z", "undo"], cs.undo_last_update),
     ]
     return command_list
@@ -78,6 +93,7 @@ class TestConsoleSession:
             print(f"dump_test_success")
 
         monkeypatch.setattr(dc, "dump", _mock_dump)
+        monkeypatch.setattr(dc, "load_measurement_document", lambda _: "document")
 
         # test dump with JSON and Excel loaded
         console_test_session.json_file = "test.json"
@@ -86,6 +102,102 @@ class TestConsoleSession:
         captured = capsys.readouterr()
         assert "dump_test_success" in captured.out
 
+    def test_history(self, monkeypatch, capsys, tmp_path, console_test_session):
+        console_test_session.history()
+        assert "hist <key>" in capsys.readouterr().out
+
+        monkeypatch.setattr(xlpnr, "DATUM_DB", str(tmp_path / "datum.db"))
+        console_test_session.database = xlpnr.open_database()
+        console_test_session.writer = xlpnr.open_database_writer()
+        for day, mass in [(1, 10.0), (2, 12.5)]:
+            # queued on the writer thread, flushed before the history is read
+            xlpnr.write_database_parameters(
+                {"HOUSING.mass": mass},
+                {"part_name": "HOUSING", "retrieval_ts": f"2022-05-0{day} 09:00:00"},
+                database=console_test_session.writer,
+            )
+        connection = console_test_session.database.connection
+        console_test_session.history("HOUSING.mass")
+        captured = capsys.readouterr().out.splitlines()
+        assert "CHANGE" in captured[0]
+        assert "2022-05-02 09:00:00" in captured[2] and "HOUSING/-" in captured[2]
+        assert "12.5" in captured[2] and "25.000%" in captured[2]
+
+        console_test_session.history("NOT.a_key")
+        assert "No history for NOT.a_key." in capsys.readouterr().out
+        # one connection for the whole session
+        assert console_test_session.database.connection is connection
+
+    def test_ingest(self, monkeypatch, capsys, tmp_path, console_test_session):
+        spool_file = str(tmp_path / "spool.jsonl")
+        console_test_session.ingest(spool_file)
+        assert "No spool file" in capsys.readouterr().out
+
+        monkeypatch.setattr(xlpnr, "DATUM_DB", str(tmp_path / "datum.db"))
+        console_test_session.writer = xlpnr.open_database_writer()
+        for day in [1, 2, 2]:
+            append_record(spool_file, {"retrieval_ts": f"2022-05-0{day} 09:00:00"})
+        console_test_session.ingest(spool_file)
+        assert "Ingested 3 records, 2 new exports." in capsys.readouterr().out
+
+    def test_export(self, monkeypatch, capsys, tmp_path, console_test_session):
+        cts = console_test_session
+        cts.export()
+        assert "export <file.csv or file.dhc>" in capsys.readouterr().out
+        csv_file = str(tmp_path / "history.csv")
+        cts.export(csv_file, "colour=red")
+        assert "Unknown filter colour." in capsys.readouterr().out
+        cts.export(csv_file, "since=May 1")
+        assert "Dates must be" in capsys.readouterr().out
+
+        monkeypatch.setattr(xlpnr, "DATUM_DB", str(tmp_path / "datum.db"))
+        cts.writer = xlpnr.open_database_writer()
+        cts.database = xlpnr.open_database()
+        metadata = {"part_name": "HOUSING", "retrieval_ts": "2022-05-01 09:00:00"}
+        xlpnr.write_database_parameters(
+            {"HOUSING.mass": 1.0, "GEARS.count": 3}, metadata, database=cts.writer
+        )
+        cts.export(csv_file, "HOUSING.*", "part=HOUSING", "since=2022-05-01")
+        assert f"Exported 1 rows to {csv_file}." in capsys.readouterr().out
+
+    def test_prune(self, monkeypatch, capsys, tmp_path, console_test_session):
+        cts = console_test_session
+        cts.prune("a while")
+        assert "prune [days to keep]" in capsys.readouterr().out
+
+        monkeypatch.setattr(xlpnr, "DATUM_DB", str(tmp_path / "datum.db"))
+        cts.writer = xlpnr.open_database_writer()
+        cts.database = xlpnr.open_database()
+        for day in [2, 3, 4]:  # in one week
+            timestamp = f"2022-05-0{day} 09:00:00"
+            metadata = {"part_name": "HOUSING", "retrieval_ts": timestamp}
+            xlpnr.write_database_parameters(
+                {"HOUSING.mass": float(day)}, metadata, database=cts.writer
+            )
+        cts.prune("100000")
+        assert "No exports older than 100000 days" in capsys.readouterr().out
+        monkeypatch.setattr("builtins.input", lambda _: "n")
+        cts.prune()
+        assert "2 exports older than 90 days" in capsys.readouterr().out
+        monkeypatch.setattr("builtins.input", lambda _: "y")
+        cts.prune()
+        assert "Pruned 2 exports and 2 values" in capsys.readouterr().out
+
+    def test_manifest(self, monkeypatch, capsys, tmp_path, console_test_session):
+        name_index = NameIndex()
+        name_index.add("HOUSING.mass", "=Sheet1!$A$1")
+        name_index.add("HOUSING.volume.x", "=Sheet1!$A$2")
+        name_index.add("Sheet1!CHASSIS.center_of_mass", "=INDIRECT(A3)")
+        assert len(name_index.unparsed) == 1
+        monkeypatch.setattr(dc, "build_name_index", lambda _: name_index)
+        console_test_session.excel_workbook = MockWorkbook("test")
+        manifest_file = str(tmp_path / "manifest.json")
+        console_test_session.manifest(manifest_file)
+        assert (
+            f"Wrote 2 features, 3 expressions to {manifest_file}."
+            in capsys.readouterr().out
+        )
+
     def test_load_measurement(self, monkeypatch, console_test_session):
         def _mock_select_json():
             return "select_json"
@@ -102,6 +214,57 @@ class TestConsoleSession:
         console_test_session.load_workbook()
         assert console_test_session.excel_workbook == "select_wb"
 
+    def test_load_workbook_path(self, capsys, tmp_path, console_test_session):
+        workbook_path = tmp_path / "my workbook.xlsx"
+        workbook_path.write_bytes(b"")
+        console_test_session.load_workbook(*str(workbook_path).split(" "))
+        assert console_test_session.excel_workbook == str(workbook_path)
+
+        console_test_session.load_workbook(str(tmp_path / "missing.xlsx"))
+        assert "File not found." in capsys.readouterr().out
+        console_test_session.load_workbook("measurements.json")
+        assert "Only .xlsx files" in capsys.readouterr().out
+        assert console_test_session.excel_workbook == str(workbook_path)
+
+    def test_restore(self, monkeypatch, capsys, tmp_path, console_test_session):
+        store = BackupStore(tmp_path / "store")
+        monkeypatch.setattr(dc, "get_backup_store", lambda: store)
+        console_test_session.restore()
+        assert "No backups available." in capsys.readouterr().out
+
+        workbook_path = tmp_path / "test.xlsx"
+        for contents in [b"first", b"second"]:
+            workbook_path.write_bytes(contents)
+            store.add(workbook_path)
+        console_test_session.excel_workbook = str(workbook_path)
+
+        # backups are listed newest first
+        monkeypatch.setattr("builtins.input", lambda _: "1")
+        target = tmp_path / "restored.xlsx"
+        console_test_session.restore(str(target))
+        assert target.read_bytes() == b"first"
+
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr("builtins.input", lambda _: "0")
+        console_test_session.restore()
+        assert "test_RESTORED_" in capsys.readouterr().out
+        restored = list(tmp_path.glob("test_RESTORED_*.xlsx"))
+        assert [path.read_bytes() for path in restored] == [b"second"]
+
+    def test_load_document(self, tmp_path, console_test_session):
+        cts = console_test_session
+        assert cts._load_document() is None
+        json_file = tmp_path / "measurements.json"
+        json_file.write_text('{"measurements": [], "METADATA": {"part_rev": "A"}}')
+        cts.json_file = str(json_file)
+        document = cts._load_document()
+        assert document.metadata == {"part_rev": "A"}
+        # the same document is kept until the file changes
+        assert cts._load_document() is document
+        json_file.write_text('{"measurements": [], "METADATA": {"part_rev": "B"}}')
+        assert cts._load_document().metadata == {"part_rev": "B"}
+        assert cts.document is not document
+
     def test_pwd(self, capsys, console_test_session):
         console_test_session.pwd()
         captured = capsys.readouterr()
@@ -144,14 +307,48 @@ class TestConsoleSession:
     def test_update_named_ranges(self, console_test_session, monkeypatch):
         cts = console_test_session
         cts.excel_workbook, cts.json_file = ['something', 'something_else']
-        def _mock_xlpnr_update(arg1, arg2, arg3):
+
+        def _mock_xlpnr_update(arg1, arg2, arg3, database=None):
             return {"update_success": True}
 
         monkeypatch.setattr(dc, "update_named_ranges", _mock_xlpnr_update)
+        monkeypatch.setattr(dc, "load_measurement_document", lambda _: "document")
 
         cts.update_named_ranges()
         assert cts.undo_buffer["update_success"] is True
 
+    def test_update_many(self, console_test_session, monkeypatch, capsys, tmp_path):
+        cts = console_test_session
+        cts.update_many()
+        assert "Update many workbooks" in capsys.readouterr().out
+        cts.update_many(str(tmp_path / "*.xlsx"))
+        assert "No .xlsx files found." in capsys.readouterr().out
+
+        for name in ["a.xlsx", "b.xlsx", "c.json"]:
+            (tmp_path / name).write_bytes(b"")
+        cts.json_file = "test.json"
+        monkeypatch.setattr(dc, "load_measurement_document", lambda _: "document")
+        updated = []
+
+        def _mock_update_many(source, targets, database=None):
+            updated.extend(targets)
+            return [
+                WorkbookSummary(targets[0], ["k1"], ["k2"], 0.5),
+                WorkbookSummary(targets[1], [], ["k1", "k2"], 0.1, "KeyError"),
+            ]
+
+        monkeypatch.setattr(dc, "update_many_workbooks", _mock_update_many)
+        monkeypatch.setattr("builtins.input", lambda _: "n")
+        cts.update_many(str(tmp_path / "*"))
+        assert "Aborted." in capsys.readouterr().out
+        assert updated == []
+
+        monkeypatch.setattr("builtins.input", lambda _: "y")
+        cts.update_many(str(tmp_path / "*"), str(tmp_path / "a.xlsx"))
+        assert updated == [str(tmp_path / "a.xlsx"), str(tmp_path / "b.xlsx")]
+        captured = capsys.readouterr()
+        assert "a.xlsx" in captured.out and "ERROR" in captured.out
+
 
 def test_console(monkeypatch, capsys, console_command_list):
     # verify bad commands are handled
@@ -174,6 +371,13 @@ def test_console(monkeypatch, capsys, console_command_list):
     assert dc.console(console_command_list, test_flag=True) is None
 
 
+def test_run_command(console_command_list, capsys):
+    dc.run_command(console_command_list, ["hist"])
+    assert "hist <key>" in capsys.readouterr().out
+    dc.run_command(console_command_list, ["nope", "arg"])
+    assert "Unknown command nope." in capsys.readouterr().out
+
+
 def test_user_select_item(monkeypatch, capsys):
     # test empty list returns None
     empty_list = []
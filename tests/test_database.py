@@ -0,0 +1,345 @@
+import sqlite3
+import threading
+
+import pytest
+
+import datum.xl_populate_named_ranges as xlpnr
+from datum import database as db
+from datum import history
+
+METADATA = {
+    "part_name": "HOUSING",
+    "part_path": "HOUSING/B",
+    "part_rev": "B",
+    "retrieval_ts": "2022-05-08 09:27:57",
+}
+
+# queries the schema is indexed for
+VALUE_AT_REVISION = """--sql
+    SELECT p.param_value FROM parameters p
+    JOIN source_history s ON p.source_id = s.id
+    WHERE p.param_key = ? AND s.part_name = ? AND s.part_rev = ?
+    """
+LATEST_VALUES_OF_PART = """--sql
+    SELECT p.param_key, p.param_value, MAX(p.generation_time) FROM parameters p
+    JOIN source_history s ON p.source_id = s.id
+    WHERE s.part_name = ?
+    GROUP BY p.param_key
+    """
+KEY_HISTORY = """--sql
+    SELECT param_value, generation_time FROM parameters
+    WHERE param_key = ? AND generation_time > ?
+    ORDER BY generation_time
+    """
+
+
+@pytest.fixture
+def connection(tmp_path, monkeypatch):
+    monkeypatch.setattr(xlpnr, "DATUM_DB", str(tmp_path / "datum.db"))
+    connection = xlpnr.connect_database()
+    yield connection
+    connection.close()
+
+
+def _old_database(path):
+    """A database as written before schema version 1."""
+    connection = sqlite3.connect(path)
+    connection.execute(
+        """CREATE TABLE source_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, part_name TEXT, part_path TEXT,
+            part_rev TEXT, part_units TEXT, user TEXT, computer TEXT,
+            datum_version TEXT, source_type TEXT, source_version TEXT,
+            retrieval_ts TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )"""
+    )
+    connection.execute(
+        """CREATE TABLE parameters(
+            id INTEGER PRIMARY KEY AUTOINCREMENT, param_key TEXT,
+            param_value NUMERIC, generation_time TIMESTAMP
+        )"""
+    )
+    connection.executemany(
+        "INSERT INTO source_history (part_name, part_rev, retrieval_ts) VALUES (?, ?, ?)",
+        [
+            ("HOUSING", "A", "2022-05-01 10:00:00"),
+            ("HOUSING", "B", "2022-05-08 09:27:57"),
+        ],
+    )
+    connection.executemany(
+        "INSERT INTO parameters (param_key, param_value, generation_time) VALUES (?, ?, ?)",
+        [
+            ("HOUSING.mass", 10.5, "2022-05-01 10:00:00"),
+            ("HOUSING.mass", 11.5, "2022-05-08 09:27:57"),
+            ("HOUSING.volume", 3.0, "2021-01-01 00:00:00"),
+        ],
+    )
+    connection.commit()
+    return connection
+
+
+def test_migrate(tmp_path):
+    connection = _old_database(tmp_path / "old.db")
+    assert db.migrate(connection) == 0
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
+    assert connection.execute(
+        "SELECT param_key, param_value, source_id FROM parameters ORDER BY id"
+    ).fetchall() == [
+        ("HOUSING.mass", 10.5, 1),
+        ("HOUSING.mass", 11.5, 2),
+        ("HOUSING.volume", 3.0, None),  # no export with that timestamp
+    ]
+    assert connection.execute(
+        VALUE_AT_REVISION, ["HOUSING.mass", "HOUSING", "B"]
+    ).fetchall() == [(11.5,)]
+
+    # migrating again does nothing
+    assert db.migrate(connection) == db.SCHEMA_VERSION
+    connection.execute(f"PRAGMA user_version = {db.SCHEMA_VERSION + 1}")
+    with pytest.raises(RuntimeError):
+        db.migrate(connection)
+    connection.close()
+
+
+def test_migrate_rolls_back(tmp_path, monkeypatch):
+    connection = _old_database(tmp_path / "old.db")
+
+    def _failing_migration(connection):
+        connection.execute("ALTER TABLE parameters ADD COLUMN half_done TEXT")
+        raise sqlite3.OperationalError("migration failed")
+
+    monkeypatch.setattr(db, "MIGRATIONS", [_failing_migration])
+    with pytest.raises(sqlite3.OperationalError):
+        db.migrate(connection)
+    assert connection.execute("PRAGMA user_version").fetchone()[0] == 0
+    assert "half_done" not in db.table_columns(connection, "parameters")
+    connection.close()
+
+
+def test_write_links_source(connection):
+    xlpnr.write_database_parameters({"HOUSING.mass": 12.0}, METADATA)
+    # a second write from the same export reuses its source_history row
+    xlpnr.write_database_parameters({"HOUSING.volume": 3.0}, METADATA)
+    assert connection.execute("SELECT COUNT(*) FROM source_history").fetchone() == (1,)
+    assert connection.execute(
+        VALUE_AT_REVISION, ["HOUSING.volume", "HOUSING", "B"]
+    ).fetchall() == [(3.0,)]
+    with pytest.raises(sqlite3.IntegrityError):
+        connection.execute(
+            "INSERT INTO parameters (param_key, source_id) VALUES ('k', 99)"
+        )
+
+
+@pytest.mark.parametrize(
+    "query, arguments, indexes",
+    [
+        (
+            VALUE_AT_REVISION,
+            ["HOUSING.mass", "HOUSING", "B"],
+            ["source_history_part"],
+        ),
+        (
+            LATEST_VALUES_OF_PART,
+            ["HOUSING"],
+            ["source_history_part", "parameters_source"],
+        ),
+        (KEY_HISTORY, ["HOUSING.mass", "2022-01-01"], ["parameters_key_time"]),
+    ],
+)
+def test_query_plans(connection, query, arguments, indexes):
+    for index in range(50):
+        metadata = dict(
+            METADATA,
+            part_rev=str(index),
+            retrieval_ts=f"2022-05-{index % 28 + 1:02} 00:00:00",
+        )
+        xlpnr.write_database_parameters(
+            {f"KEY_{key}.mass": key * 1.5 + index for key in range(20)},
+            metadata,
+        )
+    connection.execute("ANALYZE")
+    plan = [
+        row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + query, arguments)
+    ]
+    for index in indexes:
+        assert any(f"INDEX {index} " in step for step in plan)
+    # no full table scans
+    assert not any(step.startswith("SCAN") for step in plan)
+
+
+def test_database_reuses_connection(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    database = db.Database("datum.db")
+    connection = database.connection
+    assert database.connection is connection
+    calls = []
+    monkeypatch.setattr(db, "migrate", lambda connection: calls.append(connection))
+    for index in range(3):
+        xlpnr.write_database_parameters(
+            {"HOUSING.mass": float(index)}, METADATA, database=database
+        )
+    assert calls == []  # the schema is only checked when the file is opened
+    assert database.connection is connection
+
+    # a relative path follows the working directory
+    (tmp_path / "other").mkdir()
+    monkeypatch.chdir(tmp_path / "other")
+    assert database.connection is not connection
+    assert len(calls) == 1
+    database.close()
+    assert (tmp_path / "datum.db").exists() and (tmp_path / "other/datum.db").exists()
+
+
+def test_database_transaction():
+    with db.Database(db.MEMORY) as database:
+        with database.transaction() as connection:
+            connection.execute("INSERT INTO parameters (param_key) VALUES ('a')")
+            # a nested transaction is part of the outer one
+            with database.transaction():
+                connection.execute("INSERT INTO parameters (param_key) VALUES ('b')")
+            assert connection.in_transaction
+        with pytest.raises(sqlite3.IntegrityError):
+            with database.transaction() as connection:
+                connection.execute("INSERT INTO parameters (param_key) VALUES ('c')")
+                connection.execute(
+                    "INSERT INTO parameters (param_key, source_id) VALUES ('d', 99)"
+                )
+        assert connection.execute(
+            "SELECT param_key FROM parameters ORDER BY id"
+        ).fetchall() == [("a",), ("b",)]
+
+
+@pytest.mark.parametrize(
+    "value, shape",
+    [
+        ([1.5, -2.0, 3.25], (3,)),
+        ([1, 2], (2,)),
+        ([[1.0, 0.0, 0.0], [0.0, 2.0, 0.0], [0.0, 0.0, 3.0]], (3, 3)),
+        ((4.0, 5.0), (2,)),
+        ([], (0,)),
+        ([[], []], (2, 0)),
+    ],
+)
+def test_pack_vector(value, shape):
+    blob = db.pack_vector(value)
+    assert db.is_packed(blob)
+    assert len(blob) == 4 + 4 * len(shape) + 8 * db._size(shape)
+    assert db.unpack_components(blob)[0] == shape
+    assert db.unpack_vector(blob, arrays=False) == json_lists(value)
+
+
+def json_lists(value):
+    """value with tuples as lists and numbers as floats."""
+    if isinstance(value, (list, tuple)):
+        return [json_lists(item) for item in value]
+    return float(value)
+
+
+@pytest.mark.parametrize(
+    "value", [1.5, "1.5", [1.0, "2"], [[1.0, 2.0], [3.0]], [1.0, None], {"x": 1.0}]
+)
+def test_pack_vector_other_values(value):
+    assert db.pack_vector(value) is None
+    assert db.decode_value(value) == value
+
+
+def test_unpack_vector_errors():
+    blob = db.pack_vector([1.0, 2.0])
+    for bad_blob in [blob[:3], blob[:-8], b"XX" + blob[2:], blob[:2] + b"f" + blob[3:]]:
+        with pytest.raises(ValueError):
+            db.unpack_components(bad_blob)
+
+
+def test_unpack_vector_numpy():
+    numpy = pytest.importorskip("numpy")
+    array = db.unpack_vector(db.pack_vector([[1.0, 2.0], [3.0, 4.0]]))
+    assert isinstance(array, numpy.ndarray) and array.shape == (2, 2)
+    assert array[1, 0] == 3.0
+
+
+def test_write_vectors(connection):
+    center = [1.0, 2.0, 3.0]
+    xlpnr.write_database_parameters({"HOUSING.center": center}, METADATA)
+    later = dict(METADATA, retrieval_ts="2022-05-09 09:00:00")
+    xlpnr.write_database_parameters({"HOUSING.center": [1.0, 2.0, 3.00001]}, later)
+    latest = dict(METADATA, retrieval_ts="2022-05-10 09:00:00")
+    xlpnr.write_database_parameters({"HOUSING.center": [1.0, 2.5, 3.0]}, latest)
+
+    records = list(history.key_history(connection, "HOUSING.center"))
+    # lists, or arrays if NumPy is installed
+    assert [list(record.param_value) for record in records] == [
+        center,
+        [1.0, 2.5, 3.0],
+    ]
+    assert list(records[1].previous_value) == center
+    (stored,) = connection.execute(
+        "SELECT typeof(param_value) FROM parameters LIMIT 1"
+    ).fetchone()
+    assert stored == "blob"
+
+
+def _insert(key):
+    def job(connection):
+        connection.execute("INSERT INTO parameters (param_key) VALUES (?)", [key])
+        return key
+
+    return job
+
+
+def _fail(connection):
+    connection.execute("INSERT INTO parameters (param_key) VALUES ('failed')")
+    raise ValueError("bad job")
+
+
+def test_database_writer(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    writer = db.DatabaseWriter("datum.db", max_jobs=2)
+    writer.flush()  # nothing submitted yet
+    futures = [writer.submit(_insert(key)) for key in ["a", "b", "c"]]
+    failed = writer.submit(_fail)
+    futures.append(writer.submit(_insert("d")))
+    writer.flush()
+    assert [future.result() for future in futures] == ["a", "b", "c", "d"]
+    with pytest.raises(ValueError):
+        failed.result()
+
+    # queued jobs are written before the writer stops
+    (tmp_path / "other").mkdir()
+    monkeypatch.chdir(tmp_path / "other")
+    last = writer.submit(_insert("e"))
+    writer.close()
+    assert last.done()
+
+    with db.Database(str(tmp_path / "datum.db")) as database:
+        assert database.connection.execute(
+            "SELECT param_key FROM parameters ORDER BY id"
+        ).fetchall() == [("a",), ("b",), ("c",), ("d",)]
+    with db.Database(str(tmp_path / "other/datum.db")) as database:
+        assert database.connection.execute(
+            "SELECT param_key FROM parameters"
+        ).fetchall() == [("e",)]
+
+
+def test_database_writer_batches(tmp_path, monkeypatch):
+    writer = db.DatabaseWriter(str(tmp_path / "datum.db"))
+    started, release = threading.Event(), threading.Event()
+
+    def _blocking(connection):
+        started.set()
+        release.wait()
+
+    transactions = []
+    real_transaction = db.Database.transaction
+
+    def _transaction(self):
+        transactions.append(self.db_file)
+        return real_transaction(self)
+
+    monkeypatch.setattr(db.Database, "transaction", _transaction)
+    writer.submit(_blocking)
+    started.wait()
+    # queued while the first job runs, so written together
+    for key in "abc":
+        writer.submit(_insert(key))
+    release.set()
+    writer.close()
+    assert len(transactions) == 2
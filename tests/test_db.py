@@ -44,25 +44,19 @@ BAD_DICT = {
 }
 
 @pytest.fixture
-def db_connection(monkeypatch):
-    connection = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES)
+def database():
+    database = xlpnr.Database(':memory:')
     print("Connected to Test DB")
-    # cursor = connection.cursor()
-    yield connection
-    connection.commit()
+    yield database
     print("Closing Test DB...")
-    connection.close()
+    database.close()
     
-def test_update_parameters(db_connection, monkeypatch, caplog):
+def test_update_parameters(database, caplog):
     GET_KVP = """--sql
         SELECT param_key, param_value, generation_time FROM parameters
         WHERE param_key=?"""
-
-    def _mock_db_con(*args, **kwargs):
-        return db_connection
-    monkeypatch.setattr("sqlite3.connect", _mock_db_con)
-    xlpnr.write_database_parameters(PARAMETER_DICT, METADATA_DICT, test_flag=True)
-    cursor = db_connection.cursor()
+    xlpnr.write_database_parameters(PARAMETER_DICT, METADATA_DICT, database=database)
+    cursor = database.connection.cursor()
     for key, value in PARAMETER_DICT.items():
         cursor.execute(GET_KVP, [key])
         test_key, test_val, timestamp = cursor.fetchone()
@@ -70,8 +64,76 @@ def test_update_parameters(db_connection, monkeypatch, caplog):
         assert test_val == value
         assert timestamp == datetime.datetime(2022, 5, 8, 9, 27, 57)
     
-    xlpnr.write_database_parameters(BAD_DICT, METADATA_DICT, test_flag=True)
-    for bad_type in ['list', 'dict', 'tests.test_db.MockWorkbook']:
+    xlpnr.write_database_parameters(BAD_DICT, METADATA_DICT, database=database)
+    for bad_type in ['dict', 'tests.test_db.MockWorkbook']:
         assert f"Dict with type <class '{bad_type}'>" in caplog.text
+    # lists of numbers are packed rather than stored as text
+    assert "<class 'list'>" not in caplog.text
     # monkeypatch.setitem(METADATA_DICT, 'retrieval_date', '2021-04-23 04:23:23')
-    
\ No newline at end of file
+    
+
+def test_connect_database(tmp_path):
+    connection = xlpnr.connect_database(str(tmp_path / "test.db"))
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert connection.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+    connection.close()
+
+
+def test_write_parameters_bulk(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(xlpnr, "DATUM_DB", str(tmp_path / "test.db"))
+    parameters = {f"key_{index}": index * 0.5 for index in range(1000)}
+    parameters.update({f"dict_{index}": {"x": index} for index in range(10)})
+    xlpnr.write_database_parameters(parameters, METADATA_DICT)
+    assert caplog.text.count("Dict with type <class 'dict'>") == 1
+    assert "10 values stored as text." in caplog.text
+
+    connection = sqlite3.connect(xlpnr.DATUM_DB)
+    rows = dict(connection.execute("SELECT param_key, param_value FROM parameters"))
+    assert len(rows) == 1010
+    assert rows["key_3"] == 1.5
+    assert rows["dict_3"] == "{'x': 3}"
+    connection.close()
+
+
+def test_write_changes_only(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(xlpnr, "DATUM_DB", str(tmp_path / "test.db"))
+    parameters = {"mass": 100.0, "count": 3, "name": "Banana", "list": [1, 2.0]}
+    xlpnr.write_database_parameters(parameters, METADATA_DICT)
+    later = dict(METADATA_DICT, retrieval_ts="2022-05-09 09:00:00")
+    # within DB_MIN_DIFF of the stored value
+    xlpnr.write_database_parameters(dict(parameters, mass=100.005), later)
+    assert "wrote 0 items" in caplog.text and "4 unchanged" in caplog.text
+    latest = dict(METADATA_DICT, retrieval_ts="2022-05-10 09:00:00")
+    xlpnr.write_database_parameters(
+        dict(parameters, mass=101.0, name="Apple", new_key=0), latest
+    )
+    xlpnr.write_database_parameters(parameters, latest, changes_only=False)
+
+    connection = sqlite3.connect(xlpnr.DATUM_DB)
+    rows = connection.execute(
+        "SELECT param_key, param_value, generation_time FROM parameters ORDER BY id"
+    ).fetchall()
+    connection.close()
+    assert [row[:2] for row in rows[4:7]] == [
+        ("mass", 101.0),
+        ("name", "Apple"),
+        ("new_key", 0),
+    ]
+    assert len(rows) == 11
+
+
+@pytest.mark.parametrize(
+    "stored, new, unchanged",
+    [
+        (100, 100.009, True),
+        (100, 100.011, False),
+        (0, 0.0, True),
+        (0, 1e-9, False),
+        ("Banana", "Banana", True),
+        ("2022-05-08 09:27:57", datetime.datetime(2022, 5, 8, 9, 27, 57), True),
+        ("[1, 2.0]", "[1, 2.0, 3]", False),
+        (1.5, "1.5", False),
+    ],
+)
+def test_is_unchanged(stored, new, unchanged):
+    assert xlpnr.is_unchanged(stored, new) is unchanged
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from datum import export_manifest
+
+
+def test_manifest_features():
+    range_names = [
+        "CHASSIS.mass",
+        "CHASSIS.center_of_mass.x",
+        "Sheet1!CHASSIS.center_of_mass.0",
+        "HOUSING.volume",
+        "summary_total",  # not a measurement
+        ".mass",
+        "CHASSIS.",
+    ]
+    assert export_manifest.manifest_features(range_names) == {
+        "CHASSIS": ["center_of_mass", "mass"],
+        "HOUSING": ["volume"],
+    }
+    assert export_manifest.manifest_features([]) == dict()
+
+
+def test_write_read_manifest(tmp_path):
+    manifest_file = tmp_path / "datum_manifest.json"
+    features = export_manifest.write_manifest(
+        manifest_file, ["HOUSING.volume", "CHASSIS.mass"]
+    )
+    assert list(features) == ["CHASSIS", "HOUSING"]
+    assert export_manifest.read_manifest(manifest_file) == features
+
+    manifest_file.write_text(json.dumps({"version": 0, "features": features}))
+    with pytest.raises(ValueError):
+        export_manifest.read_manifest(manifest_file)
+    manifest_file.write_text(json.dumps([features]))
+    with pytest.raises(ValueError):
+        export_manifest.read_manifest(manifest_file)
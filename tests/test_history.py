@@ -0,0 +1,157 @@
+import datetime
+
+import pytest
+
+import datum.xl_populate_named_ranges as xlpnr
+from datum import history
+
+
+def _metadata(part_rev, day):
+    return {
+        "part_name": "HOUSING",
+        "part_path": f"HOUSING/{part_rev}",
+        "part_rev": part_rev,
+        "retrieval_ts": f"2022-05-{day:02} 09:00:00",
+    }
+
+
+@pytest.fixture
+def connection(tmp_path, monkeypatch):
+    monkeypatch.setattr(xlpnr, "DATUM_DB", str(tmp_path / "datum.db"))
+    for part_rev, day, mass in [("A", 1, 10.0), ("A", 2, 12.5), ("B", 3, 15.0)]:
+        xlpnr.write_database_parameters(
+            {"HOUSING.mass": mass, f"HOUSING.rev_{part_rev}": day},
+            _metadata(part_rev, day),
+        )
+    connection = xlpnr.connect_database()
+    yield connection
+    connection.close()
+
+
+def test_key_history(connection, monkeypatch):
+    monkeypatch.setattr(history, "FETCH_ROWS", 2)  # stream in several batches
+    records = list(history.key_history(connection, "HOUSING.mass"))
+    assert [record.param_value for record in records] == [10, 12.5, 15]
+    assert [record.previous_value for record in records] == [None, 10, 12.5]
+    assert [record.part_rev for record in records] == ["A", "A", "B"]
+    assert records[0].generation_time == datetime.datetime(2022, 5, 1, 9)
+
+    since = datetime.datetime(2022, 5, 2, 9)
+    records = list(history.key_history(connection, "HOUSING.mass", since))
+    assert [record.param_value for record in records] == [12.5, 15]
+    # the previous value is only taken from the rows returned
+    assert records[0].previous_value is None
+    assert list(history.key_history(connection, "NOT.a_key")) == []
+
+
+def test_snapshot_values(connection):
+    (source_id,) = connection.execute(
+        "SELECT id FROM source_history WHERE part_rev = 'A' ORDER BY id DESC"
+    ).fetchone()
+    xlpnr.write_database_parameters({"HOUSING.mass": 13.0}, _metadata("A", 2))
+    records = list(history.snapshot_values(connection, source_id))
+    assert [(record.param_key, record.param_value) for record in records] == [
+        ("HOUSING.mass", 13),  # written twice, the last value is kept
+        ("HOUSING.rev_A", 2),
+    ]
+
+
+def test_snapshot_of_changes(connection):
+    """Keys not stored again from an export because they were
+    unchanged still appear in its snapshot."""
+    xlpnr.write_database_parameters(
+        {"HOUSING.mass": 15.0, "HOUSING.rev_B": 3, "HOUSING.volume": 4.0},
+        _metadata("B", 4),
+    )
+    (source_id,) = connection.execute("SELECT MAX(id) FROM source_history").fetchone()
+    assert connection.execute(
+        "SELECT param_key FROM parameters WHERE source_id = ?", [source_id]
+    ).fetchall() == [("HOUSING.volume",)]
+    snapshot = [
+        (record.param_key, record.param_value, record.part_rev)
+        for record in history.snapshot_values(connection, source_id)
+    ]
+    assert snapshot == [
+        ("HOUSING.mass", 15, "B"),
+        ("HOUSING.rev_A", 2, "A"),
+        ("HOUSING.rev_B", 3, "B"),
+        ("HOUSING.volume", 4, "B"),
+    ]
+    records = list(history.latest_values(connection, "HOUSING", "B"))
+    assert [record.param_key for record in records] == [key for key, *_ in snapshot]
+    # only the changes are in the history of a key
+    assert len(list(history.key_history(connection, "HOUSING.mass"))) == 3
+
+
+def test_values_at(connection):
+    values = history.values_at(
+        connection,
+        ["HOUSING.mass", "HOUSING.rev_B", "NOT.a_key"],
+        datetime.datetime(2022, 5, 2, 12),
+        "HOUSING",
+    )
+    assert values == {"HOUSING.mass": 12.5}
+    assert (
+        history.values_at(
+            connection, ["HOUSING.mass"], datetime.datetime(2022, 5, 2, 12), "GEARS"
+        )
+        == dict()
+    )
+
+
+def test_changes_of_parts_sharing_keys(connection):
+    """Values unchanged from another part's export are still stored
+    for this part, so its snapshot and latest values have them."""
+    shared = {"M.mass": 1.0, "M.cog": [1.0, 2.0, 3.0]}
+    metadata = {"part_name": "A", "retrieval_ts": "2022-05-05 09:00:00"}
+    xlpnr.write_database_parameters(shared, metadata)
+    metadata = {"part_name": "B", "retrieval_ts": "2022-05-06 09:00:00"}
+    xlpnr.write_database_parameters({**shared, "M.vol": 2.0}, metadata)
+    (source_id,) = connection.execute(
+        "SELECT id FROM source_history WHERE part_name = 'B'"
+    ).fetchone()
+    assert [
+        record.param_key for record in history.snapshot_values(connection, source_id)
+    ] == ["M.cog", "M.mass", "M.vol"]
+    records = list(history.latest_values(connection, "B"))
+    assert [(record.param_key, record.param_value) for record in records] == [
+        ("M.cog", [1.0, 2.0, 3.0]),
+        ("M.mass", 1.0),
+        ("M.vol", 2.0),
+    ]
+
+
+def test_latest_values(connection):
+    records = list(history.latest_values(connection, "HOUSING"))
+    assert [(record.param_key, record.param_value) for record in records] == [
+        ("HOUSING.mass", 15),
+        ("HOUSING.rev_A", 2),
+        ("HOUSING.rev_B", 3),
+    ]
+    records = list(history.latest_values(connection, "HOUSING", "A"))
+    assert [(record.param_key, record.param_value) for record in records] == [
+        ("HOUSING.mass", 12.5),
+        ("HOUSING.rev_A", 2),
+    ]
+    assert list(history.latest_values(connection, "GEARS")) == []
+
+
+class MockCursor:
+    def __init__(self, num_rows):
+        self.rows = list(range(num_rows))
+        self.fetches = 0
+
+    def fetchmany(self, size):
+        self.fetches += 1
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+def test_stream(monkeypatch):
+    monkeypatch.setattr(history, "FETCH_ROWS", 2)
+    cursor = MockCursor(5)
+    rows = history._stream(cursor)
+    assert next(rows) == 0
+    assert cursor.fetches == 1
+    assert list(rows) == [1, 2, 3, 4]
+    assert cursor.fetches == 4
@@ -0,0 +1,111 @@
+import csv
+import datetime
+import math
+
+import pytest
+
+import datum.xl_populate_named_ranges as xlpnr
+from datum import history, history_export
+
+
+def _metadata(part_rev, day):
+    return {
+        "part_name": "HOUSING",
+        "part_path": f"HOUSING/{part_rev}",
+        "part_rev": part_rev,
+        "retrieval_ts": f"2022-05-{day:02} 09:00:00",
+    }
+
+
+@pytest.fixture
+def connection(tmp_path, monkeypatch):
+    monkeypatch.setattr(xlpnr, "DATUM_DB", str(tmp_path / "datum.db"))
+    for part_rev, day, mass in [("A", 1, 10.0), ("A", 2, 12.5), ("B", 3, 15.0)]:
+        xlpnr.write_database_parameters(
+            {
+                "HOUSING.mass": mass,
+                "HOUSING.center": [0.0, 1.0, mass],
+                "HOUSING.material": f"Steel {part_rev}",
+                "GEARS.count": day,
+            },
+            _metadata(part_rev, day),
+        )
+    connection = xlpnr.connect_database()
+    yield connection
+    connection.close()
+
+
+def test_parameter_history(connection):
+    records = list(history.parameter_history(connection, "HOUSING.m*", rows=2))
+    assert [(record.param_key, record.param_value) for record in records] == [
+        ("HOUSING.mass", 10),
+        ("HOUSING.mass", 12.5),
+        ("HOUSING.mass", 15),
+        ("HOUSING.material", "Steel A"),
+        ("HOUSING.material", "Steel B"),
+    ]
+    records = history.parameter_history(
+        connection,
+        part_rev="A",
+        since=datetime.datetime(2022, 5, 2),
+        until=datetime.datetime(2022, 5, 3),
+    )
+    assert [record.param_key for record in records] == [
+        "GEARS.count",
+        "HOUSING.center",
+        "HOUSING.mass",
+    ]
+    assert list(history.parameter_history(connection, part_name="NONE")) == []
+
+
+def test_export_csv(connection, tmp_path):
+    csv_file = tmp_path / "history.csv"
+    assert history_export.export_history(connection, csv_file, "HOUSING.*") == 8
+    with open(csv_file, newline="") as file:
+        rows = list(csv.reader(file))
+    assert rows[0] == history_export.CSV_COLUMNS
+    assert rows[1] == [
+        "HOUSING.center",
+        "[0.0, 1.0, 10.0]",
+        "2022-05-01 09:00:00",
+        "HOUSING",
+        "A",
+        "1",
+    ]
+    assert rows[-1][:2] == ["HOUSING.material", "Steel B"]
+
+
+def test_export_columnar(connection, tmp_path):
+    columnar_file = tmp_path / "history.dhc"
+    assert history_export.export_history(connection, columnar_file) == 11
+    exported = list(history.parameter_history(connection))
+    # several row groups
+    history_export.export_columnar(exported, columnar_file, group_rows=4)
+    records = list(history_export.iter_columnar(columnar_file))
+    assert len(records) == 11
+    for record, stored in zip(records, exported):
+        assert record[:1] + record[2:] == stored[:1] + stored[2:]
+    values = {record.param_key: record.param_value for record in records}
+    assert values["HOUSING.center"] == "[0.0, 1.0, 15.0]"
+    assert values["HOUSING.material"] == "Steel B"
+    assert values["GEARS.count"] == 3.0
+
+    partial = [
+        history.ParameterRecord("k", None, None, None, None, None),
+        history.ParameterRecord("k", "2", datetime.datetime(2022, 1, 1), "P", None, 7),
+    ]
+    history_export.export_columnar(partial, columnar_file)
+    records = list(history_export.iter_columnar(columnar_file))
+    assert math.isnan(records[0].param_value)
+    assert records[0][2:] == (None, None, None, None, None)
+    assert records[1] == partial[1]
+
+
+def test_iter_columnar_errors(connection, tmp_path):
+    columnar_file = tmp_path / "history.dhc"
+    history_export.export_history(connection, columnar_file)
+    data = columnar_file.read_bytes()
+    for bad_data in [b"", b"DTMB\x01\x00", data[:-10], data[:10]]:
+        columnar_file.write_bytes(bad_data)
+        with pytest.raises(ValueError):
+            list(history_export.iter_columnar(columnar_file))
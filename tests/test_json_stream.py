@@ -0,0 +1,58 @@
+import io
+import json
+
+import pytest
+
+from datum import json_stream as js
+
+DOCUMENT = {
+    "METADATA": {"part_name": "HOUSING", "numbers": [1.5, -2e-3, 12345678]},
+    "measurements": [
+        {"name": "a", "expressions": [{"name": "mass", "value": 12.25}]},
+        {"name": 'b "quoted" ]}', "expressions": []},
+        12345678901234567890,
+        [],
+    ],
+    "after": True,
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, js.CHUNK_SIZE])
+@pytest.mark.parametrize("indent", [None, 4])
+def test_iter_json_array(chunk_size, indent):
+    text = json.dumps(DOCUMENT, indent=indent)
+    elements = list(js.iter_json_array(io.StringIO(text), "measurements", chunk_size))
+    assert elements == DOCUMENT["measurements"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5])
+def test_iter_json_array_is_lazy(chunk_size):
+    handle = io.StringIO('{"measurements": [1, 2, {"x": 3}' + " " * 1000 + "]}")
+    elements = js.iter_json_array(handle, "measurements", chunk_size)
+    assert next(elements) == 1
+    assert next(elements) == 2
+    assert handle.tell() < 100
+    assert list(elements) == [{"x": 3}]
+
+
+@pytest.mark.parametrize(
+    "text", ['{"measurements": []}', '{ "measurements" : [ ] , "other": 1}']
+)
+def test_iter_json_array_empty(text):
+    assert list(js.iter_json_array(io.StringIO(text), "measurements")) == []
+
+
+@pytest.mark.parametrize(
+    "text", ["{}", '{"dogs": [1, 2]}', '{"measurements": 5, "dogs": []}']
+)
+def test_iter_json_array_missing(text):
+    with pytest.raises(js.MissingKeyError):
+        list(js.iter_json_array(io.StringIO(text), "measurements"))
+
+
+def test_iter_json_array_errors():
+    with pytest.raises(TypeError):
+        list(js.iter_json_array(io.StringIO('[{"measurements": []}]'), "measurements"))
+    for text in ['{"measurements": [1, 2', '{"dogs": {{}}', "", '{"measurements" [1]}']:
+        with pytest.raises(json.JSONDecodeError):
+            list(js.iter_json_array(io.StringIO(text), "measurements", 3))
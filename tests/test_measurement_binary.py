@@ -0,0 +1,109 @@
+import json
+
+import pytest
+
+import datum.xl_populate_named_ranges as xlpnr
+from datum import measurement_binary as mb
+
+TEST_JSON_FILE = "tests/json/nx_measurements_test.json"
+
+
+def test_round_trip(tmp_path):
+    with open(TEST_JSON_FILE, "r") as json_handle:
+        document = json.load(json_handle)
+    binary_file = tmp_path / "measurements.dmb"
+    mb.write_measurement_binary(document, binary_file)
+    assert mb.load_measurement_binary(binary_file) == document
+    assert binary_file.stat().st_size < len(json.dumps(document)) / 2
+
+
+def test_same_pairs_as_json(tmp_path):
+    binary_file = mb.convert_json_to_binary(
+        TEST_JSON_FILE, tmp_path / "measurements.dmb"
+    )
+    document = xlpnr.load_measurement_document(binary_file)
+    assert document.pairs == xlpnr.get_json_key_value_pairs(TEST_JSON_FILE)
+    assert document.metadata == xlpnr.load_metadata_from_json(TEST_JSON_FILE)
+
+
+@pytest.mark.parametrize(
+    "value",
+    [
+        1.5,
+        4,
+        None,
+        True,
+        "text",
+        {"x": 1.0, "y": 2.0, "z": 3.0},
+        {"x": 1.0, "y": 2.0},
+        {"x": 1, "y": 2.0, "z": 3.0},
+        [1.0, 2.0, 3.0, 4.0],
+        [],
+        [1.0, "two"],
+        {"nested": [1.0]},
+    ],
+)
+def test_values(value, tmp_path):
+    document = {
+        "measurements": [
+            {"name": "m", "expressions": [{"name": "e", "type": "T", "value": value}]}
+        ]
+    }
+    binary_file = tmp_path / "value.dmb"
+    mb.write_measurement_binary(document, binary_file)
+    loaded = mb.load_measurement_binary(binary_file)
+    assert loaded == document
+    # integers and booleans keep their type
+    assert type(loaded["measurements"][0]["expressions"][0]["value"]) is type(value)
+
+
+def test_invalid_measurements(tmp_path, caplog):
+    document = {
+        "measurements": [
+            {"goose": "Frank"},
+            {"name": "Frank", "expressions": [{"bbq": False}]},
+            {"name": "empty", "expressions": []},
+        ]
+    }
+    binary_file = tmp_path / "invalid.dmb"
+    mb.write_measurement_binary(document, binary_file)
+    assert "is missing name and/or expressions" in caplog.text
+    assert "missing name/type/value fields in" in caplog.text
+    assert mb.load_measurement_binary(binary_file) == {
+        "measurements": [
+            {"name": "Frank", "expressions": []},
+            {"name": "empty", "expressions": []},
+        ]
+    }
+
+
+def test_corrupt(tmp_path):
+    binary_file = tmp_path / "corrupt.dmb"
+    mb.convert_json_to_binary(TEST_JSON_FILE, binary_file)
+    data = binary_file.read_bytes()
+
+    binary_file.write_bytes(data[:-8])
+    with pytest.raises(ValueError):
+        mb.load_measurement_binary(binary_file)
+    binary_file.write_bytes(b"{}" + data)
+    with pytest.raises(ValueError):
+        mb.load_measurement_binary(binary_file)
+    binary_file.write_bytes(data[:4] + b"\x63\x00" + data[6:])
+    with pytest.raises(ValueError, match="version 99"):
+        mb.load_measurement_binary(binary_file)
+    assert xlpnr.load_measurement_document(binary_file) is None
+
+
+def test_convert_json_to_binary(tmp_path):
+    json_file = tmp_path / "measurements.json"
+    json_file.write_text(json.dumps({"measurements": [], "METADATA": {"a": 1}}))
+    binary_file = mb.convert_json_to_binary(json_file)
+    assert binary_file == str(tmp_path / "measurements.dmb")
+    assert mb.load_measurement_binary(binary_file) == {
+        "measurements": [],
+        "METADATA": {"a": 1},
+    }
+
+    json_file.write_text("[]")
+    with pytest.raises(TypeError):
+        mb.convert_json_to_binary(json_file)
@@ -1,6 +1,8 @@
 from dataclasses import dataclass
 from collections import namedtuple
+import json
 import pytest
+import sqlite3
 import sys
 
 # Mock Missing NXOpen Module
@@ -15,6 +17,9 @@ NXOpen.Session.UpdateManager.DoInterpartUpdate = type(sys)("DoInterpartUpdate")
 sys.modules["NXOpen"] = NXOpen
 
 import nx_journals.nx_get_measurements as nxgm
+import nx_journals.nxmods as nxmods
+from datum.measurement_binary import load_measurement_binary
+from datum.spool import read_spool
 
 
 Point = namedtuple("Point", "X Y Z")
@@ -78,7 +83,7 @@ def test_get_WCS(nxSession):
 
 
 def test_get_metadata(nxSession, monkeypatch):
-    monkeypatch.setattr(nxgm, "nxprint", lambda arg: print(arg))
+    monkeypatch.setattr(nxgm, "nxprint", lambda arg, level=None: print(arg))
     md = nxgm.get_metadata(nxSession)["METADATA"]
     assert md["source_version"] == "1969"
     assert md["source_type"] == "NX"
@@ -94,8 +99,443 @@ def test_get_metadata(nxSession, monkeypatch):
 # TODO: Full coverage. Need several mock features.
 @pytest.mark.xfail
 def test_export(nxSession, monkeypatch):
-    monkeypatch.setattr(nxgm, "nxprint", lambda arg: print(arg))
-    monkeypatch.setattr(nxgm, "write_metadata_db", lambda _: None)
+    monkeypatch.setattr(nxgm, "nxprint", lambda arg, level=None: print(arg))
+    monkeypatch.setattr(nxgm, "spool_metadata", lambda _: None)
     # TODO: Pass valid JSON file?
     num_feats = nxgm.export_measurements("test str", nxSession)
     assert num_feats == 0
+
+
+def test_spool_metadata(tmp_path, monkeypatch):
+    monkeypatch.setattr(nxgm, "nxprint", lambda arg, level=None: print(arg))
+    monkeypatch.setattr(nxgm, "DATUM_SPOOL_FILE", str(tmp_path / "spool.jsonl"))
+    monkeypatch.setattr(nxgm, "DATUM_DB_FILE", str(tmp_path / "datum.db"))
+    metadata = {"part_name": "Mock Work Part", "part_rev": None}
+    nxgm.spool_metadata(metadata)
+    assert read_spool(nxgm.DATUM_SPOOL_FILE)[0] == [metadata]
+    assert not (tmp_path / "datum.db").exists()  # NX never waits on the database
+
+    # the fallback without the datum package binds values as parameters
+    nxgm.write_metadata_db(dict(metadata, part_name='Quoted "part"'))
+    connection = sqlite3.connect(nxgm.DATUM_DB_FILE)
+    assert connection.execute(
+        "SELECT part_name, part_rev FROM source_history"
+    ).fetchall() == [('Quoted "part"', None)]
+    connection.close()
+
+
+def test_export_binary(tmp_path, monkeypatch):
+    monkeypatch.setattr(nxgm, "nxprint", lambda arg, level=None: print(arg))
+    measurement_features = {
+        "measurements": [nxgm.get_WCS(MockSession())],
+        "METADATA": {"part_name": "Mock Work Part"},
+    }
+    binary_file = nxgm.export_binary(tmp_path / "export.json", measurement_features)
+    assert binary_file == str(tmp_path / "export.dmb")
+    assert load_measurement_binary(binary_file) == measurement_features
+
+
+class MockListingWindow:
+    def __init__(self):
+        self.calls = []
+
+    def Open(self):
+        self.calls.append("Open")
+
+    def WriteLine(self, text):
+        self.calls.append(text)
+
+    def Close(self):
+        self.calls.append("Close")
+
+
+def test_listing_writer(monkeypatch):
+    window = MockListingWindow()
+    session = namedtuple("Session", "ListingWindow")(window)
+    monkeypatch.setattr("NXOpen.Session.GetSession", lambda: session)
+    writer = nxmods.ListingWriter(flush_lines=3, verbosity=nxmods.NORMAL)
+    writer.write("one")
+    writer.write("Feature is suppressed.", nxmods.DETAIL)  # dropped
+    writer.write(2)
+    assert window.calls == []
+    writer.write("three")
+    # the window is opened once, and the buffered lines written together
+    assert window.calls == ["Open", "one\n2\nthree"]
+    writer.write("four")
+    writer.close()
+    assert window.calls == ["Open", "one\n2\nthree", "four", "Close"]
+    writer.close()
+    assert len(window.calls) == 4
+
+
+def test_listing_writer_console(monkeypatch, capsys):
+    monkeypatch.setitem(sys.modules, "NXOpen", None)  # outside NX
+    writer = nxmods.ListingWriter()
+    writer.write("first")
+    writer.write("second", nxmods.DETAIL)
+    assert capsys.readouterr().out == ""
+    writer.flush()
+    assert capsys.readouterr().out == "first\nsecond\n"
+
+
+@dataclass
+class MockExpression:
+    Description: str
+    Value: float
+    Type: str = "Number"
+    Units = namedtuple("Units", "Name")("MilliMeter")
+
+
+class MockMeasurement:
+    FeatureType = "MEASUREMENT"
+    Suppressed = False
+
+    def __init__(self, name, timestamp, value):
+        self.Name = name
+        self.JournalIdentifier = f"MEASURE_DISTANCE({name})"
+        self.Timestamp = timestamp
+        self.value = value
+        self.reads = 0
+
+    def GetExpressions(self):
+        self.reads += 1
+        return [MockExpression("p7( Distance : distance )", self.value)]
+
+
+def test_export_metadata_once(tmp_path, monkeypatch):
+    """The JSON file and the spool record have the same retrieval_ts,
+    which ingest matches to find an export already in the database."""
+    calls = []
+    spooled = []
+
+    def _get_metadata(_):
+        calls.append(None)
+        return {"METADATA": {"retrieval_ts": f"2022-05-02 09:00:0{len(calls)}"}}
+
+    monkeypatch.setattr(nxgm, "nxprint", lambda arg, level=None: print(arg))
+    monkeypatch.setattr(nxgm, "get_metadata", _get_metadata)
+    monkeypatch.setattr(nxgm, "spool_metadata", spooled.append)
+    session = MockSession()
+    session.Parts = namedtuple("Parts", "Work")(
+        namedtuple("Work", "Features WCS FullPath")([], MockWCS(), "PART/A")
+    )
+    json_file = tmp_path / "export.json"
+    nxgm.export_measurements(str(json_file), session)
+    with open(json_file) as file:
+        assert json.load(file)["METADATA"] == spooled[0]
+    assert len(calls) == 1
+
+
+@dataclass
+class MockSavedPart:
+    Features: list
+    FullPath: str
+    IsModified: bool = False
+    WCS = MockWCS()
+
+
+def test_export_incremental(tmp_path, monkeypatch):
+    monkeypatch.setattr(nxgm, "nxprint", lambda arg, level=None: print(arg))
+    monkeypatch.setattr(nxgm, "spool_metadata", lambda _: None)
+    monkeypatch.setattr(nxgm, "get_metadata", lambda _: {"METADATA": {}})
+    features = [MockMeasurement("A", 10, 1.5), MockMeasurement("B", 11, 2.5)]
+    part_file = tmp_path / "A.prt"
+    part_file.write_bytes(b"part")
+    work = MockSavedPart(features, str(part_file))
+    session = MockSession()
+    session.Parts = namedtuple("Parts", "Work")(work)
+    json_file = str(tmp_path / "export.json")
+    full_file = str(tmp_path / "full.json")
+
+    def _export(incremental=True):
+        export_file = json_file if incremental else full_file
+        assert nxgm.export_measurements(export_file, session, incremental) == 2
+        with open(export_file) as file:
+            return file.read()
+
+    assert _export() == _export(incremental=False)
+    assert [feature.reads for feature in features] == [2, 2]
+    # the saved part is unchanged, so its features come from the cache
+    assert _export() == _export(incremental=False)
+    assert [feature.reads for feature in features] == [3, 3]
+
+    # a value updated from changed geometry keeps the feature's timestamp,
+    # but the part is modified, so every feature is read again
+    features[1].value = 4.0
+    work.IsModified = True
+    assert _export() == _export(incremental=False)
+    assert [feature.reads for feature in features] == [5, 5]
+    assert "4.0" in _export()
+
+    # saving the part changes its file, which the cache was not made from
+    work.IsModified = False
+    part_file.write_bytes(b"saved part")
+    assert _export() == _export(incremental=False)
+    assert [feature.reads for feature in features] == [8, 8]
+    assert _export() == _export(incremental=False)
+    assert [feature.reads for feature in features] == [9, 9]
+
+    cache_file = nxgm.cache_file_path(json_file)
+    assert cache_file == str(tmp_path / "export.cache.json")
+    part_state = nxgm.saved_part_state(work)
+    assert nxgm.load_export_cache(cache_file, part_state) != dict()
+    assert nxgm.load_export_cache(cache_file, None) == dict()
+    work.FullPath = "PART/A"  # not a file
+    assert nxgm.saved_part_state(work) is None
+    with open(cache_file, "w") as file:
+        file.write("{not json")
+    assert nxgm.load_export_cache(cache_file, part_state) == dict()
+
+
+def test_export_manifest(tmp_path, monkeypatch):
+    monkeypatch.setattr(nxgm, "nxprint", lambda arg, level=None: print(arg))
+    monkeypatch.setattr(nxgm, "spool_metadata", lambda _: None)
+    monkeypatch.setattr(nxgm, "get_metadata", lambda _: {"METADATA": {}})
+    features = [
+        MockMeasurement("A", 10, 1.5),
+        MockMeasurement("B C", 11, 2.5),
+        MockMeasurement("D", 12, 3.5),
+    ]
+    session = MockSession()
+    session.Parts = namedtuple("Parts", "Work")(
+        namedtuple("Work", "Features WCS FullPath")(features, MockWCS(), "PART/A")
+    )
+    json_file = str(tmp_path / "export.json")
+    manifest = {"B_C": ["distance"], "D": ["angle"]}
+    assert nxgm.export_measurements(json_file, session, manifest=manifest) == 2
+    with open(json_file) as file:
+        exported = json.load(file)
+    measurements = {m["name"]: m["expressions"] for m in exported["measurements"]}
+    # D has no expression the manifest names, and A isn't read at all
+    assert list(measurements) == ["World Coordinate System", "B C", "D"]
+    assert [e["value"] for e in measurements["B C"]] == [2.5]
+    assert measurements["D"] == []
+    assert [feature.reads for feature in features] == [0, 1, 1]
+
+
+class MockPrototype:
+    loaded = 0
+    max_loaded = 0
+
+    def __init__(self, name, features, fully_loaded=False):
+        self.Name = name
+        self.Features = features
+        self.IsFullyLoaded = fully_loaded
+        self.IsModified = False
+        self.loads = 0
+
+    def LoadThisPartFully(self):
+        self.loads += 1
+        self.IsFullyLoaded = True
+        MockPrototype.loaded += 1
+        MockPrototype.max_loaded = max(MockPrototype.max_loaded, MockPrototype.loaded)
+
+    def Close(self, *args):
+        self.IsFullyLoaded = False
+        MockPrototype.loaded -= 1
+
+
+class MockComponent:
+    def __init__(self, name, prototype, children=(), tag=None, part=None):
+        self.Name = name
+        self.Prototype = prototype
+        self.children = list(children)
+        self.IsSuppressed = False
+        self.Tag = tag
+        self.part = part  # opened by OpenComponents
+
+    def GetChildren(self):
+        return self.children
+
+
+class MockComponentAssembly:
+    def __init__(self, root):
+        self.RootComponent = root
+        self.opened = []
+
+    def OpenComponents(self, option, components):
+        for component in components:
+            self.opened.append(component.Name)
+            component.Prototype = component.part
+        return namedtuple("PartLoadStatus", "Dispose")(lambda: None), []
+
+
+def test_harvest_components(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(nxgm, "nxprint", lambda arg, level=None: print(arg))
+    monkeypatch.setattr(nxgm, "spool_metadata", lambda _: None)
+    monkeypatch.setattr(nxgm, "get_metadata", lambda _: {"METADATA": {}})
+    BasePart = namedtuple("BasePart", "CloseWholeTree CloseModified")(
+        namedtuple("CloseWholeTree", "FalseValue")(False),
+        namedtuple("CloseModified", "DontCloseModified")(0),
+    )
+    monkeypatch.setattr(NXOpen, "BasePart", BasePart, False)
+    OpenOption = namedtuple("OpenOption", "ComponentOnly")(1)
+    Assemblies = type(sys)("Assemblies")
+    Assemblies.ComponentAssembly = namedtuple("ComponentAssembly", "OpenOption")(
+        OpenOption
+    )
+    monkeypatch.setattr(NXOpen, "Assemblies", Assemblies, False)
+    bracket = MockPrototype("bracket", [MockMeasurement("HOLE", 1, 5.0)])
+    frame = MockPrototype("frame", [MockMeasurement("SPAN", 2, 800.0)])
+    wheel = MockPrototype("wheel", [MockMeasurement("RIM", 3, 300.0)], True)
+    spare = MockPrototype("spare", [MockMeasurement("BOLT", 5, 2.0)])
+    brackets = [MockComponent(f"BRACKET {n}", bracket, tag=n) for n in [1, 2]]
+    root = MockComponent(
+        "CART",
+        None,
+        [
+            MockComponent("FRAME", frame, brackets, tag=3),
+            MockComponent("WHEEL", wheel, tag=4),
+            MockComponent("SPARE", None, tag=5, part=spare),  # not loaded
+            MockComponent("LOST", None, tag=6),  # its part can't be opened
+        ],
+    )
+    group = namedtuple("Group", "Name GetComponents")("BRACKETS", lambda: brackets)
+    Work = namedtuple("Work", "Features WCS FullPath ComponentAssembly ComponentGroups")
+    work = Work(
+        [MockMeasurement("TOTAL", 4, 1.0)],
+        MockWCS(),
+        "CART/A",
+        MockComponentAssembly(root),
+        [group],
+    )
+    session = MockSession()
+    session.Parts = namedtuple("Parts", "Work")(work)
+    json_file = str(tmp_path / "export.json")
+
+    assert nxgm.export_measurements(json_file, session, harvest=True) == 6
+    with open(json_file) as file:
+        exported = json.load(file)
+    assert [m["name"] for m in exported["measurements"]] == [
+        "World Coordinate System",
+        "TOTAL",
+        "FRAME__BRACKET 1__HOLE",
+        "FRAME__BRACKET 2__HOLE",
+        "FRAME__SPAN",
+        "WHEEL__RIM",
+        "SPARE__BOLT",
+    ]
+    # the bracket is read once for both components, before the frame
+    assert [p.Features[0].reads for p in [bracket, frame, wheel]] == [1, 1, 1]
+    assert MockPrototype.max_loaded == 1 and MockPrototype.loaded == 0
+    assert (bracket.loads, bracket.IsFullyLoaded) == (1, False)
+    assert (wheel.loads, wheel.IsFullyLoaded) == (0, True)  # left as it was
+    # the spare's part is opened, read and closed
+    assert work.ComponentAssembly.opened == ["SPARE", "LOST"]
+    assert (spare.loads, spare.IsFullyLoaded) == (1, False)
+    out = capsys.readouterr().out
+    assert "bracket: loaded in" in out and "for 2 components" in out
+    assert "skipped 1 components that could not be loaded: LOST" in out
+
+    # the frame's prototype isn't loaded for a manifest that doesn't name it
+    manifest = {"FRAME__BRACKET_2__HOLE": ["distance"], "WHEEL__RIM": ["angle"]}
+    assert nxgm.export_measurements(json_file, session, False, manifest, True) == 2
+    with open(json_file) as file:
+        exported = json.load(file)
+    assert [m["name"] for m in exported["measurements"][1:]] == [
+        "FRAME__BRACKET 2__HOLE",
+        "WHEEL__RIM",
+    ]
+    assert exported["measurements"][1]["expressions"][0]["value"] == 5.0
+    assert exported["measurements"][2]["expressions"] == []
+    assert (bracket.loads, frame.loads) == (2, 1)
+
+    # only the brackets' group
+    harvested = nxgm.harvest_components(session, None, "BRACKETS")
+    assert [feature["name"] for feature in harvested] == [
+        "FRAME__BRACKET 1__HOLE",
+        "FRAME__BRACKET 2__HOLE",
+    ]
+    assert nxgm.harvest_components(session, None, "WHEELS") == []
+
+    # a prototype with unsaved changes is left open, and listed
+    bracket.IsModified = True
+    capsys.readouterr()
+    assert len(nxgm.harvest_components(session, None, "BRACKETS")) == 2
+    assert bracket.IsFullyLoaded
+    assert "prototypes with unsaved changes open: bracket" in capsys.readouterr().out
+
+
+class MockIndexedFeature:
+    name_reads = 0
+
+    def __init__(self, name, timestamp, feature_type="MEASURE_BODY"):
+        self._name = name
+        self.Timestamp = timestamp
+        self.Tag = 1000 + timestamp
+        self.FeatureType = feature_type
+        self.deleted = False
+
+    @property
+    def Name(self):
+        MockIndexedFeature.name_reads += 1
+        if self.deleted:
+            raise RuntimeError("object has been deleted")
+        return self._name
+
+
+class MockFeatureCollection:
+    def __init__(self, features):
+        self.features = features
+        self.calls = 0
+
+    def GetFeatures(self):
+        self.calls += 1
+        return tuple(self.features)
+
+
+def test_feature_index(monkeypatch):
+    features = [
+        MockIndexedFeature("MASS", 1),
+        MockIndexedFeature("MASS", 2, "MEASURE_DISTANCE"),
+        MockIndexedFeature("LENGTH", 3, "MEASURE_DISTANCE"),
+    ]
+    collection = MockFeatureCollection(features)
+    part = namedtuple("Part", "Tag Features")(77, collection)
+    index = nxmods.feature_index(part)
+    assert nxmods.feature_index(part) is index
+    assert index.find("MASS") is features[0]  # the first of a name
+    assert index.find("MASS", "MEASURE_DISTANCE") is features[1]
+    assert index.find("MASS", "EXTRUDE") is None
+    assert index.find_by_tag(1003) is features[2]
+    assert index.find("NOT A FEATURE") is None
+    assert collection.calls == 3  # built, then rebuilt for each miss
+
+    # found without getting the features from NX again
+    MockIndexedFeature.name_reads = 0
+    for _ in range(100):
+        assert index.find("LENGTH") is features[2]
+        assert index.find_by_tag(1001) is features[0]
+    assert MockIndexedFeature.name_reads == 200
+    assert collection.calls == 3
+    # a name not found gets the features again, once for each lookup
+    assert index.find("NOT A FEATURE") is None
+    assert collection.calls == 4
+
+    # a feature added is found
+    features.append(MockIndexedFeature("VOLUME", 4))
+    assert index.find("VOLUME") is features[3]
+    assert index.find_by_tag(1004) is features[3]
+    assert collection.calls == 5
+    # a renamed feature is noticed when it is found
+    features[2]._name = "WIDTH"
+    assert index.find("LENGTH") is None
+    assert index.find("WIDTH") is features[2]
+    assert collection.calls == 6
+    # and a deleted one, by name or by tag
+    features[0].deleted = True
+    del features[0]
+    assert index.find_by_tag(1001) is None
+    assert index.find("MASS") is features[0]
+    assert index.find("MASS", "MEASURE_BODY") is None
+    assert collection.calls == 8
+
+
+def test_find_feature_by_name_index(monkeypatch):
+    features = [MockIndexedFeature("MASS", 1), MockIndexedFeature("LENGTH", 2)]
+    work = namedtuple("Work", "Tag Features")(78, MockFeatureCollection(features))
+    session = namedtuple("Session", "Parts")(namedtuple("Parts", "Work")(work))
+    monkeypatch.setattr("NXOpen.Session.GetSession", lambda: session)
+    assert nxgm.find_feature_by_name("LENGTH") is features[1]
+    assert nxgm.find_feature_by_name("LENGTH", "MEASURE_BODY") is features[1]
+    assert nxgm.find_feature_by_name("LENGTH", "EXTRUDE") is None
@@ -0,0 +1,124 @@
+import datetime
+import sqlite3
+
+import pytest
+
+import datum.xl_populate_named_ranges as xlpnr
+from datum import history, retention
+
+NOW = datetime.datetime(2022, 7, 1)
+
+
+def _metadata(part_rev, timestamp):
+    return {
+        "part_name": "HOUSING",
+        "part_path": f"HOUSING/{part_rev}",
+        "part_rev": part_rev,
+        "retrieval_ts": timestamp.isoformat(" "),
+    }
+
+
+@pytest.fixture
+def connection(tmp_path, monkeypatch):
+    """Two exports a day from May 2 to June 30, revision B from June 1,
+    with the mass changing every third export and the volume once."""
+    monkeypatch.setattr(xlpnr, "DATUM_DB", str(tmp_path / "datum.db"))
+    database = xlpnr.open_database()
+    start = datetime.datetime(2022, 5, 2, 9)
+    for index in range(120):
+        timestamp = start + datetime.timedelta(hours=12 * index)
+        parameters = {"HOUSING.mass": 10.0 + index // 3, "HOUSING.volume": 2.0}
+        if index == 100:
+            parameters["HOUSING.volume"] = 3.0
+        part_rev = "A" if timestamp.month == 5 else "B"
+        xlpnr.write_database_parameters(
+            parameters, _metadata(part_rev, timestamp), database=database
+        )
+    connection = database.connection
+    yield connection
+    database.close()
+
+
+def _snapshots(connection):
+    return {
+        source_id: list(history.snapshot_values(connection, source_id))
+        for (source_id,) in connection.execute("SELECT id FROM source_history")
+    }
+
+
+def test_exports_to_prune(connection):
+    export_ids = retention.exports_to_prune(connection, 30, NOW)
+    kept = connection.execute(
+        "SELECT part_rev, retrieval_ts FROM source_history "
+        "WHERE id NOT IN (%s) AND retrieval_ts < '2022-06-01'"
+        % ", ".join(map(str, export_ids))
+    ).fetchall()
+    # the last export of revision A in each week of May
+    assert [str(timestamp) for _, timestamp in kept] == [
+        "2022-05-08 21:00:00",
+        "2022-05-15 21:00:00",
+        "2022-05-22 21:00:00",
+        "2022-05-29 21:00:00",
+        "2022-05-31 21:00:00",
+    ]
+    assert len(export_ids) == 60 - 5
+    assert retention.exports_to_prune(connection, 365, NOW) == []
+
+
+def test_prune_history(connection, monkeypatch):
+    monkeypatch.setattr(retention, "PRUNE_PAUSE_SECONDS", 0)
+    before = _snapshots(connection)
+    num_parameters = connection.execute("SELECT COUNT(*) FROM parameters").fetchone()
+    dry_run = retention.prune_history(connection, 30, dry_run=True, now=NOW)
+    assert dry_run.dry_run and dry_run.exports == 55 and dry_run.bytes > 0
+    assert _snapshots(connection) == before  # nothing changed
+
+    report = retention.prune_history(
+        connection, 30, now=NOW, chunk_exports=10  # in several chunks
+    )
+    assert report[:3] == dry_run[:3]
+    assert not report.dry_run
+    # the volume stored once from the first export is kept for later ones
+    assert report.relinked >= 1
+    assert (
+        connection.execute("SELECT COUNT(*) FROM parameters").fetchone()[0]
+        == num_parameters[0] - report.deleted
+    )
+    after = _snapshots(connection)
+    assert len(after) == len(before) - report.exports
+    for source_id, snapshot in after.items():
+        # the same values, though moved values now come from a kept export
+        assert [record[:3] for record in snapshot] == [
+            record[:3] for record in before[source_id]
+        ]
+    assert connection.execute("PRAGMA foreign_key_check").fetchall() == []
+    assert retention.prune_history(connection, 30, now=NOW).exports == 0
+
+
+def test_incremental_vacuum(tmp_path):
+    db_file = str(tmp_path / "old.db")
+    connection = sqlite3.connect(db_file)
+    connection.execute("CREATE TABLE data (value BLOB)")
+    connection.executemany(
+        "INSERT INTO data VALUES (?)", [[bytes(4000)] for _ in range(200)]
+    )
+    connection.commit()
+    assert connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    assert retention.enable_incremental_vacuum(connection)
+    assert not retention.enable_incremental_vacuum(connection)
+
+    connection.execute("DELETE FROM data")
+    connection.commit()
+    page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+    assert free_pages > 100
+    assert retention.vacuum_step(connection, 100) == free_pages - 100
+    assert connection.execute("PRAGMA page_count").fetchone()[0] == page_count - 100
+    while retention.vacuum_step(connection):
+        pass
+    connection.close()
+
+    # new databases are created for incremental vacuum
+    connection = xlpnr.connect_database(str(tmp_path / "new.db"))
+    assert connection.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    connection.close()
@@ -0,0 +1,101 @@
+import datetime
+import json
+import sqlite3
+
+import pytest
+
+import datum.xl_populate_named_ranges as xlpnr
+from datum import spool
+
+
+def _export(part_rev, day):
+    return {
+        "part_name": "HOUSING",
+        "part_path": f"HOUSING/{part_rev}",
+        "part_rev": part_rev,
+        "retrieval_ts": f"2022-05-{day:02} 09:00:00",
+        "source_type": "NX",
+    }
+
+
+@pytest.fixture
+def connection(tmp_path, monkeypatch):
+    monkeypatch.setattr(xlpnr, "DATUM_DB", str(tmp_path / "datum.db"))
+    connection = xlpnr.connect_database()
+    yield connection
+    connection.close()
+
+
+def _ingest(connection, spool_file):
+    with connection:
+        return spool.ingest_spool(connection, spool_file)
+
+
+def test_append_record(tmp_path):
+    spool_file = tmp_path / "spool.jsonl"
+    spool.append_record(spool_file, _export("A", 1))
+    spool.append_record(spool_file, {"when": datetime.datetime(2022, 5, 2)})
+    lines = spool_file.read_bytes().split(b"\n")
+    assert json.loads(lines[0]) == _export("A", 1)
+    assert json.loads(lines[1]) == {"when": "2022-05-02 00:00:00"}
+    assert lines[2] == b""
+
+
+def test_read_spool(tmp_path, caplog):
+    spool_file = tmp_path / "spool.jsonl"
+    spool.append_record(spool_file, _export("A", 1))
+    with open(spool_file, "ab") as file:
+        file.write(b"not json\n[1, 2]\n\n")
+    end = spool_file.stat().st_size
+    spool.append_record(spool_file, _export("B", 2))
+    with open(spool_file, "ab") as file:
+        file.write(b'{"part_name": "HOUS')  # still being written
+
+    records, position = spool.read_spool(spool_file)
+    assert records == [_export("A", 1), _export("B", 2)]
+    assert caplog.text.count("Skipped spool line") == 2
+    records, position = spool.read_spool(spool_file, end)
+    assert records == [_export("B", 2)]
+    assert position == spool_file.stat().st_size - len(b'{"part_name": "HOUS')
+
+
+def test_ingest_spool(tmp_path, connection):
+    spool_file = tmp_path / "spool.jsonl"
+    assert _ingest(connection, spool_file) == (0, 0, 0)
+    # an export the console already wrote parameters from
+    xlpnr.write_database_parameters({"HOUSING.mass": 1.0}, _export("A", 1))
+    for part_rev, day in [("A", 1), ("A", 2), ("B", 3)]:
+        spool.append_record(spool_file, _export(part_rev, day))
+    report = _ingest(connection, spool_file)
+    assert report == (3, 2, spool_file.stat().st_size)
+    rows = connection.execute(
+        "SELECT part_rev, retrieval_ts, source_type FROM source_history ORDER BY id"
+    ).fetchall()
+    assert [row[:2] for row in rows] == [
+        ("A", datetime.datetime(2022, 5, 1, 9)),
+        ("A", datetime.datetime(2022, 5, 2, 9)),
+        ("B", datetime.datetime(2022, 5, 3, 9)),
+    ]
+
+    # only records after the high-water mark are read
+    assert _ingest(connection, spool_file) == (0, 0, report.position)
+    spool.append_record(spool_file, _export("C", 4))
+    assert _ingest(connection, spool_file).added == 1
+
+    # a replaced spool file is read again from the start, without duplicates
+    spool_file.unlink()
+    spool.append_record(spool_file, _export("C", 4))
+    assert _ingest(connection, spool_file) == (1, 0, spool_file.stat().st_size)
+    assert connection.execute("SELECT COUNT(*) FROM source_history").fetchone() == (4,)
+
+
+def test_ingest_spool_rolls_back(tmp_path, connection):
+    spool_file = tmp_path / "spool.jsonl"
+    spool.append_record(spool_file, _export("A", 1))
+    spool.append_record(spool_file, {"not_a_column": 1, "retrieval_ts": None})
+    spool.append_record(spool_file, {"part_name": {"not": "a value"}})
+    with pytest.raises(sqlite3.Error):
+        _ingest(connection, spool_file)
+    # neither the records nor the mark were committed
+    assert connection.execute("SELECT COUNT(*) FROM source_history").fetchone() == (0,)
+    assert connection.execute("SELECT COUNT(*) FROM spool_marks").fetchone() == (0,)
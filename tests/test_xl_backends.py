@@ -0,0 +1,278 @@
+import concurrent.futures
+import datetime
+import functools
+import multiprocessing
+import os
+import shutil
+import stat
+import sys
+import zipfile
+import xml.etree.ElementTree as ET
+
+import pytest
+
+import datum.xl_populate_named_ranges as xlpnr
+from datum import xl_backends as xlb
+from datum.xl_ranges import RangeAddress
+
+TEST_EXCEL_WB = "tests/xl/datum_excel_tests.xlsx"
+
+
+@pytest.fixture
+def workbook_path(tmp_path):
+    path = tmp_path / "datum_excel_tests.xlsx"
+    shutil.copy(TEST_EXCEL_WB, path)
+    return path
+
+
+def test_open_workbook(workbook_path):
+    backend = xlb.open_workbook(str(workbook_path))
+    assert isinstance(backend, xlb.OfflineWorkbook)
+    assert backend.name == "datum_excel_tests.xlsx"
+    assert xlb.open_workbook(backend) is backend
+    assert xlb.is_workbook_path(workbook_path)
+    assert not xlb.is_workbook_path(backend)
+
+
+@pytest.mark.parametrize(
+    "format_code, is_date",
+    [
+        ("yyyy-mm-dd", True),
+        ("h:mm AM/PM", True),
+        ("General", False),
+        ("0.00", False),
+        ('0.00 "mm"', False),
+        ("[Red]#,##0", False),
+    ],
+)
+def test_is_date_format(format_code, is_date):
+    assert xlb.is_date_format(format_code) == is_date
+
+
+class TestOfflineWorkbook:
+    def test_names(self, workbook_path):
+        names = xlb.OfflineWorkbook(workbook_path).names()
+        assert names["Test_Int"] == "='Other Tests'!$B$2"
+        assert names["missing_ref"] == "='Other Tests'!#REF!"
+
+    def test_read(self, workbook_path):
+        values = xlpnr.get_workbook_key_value_pairs(str(workbook_path))
+        assert values["Test_Int"] == 4
+        assert values["Test_Str"] == "Kivo is a dork"
+        assert values["Test_Float"] == 3.141519
+        assert values["Test_Date"] == datetime.datetime(2022, 5, 1)
+        assert values["Empty_Range"] is None
+        assert values["Test_List"] == [1, 2, 3]
+        assert values["Test_Vector"] == [1, 2, 3]
+        assert values["Test_Empty_List"] == [None, None, None]
+        assert values["Test_Matrix"] == [[1, 2, 3], [4, 5, 6], [7, 8, 9]]
+        assert values["Test_Empty_Matrix"] == [[None] * 3] * 3
+        assert "missing_ref" not in values
+
+    def test_write_and_save(self, workbook_path):
+        workbook = xlb.OfflineWorkbook(workbook_path)
+        date = datetime.datetime(2023, 1, 2, 12, 30)
+        workbook.write_range("Other Tests", 2, 2, [["text"]])
+        workbook.write_range("Other Tests", 5, 2, [[date]])
+        # new cells, out of order, on new rows and past existing rows
+        workbook.write_range("Other Tests", 200, 3, [[True, None, 1.5]])
+        workbook.write_range("Other Tests", 1, 30, [[" padded "]])
+        workbook.save()
+
+        reopened = xlb.OfflineWorkbook(workbook_path)
+        assert reopened.read_range(RangeAddress("Other Tests", 2, 2, 2, 2)) == [
+            ["text"]
+        ]
+        assert reopened.read_range(RangeAddress("Other Tests", 5, 2, 5, 2)) == [[date]]
+        assert reopened.read_range(RangeAddress("Other Tests", 200, 2, 200, 5)) == [
+            [None, True, None, 1.5]
+        ]
+        assert reopened.read_range(RangeAddress("Other Tests", 1, 30, 1, 30)) == [
+            [" padded "]
+        ]
+        assert reopened.com_calls == 0
+
+        with zipfile.ZipFile(workbook_path) as archive:
+            assert archive.testzip() is None
+            sheet = archive.read("xl/worksheets/sheet1.xml")
+            workbook_xml = archive.read("xl/workbook.xml")
+        # prefixes used in mc:Ignorable are still declared
+        root = sheet[: sheet.index(b">", sheet.index(b"<worksheet"))]
+        assert b"mc:Ignorable" in root and b"xmlns:x14ac=" in root
+        assert b'fullCalcOnLoad="1"' in workbook_xml
+        rows = [int(row.get("r")) for row in ET.fromstring(sheet).iter(xlb._tag("row"))]
+        assert rows == sorted(rows)
+
+    @pytest.mark.skipif(os.name == "nt", reason="POSIX permissions")
+    def test_save_keeps_mode(self, workbook_path, tmp_path, monkeypatch):
+        workbook_path.chmod(0o664)
+        workbook = xlb.OfflineWorkbook(workbook_path)
+        workbook.write_range("Other Tests", 2, 2, [[5]])
+        workbook.save()
+        assert stat.S_IMODE(workbook_path.stat().st_mode) == 0o664
+        monkeypatch.setattr(xlb, "_UMASK", 0o022)
+        workbook.save(tmp_path / "copy.xlsx")
+        assert stat.S_IMODE((tmp_path / "copy.xlsx").stat().st_mode) == 0o644
+
+    def test_save_copy(self, workbook_path, tmp_path):
+        workbook = xlb.OfflineWorkbook(workbook_path)
+        workbook.write_range("Other Tests", 2, 2, [[5]])
+        copy_path = tmp_path / "copy.xlsx"
+        workbook.save(copy_path)
+        assert workbook.path == workbook_path
+        assert xlb.OfflineWorkbook(copy_path).read_range(
+            RangeAddress("Other Tests", 2, 2, 2, 2)
+        ) == [[5]]
+        # the original file is untouched until saved
+        assert xlb.OfflineWorkbook(workbook_path).read_range(
+            RangeAddress("Other Tests", 2, 2, 2, 2)
+        ) == [[4]]
+
+    def test_add_sheet(self, workbook_path):
+        workbook = xlb.OfflineWorkbook(workbook_path)
+        workbook.add_sheet("New Sheet")
+        workbook.write_range("New Sheet", 1, 1, [["a", 1], ["b", 2]])
+        workbook.save()
+
+        reopened = xlb.OfflineWorkbook(workbook_path)
+        assert reopened.read_range(RangeAddress("New Sheet", 1, 1, 2, 2)) == [
+            ["a", 1],
+            ["b", 2],
+        ]
+        # adding an existing sheet clears it
+        reopened.add_sheet("New Sheet")
+        assert reopened.read_range(RangeAddress("New Sheet", 1, 1, 1, 1)) == [[None]]
+        with pytest.raises(ValueError):
+            reopened.add_sheet("bad/name")
+        with pytest.raises(KeyError):
+            reopened.read_range(RangeAddress("No Sheet", 1, 1, 1, 1))
+
+
+class TestOfflineNamedRanges:
+    def test_update_named_ranges(self, workbook_path, monkeypatch):
+        monkeypatch.setattr("builtins.input", lambda _: "y")
+        source = {"Test_Int": 5, "Test_List": [4, [5, 6]], "Test_Str": "new"}
+        undo = xlpnr.update_named_ranges(source, str(workbook_path))
+        assert undo == {
+            "Test_Int": 4,
+            "Test_List": [1, 2, 3],
+            "Test_Str": "Kivo is a dork",
+        }
+
+        values = xlpnr.get_workbook_key_value_pairs(str(workbook_path))
+        assert values["Test_Int"] == 5
+        assert values["Test_List"] == [4, 5, 6]
+        assert values["Test_Str"] == "new"
+        # unchanged names keep their values
+        assert values["Test_Date"] == datetime.datetime(2022, 5, 1)
+
+    def test_dump(self, workbook_path):
+        data = {"k1": 12, "k2": [1, 2, 3]}
+        document = xlpnr.MeasurementDocument("C:\\data\\json_test.json", None, data, [])
+        xlpnr.dump(str(workbook_path), document)
+        xlpnr.dump(str(workbook_path), document)
+
+        workbook = xlb.OfflineWorkbook(workbook_path)
+        assert workbook.read_range(
+            RangeAddress("DATUM json_test.json", 1, 1, 3, 4)
+        ) == xlpnr.build_dump_rows(data)
+
+    def test_backup(self, workbook_path, tmp_path, monkeypatch):
+        entry = xlpnr.backup_workbook(str(workbook_path), tmp_path)
+        store = xlpnr.get_backup_store(tmp_path)
+        assert store.entries() == [entry]
+        restored = store.restore(entry, tmp_path / "restored.xlsx")
+        assert xlpnr.get_workbook_key_value_pairs(
+            str(restored)
+        ) == xlpnr.get_workbook_key_value_pairs(str(workbook_path))
+
+        # an update with backup stores the workbook before it is saved
+        monkeypatch.chdir(tmp_path)
+        monkeypatch.setattr("builtins.input", lambda _: "y")
+        xlpnr.update_named_ranges({"Test_Int": 5}, str(workbook_path), backup=True)
+        assert store.entries() == [entry]  # unchanged file is not stored twice
+        xlpnr.update_named_ranges({"Test_Int": 6}, str(workbook_path), backup=True)
+        assert len(store.entries()) == 2
+
+
+def test_update_many_workbooks(tmp_path):
+    targets = []
+    for name in ["a.xlsx", "b.xlsx"]:
+        shutil.copy(TEST_EXCEL_WB, tmp_path / name)
+        targets.append(tmp_path / name)
+    targets.append(tmp_path / "missing.xlsx")
+
+    source = {"Test_Int": 7, "Test_Vector": [4, 5, 6], "Not_A_Name": 1}
+    summaries = xlpnr.update_many_workbooks(source, targets, processes=2)
+
+    assert [summary.workbook for summary in summaries] == [str(t) for t in targets]
+    for summary in summaries[:2]:
+        assert summary.error is None
+        assert summary.written == ["Test_Int", "Test_Vector"]
+        assert summary.skipped == ["Not_A_Name"]
+        assert summary.seconds > 0
+        values = xlpnr.get_workbook_key_value_pairs(summary.workbook)
+        assert values["Test_Int"] == 7
+        assert values["Test_Vector"] == [4, 5, 6]
+    assert "FileNotFoundError" in summaries[2].error
+    assert summaries[2].skipped == sorted(source)
+
+
+def _fail_worker():
+    raise RuntimeError("no Excel")
+
+
+def test_update_many_workbooks_spawn(tmp_path, monkeypatch):
+    """Spawned workers, as on Windows, import the module after a `cd`
+    away from logging.conf."""
+    shutil.copy(TEST_EXCEL_WB, tmp_path / "a.xlsx")
+    monkeypatch.chdir(tmp_path)
+    spawn = multiprocessing.get_context("spawn")
+    monkeypatch.setattr(
+        xlpnr,
+        "ProcessPoolExecutor",
+        functools.partial(concurrent.futures.ProcessPoolExecutor, mp_context=spawn),
+    )
+    summaries = xlpnr.update_many_workbooks({"Test_Int": 7}, ["a.xlsx"], processes=1)
+    assert summaries[0].error is None
+    assert summaries[0].written == ["Test_Int"]
+
+
+def test_update_many_workbooks_broken_pool(tmp_path, monkeypatch):
+    shutil.copy(TEST_EXCEL_WB, tmp_path / "a.xlsx")
+
+    def _pool(processes, initializer=None):
+        return concurrent.futures.ProcessPoolExecutor(
+            processes, initializer=_fail_worker
+        )
+
+    monkeypatch.setattr(xlpnr, "ProcessPoolExecutor", _pool)
+    targets = [tmp_path / "a.xlsx", tmp_path / "b.xlsx"]
+    summaries = xlpnr.update_many_workbooks({"Test_Int": 7}, targets, processes=1)
+    assert [summary.workbook for summary in summaries] == [str(t) for t in targets]
+    for summary in summaries:
+        assert "BrokenProcessPool" in summary.error
+        assert summary.written == [] and summary.skipped == ["Test_Int"]
+
+
+def test_update_workbook_excel_waits_for_backups(monkeypatch):
+    calls = []
+
+    class MockBook:
+        def save(self):
+            calls.append("save")
+
+        def close(self):
+            calls.append("close")
+
+    books = type(sys)("books")
+    books.open = lambda target: MockBook()
+    monkeypatch.setattr(xlpnr, "_worker_app", type(sys)("app"), False)
+    monkeypatch.setattr(xlpnr._worker_app, "books", books, False)
+    monkeypatch.setattr(
+        xlpnr, "update_named_ranges", lambda source, *args, **kwargs: dict(source)
+    )
+    monkeypatch.setattr(xlpnr, "wait_for_backups", lambda: calls.append("wait"))
+    summary = xlpnr.update_workbook({"Test_Int": 7}, "a.xlsx", True, use_excel=True)
+    assert summary.error is None
+    assert calls == ["wait", "save", "close"]
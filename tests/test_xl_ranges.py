@@ -0,0 +1,113 @@
+import pytest
+
+from datum import xl_ranges as xlr
+
+
+@pytest.mark.parametrize(
+    "letters, index", [("A", 1), ("Z", 26), ("AA", 27), ("AB", 28), ("XFD", 16384)]
+)
+def test_column_conversion(letters, index):
+    assert xlr.column_index(letters) == index
+    assert xlr.column_index(letters.lower()) == index
+    assert xlr.column_letters(index) == letters
+
+
+def test_column_letters_invalid():
+    with pytest.raises(ValueError):
+        xlr.column_letters(0)
+
+
+@pytest.mark.parametrize(
+    "refers_to, address",
+    [
+        ("=Sheet1!$A$1", xlr.RangeAddress("Sheet1", 1, 1, 1, 1)),
+        ("=Sheet1!$A$1:$C$1", xlr.RangeAddress("Sheet1", 1, 1, 1, 3)),
+        ("=Sheet1!B2:D4", xlr.RangeAddress("Sheet1", 2, 2, 4, 4)),
+        ("='My Sheet'!$E$5:$E$7", xlr.RangeAddress("My Sheet", 5, 5, 7, 5)),
+        ("='Blair''s Sheet'!$A$1", xlr.RangeAddress("Blair's Sheet", 1, 1, 1, 1)),
+        ("=Sheet1!$C$3:$A$1", xlr.RangeAddress("Sheet1", 1, 1, 3, 3)),
+        ("=Sheet1!$A$1,Sheet1!$C$3", None),
+        ("=42", None),
+        ("=Sheet1!#REF!", None),
+        ("=SUM(Sheet1!$A$1:$A$3)", None),
+    ],
+)
+def test_parse_refers_to(refers_to, address):
+    assert xlr.parse_refers_to(refers_to) == address
+
+
+def test_range_address():
+    address = xlr.RangeAddress("Sheet1", 2, 3, 4, 5)
+    assert address.shape == (3, 3)
+    assert address.size == 9
+    # cells are counted row by row, like xlwings range[index]
+    assert address.cell(0) == (2, 3)
+    assert address.cell(2) == (2, 5)
+    assert address.cell(3) == (3, 3)
+    assert address.cell(8) == (4, 5)
+
+
+def test_coalesce_cells():
+    # a 2x3 block, a separate single cell, and a row that only
+    # partially overlaps the block columns
+    cells = {
+        (1, 1): "a",
+        (1, 2): "b",
+        (1, 3): "c",
+        (2, 1): "d",
+        (2, 2): "e",
+        (2, 3): "f",
+        (3, 2): "g",
+        (3, 3): "h",
+        (5, 5): "i",
+    }
+    blocks = xlr.coalesce_cells(cells)
+    assert blocks == [
+        xlr.CellBlock(1, 1, [["a", "b", "c"], ["d", "e", "f"]]),
+        xlr.CellBlock(3, 2, [["g", "h"]]),
+        xlr.CellBlock(5, 5, [["i"]]),
+    ]
+    assert blocks[0].last_row == 2
+    assert blocks[0].last_column == 3
+
+    # every cell is covered exactly once
+    covered = [
+        (block.row + r, block.column + c)
+        for block in blocks
+        for r, row in enumerate(block.values)
+        for c, _ in enumerate(row)
+    ]
+    assert sorted(covered) == sorted(cells)
+
+    # gaps are never filled in
+    assert xlr.coalesce_cells({(1, 1): 1, (1, 3): 3}) == [
+        xlr.CellBlock(1, 1, [[1]]),
+        xlr.CellBlock(1, 3, [[3]]),
+    ]
+    assert xlr.coalesce_cells({}) == []
+
+
+def test_range_value():
+    assert xlr.range_value([[1]]) == 1
+    assert xlr.range_value([[None]]) is None
+    assert xlr.range_value([[1, 2, 3]]) == [1, 2, 3]
+    assert xlr.range_value([[1], [2], [3]]) == [1, 2, 3]
+    assert xlr.range_value([[1, 2], [3, 4]]) == [[1, 2], [3, 4]]
+
+
+def test_name_index():
+    name_index = xlr.NameIndex()
+    name_index.add("A", "=Sheet1!$B$2:$D$2")
+    name_index.add("B", "=Sheet1!$C$4")
+    name_index.add("C", "=Sheet2!$A$1")
+    name_index.add("D", "=Sheet1!$A$1,Sheet1!$C$1", source="name object")
+    assert "A" in name_index and "D" in name_index and "E" not in name_index
+    assert len(name_index) == 4
+    assert name_index.unparsed == {"D": "name object"}
+    assert dict(name_index.sheets) == {"Sheet1": ["A", "B"], "Sheet2": ["C"]}
+
+    bounds = name_index.bounds("Sheet1")
+    assert bounds == xlr.RangeAddress("Sheet1", 2, 2, 4, 4)
+    block = [[1, 2, 3], [None, None, None], [None, 4, None]]
+    assert name_index.slice_value("A", block, bounds) == [1, 2, 3]
+    assert name_index.slice_value("B", block, bounds) == 4
@@ -1,4 +1,5 @@
 import datetime
+import json
 import logging
 import os
 from pathlib import Path
@@ -7,6 +8,7 @@ import pytest
 import xlwings as xw
 
 import datum.xl_populate_named_ranges as xlpnr
+from datum import xl_backends as xlb
 
 xlpnr.logger = logging.getLogger("testLogger")
 
@@ -30,7 +32,7 @@ class TestJson:
             ]
         }
 
-    def test_get_json_key_value_pairs(self, caplog, monkeypatch):
+    def test_get_json_key_value_pairs(self, caplog, tmp_path):
         # test valid JSON file
         valid_names = xlpnr.get_json_key_value_pairs(TEST_JSON_FILE)
         assert isinstance(valid_names, dict)
@@ -66,15 +68,57 @@ class TestJson:
         assert 'No "measurement" field' in caplog.text
 
         # test JSON that has measurement with no name or expression
-        monkeypatch.setattr("json.load", self._empty_measurements)
-        assert len(xlpnr.get_json_key_value_pairs(TEST_JSON_FILE)) == 0
+        json_file = tmp_path / "test.json"
+        json_file.write_text(json.dumps(self._empty_measurements(None)))
+        assert len(xlpnr.get_json_key_value_pairs(json_file)) == 0
         assert "is missing name and/or expressions" in caplog.text
 
         # test JSON that has expression with no name, type, or value
-        monkeypatch.setattr("json.load", self._empty_expressions)
-        assert len(xlpnr.get_json_key_value_pairs(TEST_JSON_FILE)) == 0
+        json_file.write_text(json.dumps(self._empty_expressions(None)))
+        assert len(xlpnr.get_json_key_value_pairs(json_file)) == 0
         assert "missing name/type/value fields in" in caplog.text
 
+    def test_iter_json_key_value_pairs(self):
+        with open(TEST_JSON_FILE, "r") as json_handle:
+            json_data = json.load(json_handle)
+        pairs = xlpnr.iter_json_key_value_pairs(TEST_JSON_FILE)
+        assert next(pairs) == ("World_Coordinate_System.WCS.x", 669.0491226844025)
+        assert dict(pairs) == {
+            key: value
+            for measurement in json_data["measurements"]
+            for key, value in xlpnr.measurement_key_value_pairs(measurement)
+            if key != "World_Coordinate_System.WCS.x"
+        }
+        with pytest.raises(json.JSONDecodeError):
+            list(xlpnr.iter_json_key_value_pairs(BROKEN_JSON))
+
+    def test_load_measurement_document(self, caplog, tmp_path):
+        document = xlpnr.load_measurement_document(TEST_JSON_FILE)
+        assert document.pairs == xlpnr.get_json_key_value_pairs(TEST_JSON_FILE)
+        assert document.metadata == xlpnr.load_metadata_from_json(TEST_JSON_FILE)
+        assert document.path == os.path.abspath(TEST_JSON_FILE)
+        assert len(document.measurements) > 0
+
+        # unchanged files are only parsed once
+        json_file = tmp_path / "measurements.json"
+        json_file.write_text(json.dumps(self._empty_expressions(None)))
+        document = xlpnr.load_measurement_document(json_file)
+        assert xlpnr.load_measurement_document(str(json_file)) is document
+        assert document.metadata is None and document.pairs == {}
+        json_file.write_text(json.dumps({"measurements": [], "METADATA": {"a": 1}}))
+        changed = xlpnr.load_measurement_document(json_file)
+        assert changed is not document
+        assert changed.metadata == {"a": 1}
+        assert 'No "measurement" field' in caplog.text
+
+        assert xlpnr.load_measurement_document("DNE.json") is None
+        assert "Unable to open" in caplog.text
+        assert xlpnr.load_measurement_document(BROKEN_JSON) is None
+        assert "is corrupt." in caplog.text
+        json_file.write_text("[1, 2]")
+        assert xlpnr.load_measurement_document(json_file).pairs == {}
+        assert "Not a dictionary." in caplog.text
+
     def test_get_metadata(self, caplog):
         # test non-existant JSON
         assert xlpnr.load_metadata_from_json("NON_EXISTANT_JSON") is None
@@ -153,6 +197,21 @@ class TestUtilities:
         assert xlpnr.report_difference(*dat_int) is None
         assert xlpnr.report_difference(*dat_flt) is None
 
+    def test_report_difference_vectors(self):
+        point = [10.0, 0.0, -5.0]
+        moved = [10.0, 0.5, -5.2]
+        assert xlpnr.report_difference(point, moved) == pytest.approx(0.05)
+        packed = xlpnr.pack_vector(point)
+        assert xlpnr.report_difference(packed, xlpnr.pack_vector(moved)) == (
+            pytest.approx(0.05)
+        )
+        matrix = [[2.0, 0.0], [0.0, 4.0]]
+        assert xlpnr.report_difference(matrix, [[2.0, 0.0], [0.0, 3.0]]) == -0.25
+        assert xlpnr.report_difference(point, [10.0, 0.0]) is None
+        assert xlpnr.report_difference([0.0, 0.0], [1.0, 0.0]) is None
+        assert xlpnr.report_difference(point, 10.0) is None
+        assert xlpnr.report_difference(["a", "b"], ["a", "c"]) is None
+
     def test_print_columns(self):
         column_widths = [42, 15, 15, 15]
         column_headings = ["PARAMETER", "OLD VALUE", "NEW VALUE", "PERCENT CHANGE"]
@@ -210,10 +269,343 @@ class MockWorkbook:
         self.names = [MockXLName(n) for n in names]
 
 
+class MockBatchRange:
+    def __init__(self, sheet, first_cell, last_cell):
+        self.sheet = sheet
+        self.address = (first_cell, last_cell)
+
+    def options(self, ndim):
+        assert ndim == 2
+        return self
+
+    @property
+    def value(self):
+        self.sheet.reads.append(self.address)
+        (first_row, first_col), (last_row, last_col) = self.address
+        return [
+            [self.sheet.cells.get((row, col)) for col in range(first_col, last_col + 1)]
+            for row in range(first_row, last_row + 1)
+        ]
+
+    @value.setter
+    def value(self, new_value):
+        self.sheet.writes.append((self.address, new_value))
+
+
+class MockBatchSheet:
+    def __init__(self, cells=None):
+        self.cells = cells or dict()
+        self.reads = []
+        self.writes = []
+
+    def range(self, first_cell, last_cell=None):
+        return MockBatchRange(self, first_cell, last_cell)
+
+
+class MockSheets(dict):
+    def add(self, name):
+        if name in self:
+            raise ValueError(f"Sheet {name} already exists")
+        self[name] = MockBatchSheet()
+        self[name].delete = lambda: self.pop(name)
+        return self[name]
+
+
+class MockBatchName:
+    def __init__(self, name, refers_to):
+        self.name = name
+        self.refers_to = refers_to
+
+
+class MockNames(dict):
+    """Look up names like a dict, iterate over them like workbook.names"""
+
+    def __iter__(self):
+        return iter(self.values())
+
+
+class MockApp:
+    def __init__(self, calculation="automatic"):
+        self.screen_updating = True
+        self.enable_events = True
+        self.calculation = calculation
+        self.calculations = 0
+
+    def calculate(self):
+        assert self.calculation == "manual"
+        self.calculations += 1
+
+
+class MockBatchWorkbook:
+    def __init__(self, names):
+        self.name = "mock batch"
+        self.fullname = "mock batch.xlsx"
+        self.app = MockApp()
+        self.names = MockNames(
+            {name: MockBatchName(name, ref) for name, ref in names.items()}
+        )
+        self.sheets = {"Sheet1": MockBatchSheet(), "Other Sheet": MockBatchSheet()}
+
+
+class TestBatchWrite:
+    names = {
+        "HOUSING.center_of_mass": "=Sheet1!$A$1:$C$1",
+        "GEARS.center_of_mass": "=Sheet1!$A$2:$C$2",
+        "GEARS.mass": "=Sheet1!$D$2",
+        "HOUSING.mass": "='Other Sheet'!$B$4",
+        "HOUSING.volume": "='Other Sheet'!$B$5:$B$6",
+        "bad_ref": "=Sheet1!#REF!",
+    }
+
+    def test_batch_write(self):
+        workbook = MockBatchWorkbook(self.names)
+        new_values = {
+            "HOUSING.center_of_mass": [1, 2, 3],
+            "GEARS.center_of_mass": [4, [5, 6]],
+            "GEARS.mass": 54.45,
+            "HOUSING.mass": 12.5,
+            "HOUSING.volume": 7,
+        }
+        report = xlpnr.batch_write_named_ranges(workbook, new_values)
+
+        # two vectors and a neighbouring cell merge into one block
+        assert workbook.sheets["Sheet1"].writes == [
+            (((1, 1), (1, 3)), [[1, 2, 3]]),
+            (((2, 1), (2, 4)), [[4, 5, 6, 54.45]]),
+        ]
+        # scalars fill every cell of their range
+        assert workbook.sheets["Other Sheet"].writes == [
+            (((4, 2), (6, 2)), [[12.5], [7], [7]]),
+        ]
+        assert report.ranges == 5
+        assert report.cells == 10
+        assert report.blocks == 3
+        # 2 lookups per name in the workbook, 1 per sheet, 1 per block
+        assert report.com_calls == 2 * 6 + 2 + 3
+        assert report.naive_com_calls == (3 + 3) * 2 + (3 + 1) * 3
+        assert report.com_calls < report.naive_com_calls
+
+    def test_batch_write_errors(self, caplog):
+        workbook = MockBatchWorkbook(self.names)
+        with pytest.raises(KeyError):
+            xlpnr.batch_write_named_ranges(workbook, {"NON-EXISTANT-RANGE": 1})
+        with pytest.raises(TypeError):
+            xlpnr.batch_write_named_ranges(workbook, {"bad_ref": 1})
+
+        # nothing is written if any value is invalid
+        with pytest.raises(TypeError):
+            xlpnr.batch_write_named_ranges(
+                workbook, {"GEARS.mass": 1, "HOUSING.mass": MockXLName("test")}
+            )
+        with pytest.raises(TypeError):
+            xlpnr.batch_write_named_ranges(
+                workbook, {"GEARS.mass": 1, "HOUSING.volume": [1, {2: "two"}]}
+            )
+        assert workbook.sheets["Sheet1"].writes == []
+
+        # truncation and oversize ranges are reported as for write_named_range
+        xlpnr.batch_write_named_ranges(workbook, {"GEARS.mass": [1, 2]})
+        assert "Vector of length 2 will be truncated." in caplog.text
+        xlpnr.batch_write_named_ranges(workbook, {"HOUSING.volume": [1]})
+        assert "larger than required." in caplog.text
+        assert workbook.sheets["Other Sheet"].writes == [(((5, 2), (5, 2)), [[1]])]
+
+    def test_batch_write_fallback(self):
+        workbook = MockBatchWorkbook({"multi_area": "=Sheet1!$A$1,Sheet1!$C$1"})
+        workbook.names["multi_area"].refers_to_range = MockXLRange("multi_area", None)
+        report = xlpnr.batch_write_named_ranges(workbook, {"multi_area": [1, [2]]})
+        assert workbook.names["multi_area"].refers_to_range.value == [1, 2]
+        assert workbook.sheets["Sheet1"].writes == []
+        assert report.naive_com_calls == 5
+        assert report.com_calls == 2 + 1
+
+        with pytest.raises(TypeError):
+            xlpnr.batch_write_named_ranges(workbook, {"multi_area": {1: 2}})
+
+    def test_batch_write_with_index(self):
+        workbook = MockBatchWorkbook(self.names)
+        name_index = xlpnr.build_name_index(workbook)
+        # names are resolved from the index only
+        workbook.names = None
+        new_values = {"GEARS.mass": 54.45, "HOUSING.mass": 12.5}
+        report = xlpnr.batch_write_named_ranges(workbook, new_values, name_index)
+        assert workbook.sheets["Sheet1"].writes == [(((2, 4), (2, 4)), [[54.45]])]
+        assert report.com_calls == 2 + 2
+
+        with pytest.raises(KeyError):
+            xlpnr.batch_write_named_ranges(workbook, {"NON-EXISTANT": 1}, name_index)
+        with pytest.raises(TypeError):
+            xlpnr.batch_write_named_ranges(workbook, {"bad_ref": 1}, name_index)
+
+
+class TestSuspendUpdates:
+    def test_suspend_updates(self):
+        workbook = MockBatchWorkbook({})
+        backend = xlb.XlwingsWorkbook(workbook)
+        with backend.suspend_updates() as recalculation:
+            assert workbook.app.screen_updating is False
+            assert workbook.app.enable_events is False
+            assert workbook.app.calculation == "manual"
+            # nested contexts leave the state to the outer one
+            with backend.suspend_updates():
+                pass
+            assert workbook.app.calculation == "manual"
+            assert workbook.app.calculations == 0
+        assert workbook.app.calculations == 1
+        assert recalculation.seconds >= 0
+        assert workbook.app.screen_updating is True
+        assert workbook.app.enable_events is True
+        assert workbook.app.calculation == "automatic"
+
+    def test_suspend_updates_error(self):
+        workbook = MockBatchWorkbook({})
+        workbook.app = MockApp("semiautomatic")
+        with pytest.raises(ValueError):
+            with xlb.XlwingsWorkbook(workbook).suspend_updates():
+                raise ValueError("write failed")
+        assert workbook.app.calculations == 0
+        assert workbook.app.calculation == "semiautomatic"
+        assert workbook.app.screen_updating is True
+
+    def test_suspend_updates_manual(self):
+        workbook = MockBatchWorkbook({})
+        workbook.app = MockApp("manual")
+        with xlb.XlwingsWorkbook(workbook).suspend_updates() as recalculation:
+            pass
+        assert workbook.app.calculations == 0
+        assert recalculation.seconds == 0
+
+    def test_write_named_ranges_suspended(self, monkeypatch):
+        workbook = MockBatchWorkbook(TestBatchWrite.names)
+        monkeypatch.setattr("builtins.input", lambda _: "y")
+        monkeypatch.setattr(xlpnr, "preview_named_range_update", lambda *_: None)
+        report = xlpnr.write_named_ranges(
+            {"GEARS.mass": 1}, {"GEARS.mass": 2}, workbook, "test"
+        )
+        assert workbook.sheets["Sheet1"].writes == [(((2, 4), (2, 4)), [[2]])]
+        assert workbook.app.calculations == 1
+        assert workbook.app.calculation == "automatic"
+        assert report.recalc_seconds >= 0
+        assert report.write_seconds > 0
+
+
+class TestNameIndex:
+    names = {
+        "_xlfn.mockfun": "=Sheet1!$Z$1",
+        "Test_Int": "=Sheet1!$B$2",
+        "Test_List": "=Sheet1!$B$3:$D$3",
+        "Test_Vector": "=Sheet1!$F$2:$F$4",
+        "Test_Matrix": "=Sheet1!$B$5:$C$6",
+        "Empty_Range": "=Sheet1!$H$8",
+        "Other_Sheet": "='Other Sheet'!$A$1",
+        "Constant": "=42",
+        "bad_ref": "=Sheet1!#REF!",
+    }
+    cells = {
+        (2, 2): 4,
+        (3, 2): 1,
+        (3, 3): 2,
+        (3, 4): 3,
+        (2, 6): 1.5,
+        (3, 6): 2.5,
+        (4, 6): 3.5,
+        (5, 2): 1,
+        (5, 3): 2,
+        (6, 2): 3,
+        (6, 3): 4,
+    }
+
+    def _workbook(self):
+        workbook = MockBatchWorkbook(self.names)
+        workbook.sheets["Sheet1"].cells = self.cells
+        workbook.sheets["Other Sheet"].cells = {(1, 1): "other"}
+        workbook.names["Constant"].refers_to_range = MockXLRange("Constant", 42)
+        return workbook
+
+    def test_build_name_index(self, caplog):
+        name_index = xlpnr.build_name_index(self._workbook())
+        assert "_xlfn.mockfun" not in name_index
+        assert "Skipping range _xlfn.mockfun" in caplog.text
+        assert "#REF! error" in caplog.text
+        assert "bad_ref" in name_index.broken
+        assert list(name_index.unparsed) == ["Constant"]
+        assert len(name_index) == 8
+        assert name_index.sheets["Other Sheet"] == ["Other_Sheet"]
+        assert name_index.addresses["Test_Matrix"].shape == (2, 2)
+        assert name_index.bounds("Sheet1") == ("Sheet1", 2, 2, 8, 8)
+
+    def test_get_workbook_kvp_bulk(self):
+        workbook = self._workbook()
+        values = xlpnr.get_workbook_key_value_pairs(workbook)
+        assert values == {
+            "Test_Int": 4,
+            "Test_List": [1, 2, 3],
+            "Test_Vector": [1.5, 2.5, 3.5],
+            "Test_Matrix": [[1, 2], [3, 4]],
+            "Empty_Range": None,
+            "Other_Sheet": "other",
+            "Constant": 42,
+        }
+        # one read of the bounding range per sheet
+        assert workbook.sheets["Sheet1"].reads == [((2, 2), (8, 8))]
+        assert workbook.sheets["Other Sheet"].reads == [((1, 1), (1, 1))]
+
+    def test_get_workbook_kvp_spread_out(self, monkeypatch):
+        monkeypatch.setattr(xlpnr, "BULK_READ_MAX_CELLS", 10)
+        workbook = self._workbook()
+        values = xlpnr.get_workbook_key_value_pairs(workbook)
+        assert values["Test_Matrix"] == [[1, 2], [3, 4]]
+        assert values["Test_List"] == [1, 2, 3]
+        assert len(workbook.sheets["Sheet1"].reads) == 5
+
+
+class TestDump:
+    data = {"k2": 3, "k1": 12, "k4": [4, [3, 2]]}
+
+    def test_build_dump_rows(self):
+        rows = xlpnr.build_dump_rows(self.data, {"part_name": "HOUSING"})
+        assert rows == [
+            ["part_name", "HOUSING", None, None],
+            [None, None, None, None],
+            ["PARAMETER", "VALUE", None, None],
+            ["k1", 12, None, None],
+            ["k2", 3, None, None],
+            ["k4", 4, 3, 2],
+        ]
+        rows = xlpnr.build_dump_rows({"k1": 12})
+        assert rows == [["PARAMETER", "VALUE"], ["k1", 12]]
+
+    def test_dump_single_write(self):
+        document = xlpnr.MeasurementDocument("json_test.json", None, self.data, [])
+        workbook = MockBatchWorkbook({})
+        workbook.sheets = MockSheets()
+        xlpnr.dump(workbook, document)
+        # sheet is replaced on a second dump
+        xlpnr.dump(workbook, document)
+        assert workbook.sheets["DATUM json_test.json"].writes == [
+            (((1, 1), (4, 4)), xlpnr.build_dump_rows(self.data))
+        ]
+
+    def test_dump_chunked(self, monkeypatch):
+        data = {f"k{index:03d}": index for index in range(25)}
+        document = xlpnr.MeasurementDocument("json_test.json", None, data, [])
+        monkeypatch.setattr(xlpnr, "DUMP_CHUNK_ROWS", 10)
+        workbook = MockBatchWorkbook({})
+        workbook.sheets = MockSheets()
+        xlpnr.dump(workbook, document)
+        writes = workbook.sheets["DATUM json_test.json"].writes
+        assert [address for address, _ in writes] == [
+            ((1, 1), (10, 2)),
+            ((11, 1), (20, 2)),
+            ((21, 1), (26, 2)),
+        ]
+        assert sum([rows for _, rows in writes], []) == xlpnr.build_dump_rows(data)
+
+
 class TestXL:
     mock_source_dict = {"k1": 12, "k2": 3, "k4": [4, 3, 2]}
 
-    def _mock_target_dict(self, arg):
+    def _mock_target_dict(self, *args):
         return {"k1": 15, "k3": 9, "k4": [1, 2, 3]}
 
     @classmethod
@@ -242,38 +634,30 @@ class TestXL:
         # isn't needed. Close it prior to tests
         self.app.books[0].close()
 
-    def test_backup(self):
-        backup_path = Path(TEST_EXCEL_WB.replace(".", "_BACKUP."))
-        if os.path.isfile(backup_path):
-            os.remove(backup_path)
-        backup_wb = xlpnr.backup_workbook(self.workbook, backup_dir="tests\\xl")
-        assert os.path.isfile(backup_wb)
-        assert backup_path == backup_wb
-        os.remove(backup_path)
+    def test_backup(self, tmp_path):
+        entry = xlpnr.backup_workbook(self.workbook, backup_dir=tmp_path)
+        assert entry.workbook == self.workbook.name
+        assert xlpnr.get_backup_store(tmp_path).entries() == [entry]
 
     def test_dump(self, monkeypatch, caplog):
         # test dumping with bad JSON file
-        monkeypatch.setattr(xlpnr, "get_json_key_value_pairs", lambda _: None)
+        monkeypatch.setattr(xlpnr, "load_measurement_document", lambda _: None)
         xlpnr.dump(self.workbook, "json_test.json")
         sheet_name = "DATUM json_test.json"
         assert "No key-value pairs in JSON file to dump." in caplog.text
 
         # test dumping with JSON file, no metadata
-        monkeypatch.setattr(xlpnr, "load_metadata_from_json", lambda _: None)
-        monkeypatch.setattr(
-            xlpnr, "get_json_key_value_pairs", lambda _: self.mock_source_dict
+        document = xlpnr.MeasurementDocument(
+            "json_test.json", None, self.mock_source_dict, []
         )
-        xlpnr.dump(self.workbook, "json_test.json")
+        xlpnr.dump(self.workbook, document)
         assert self.workbook.sheets[sheet_name].range("A1:B1").value == [
             "PARAMETER",
             "VALUE",
         ]
 
         # test dumping with good JSON file
-        monkeypatch.setattr(
-            xlpnr, "load_metadata_from_json", lambda _: {"test": "datum"}
-        )
-        xlpnr.dump(self.workbook, "json_test.json")
+        xlpnr.dump(self.workbook, document._replace(metadata={"test": "datum"}))
         assert self.workbook.sheets[sheet_name].range("A1:B1").value == [
             "test",
             "datum",
@@ -330,7 +714,6 @@ class TestXL:
 
     def test_update_named_ranges(self, monkeypatch, capsys):
 
-        monkeypatch.setattr(xlpnr, "load_metadata_from_json", lambda _: None)
         # Test for source dict as argument
         monkeypatch.setattr(
             xlpnr, "get_workbook_key_value_pairs", self._mock_target_dict
@@ -340,14 +723,14 @@ class TestXL:
         assert sorted(list(unr_ret.keys())) == ["k1", "k4"]
         assert unr_ret["k1"] == 15
 
-        # Test for get_json_key_value_pairs to return None when given a string
-        monkeypatch.setattr(xlpnr, "get_json_key_value_pairs", lambda _: None)
+        # Test for load_measurement_document to return None when given a string
+        monkeypatch.setattr(xlpnr, "load_measurement_document", lambda _: None)
         assert xlpnr.update_named_ranges(self.json_file, self.workbook) is None
         captured = capsys.readouterr()
         assert "No measurement data found in JSON file." in captured.out
 
         # Test for get_workbook_key_value pairs returns none
-        monkeypatch.setattr(xlpnr, "get_workbook_key_value_pairs", lambda _: None)
+        monkeypatch.setattr(xlpnr, "get_workbook_key_value_pairs", lambda *_: None)
         assert xlpnr.update_named_ranges(self.json_file, self.workbook) is None
         captured = capsys.readouterr()
         assert "No named ranges in Excel file." in captured.out
@@ -358,6 +741,7 @@ class TestXL:
             "preview_named_range_update",
             "backup_workbook",
             "write_named_range",
+            "batch_write_named_ranges",
         ]:
             monkeypatch.setattr(xlpnr, function, lambda *_: None)
 